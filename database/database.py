@@ -1,4 +1,5 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 
@@ -39,8 +40,62 @@ def init_db():
     # antes de que create_all sea llamado.
     from . import models # models.py debe existir y definir los modelos que heredan de Base.
     Base.metadata.create_all(bind=engine)
+    agregar_columnas_faltantes()
+    agregar_indices_faltantes()
     print("Tablas de base de datos verificadas/creadas.")
 
+# Columnas añadidas a tablas que ya existían en bases creadas con versiones anteriores.
+# create_all solo crea tablas nuevas, nunca altera las existentes; estas columnas se agregan con
+# ALTER TABLE ... ADD COLUMN (deben ser nullable o tener default en el servidor).
+COLUMNAS_AGREGADAS = {
+    'predicciones': ['explicacion', 'version_modelo', 'calidad_datos'],
+}
+
+def agregar_columnas_faltantes():
+    """
+    Agrega las columnas de COLUMNAS_AGREGADAS que falten en tablas existentes. Es idempotente:
+    las columnas ya presentes se omiten. El tipo se toma del modelo y se compila para el motor en uso.
+    """
+    inspector = inspect(engine)
+    tablas_existentes = set(inspector.get_table_names())
+    with engine.begin() as conexion:
+        for nombre_tabla, columnas in COLUMNAS_AGREGADAS.items():
+            if nombre_tabla not in tablas_existentes:
+                continue
+            presentes = {columna['name'] for columna in inspector.get_columns(nombre_tabla)}
+            tabla = Base.metadata.tables[nombre_tabla]
+            for nombre_columna in columnas:
+                if nombre_columna in presentes:
+                    continue
+                tipo = tabla.c[nombre_columna].type.compile(dialect=engine.dialect)
+                conexion.execute(text(f"ALTER TABLE {nombre_tabla} ADD COLUMN {nombre_columna} {tipo}"))
+                print(f"Columna agregada: {nombre_tabla}.{nombre_columna} ({tipo})")
+
+# Índices (con nombre, definidos en el modelo) añadidos a tablas que ya existían; create_all tampoco los crea.
+INDICES_AGREGADOS = {
+    'estaciones': ['uq_estaciones_nombre'],
+}
+
+def agregar_indices_faltantes():
+    """
+    Crea los índices de INDICES_AGREGADOS que falten en tablas existentes (idempotente). Si un índice único
+    no se puede crear porque ya hay filas duplicadas, se informa y se continúa sin él.
+    """
+    inspector = inspect(engine)
+    tablas_existentes = set(inspector.get_table_names())
+    for nombre_tabla, nombres_indices in INDICES_AGREGADOS.items():
+        if nombre_tabla not in tablas_existentes:
+            continue
+        presentes = {indice['name'] for indice in inspector.get_indexes(nombre_tabla)}
+        for indice in Base.metadata.tables[nombre_tabla].indexes:
+            if indice.name not in nombres_indices or indice.name in presentes:
+                continue
+            try:
+                indice.create(bind=engine)
+                print(f"Índice agregado: {nombre_tabla}.{indice.name}")
+            except IntegrityError as e:
+                print(f"No se pudo crear el índice único {nombre_tabla}.{indice.name}; hay filas duplicadas que corregir: {e}")
+
 def get_db() -> Session:
     """
     Generador para obtener una sesión de base de datos.
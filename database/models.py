@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Enum
+from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Date, Boolean, Enum, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import datetime
@@ -41,11 +41,87 @@ class Prediccion(Base):
 
     # Otros datos que podrían ser útiles
     parametros_entrada = Column(String, nullable=True) # JSON string de los parámetros usados para la predicción
+    explicacion = Column(String, nullable=True) # JSON compacto: nodos del camino de decisión ('n'), valor base ('b') y contribuciones ('c')
+    version_modelo = Column(String, nullable=True) # Modelo usado (nombre del .pkl sin extensión), según el registro de estaciones
+    calidad_datos = Column(Integer, nullable=True) # Máscara de bits del control de calidad de la hora usada (0 = sin observaciones; ver src/calidad_datos.py)
     fuente_datos_entrada = Column(String, nullable=True) # De dónde se obtuvieron los datos para predecir
 
     def __repr__(self):
         return f"<Prediccion(id={self.id}, fecha_prediccion_para='{self.fecha_prediccion_para}', resultado='{self.resultado}')>"
 
+# Registro de estaciones: coordenadas, altitud, zona horaria y versión de modelo asignada a cada una
+class Estacion(Base):
+    __tablename__ = "estaciones"
+    # El nombre es la clave de la estación en predicciones, alertas y eventos (Prediccion.ubicacion): debe ser único
+    __table_args__ = (Index('uq_estaciones_nombre', 'nombre', unique=True),)
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    codigo = Column(String, unique=True, index=True, nullable=False) # Identificador corto usado en la API (?estacion=)
+    nombre = Column(String, nullable=False) # Se guarda como Prediccion.ubicacion
+    latitud = Column(Float, nullable=False)
+    longitud = Column(Float, nullable=False)
+    altitud_m = Column(Float, nullable=True) # Si se conoce, Open-Meteo la usa para corregir por altura
+    zona_horaria = Column(String, nullable=False, default="America/Lima") # Nombre IANA
+    version_modelo = Column(String, nullable=False, default="modelo_arbol_decision") # Archivo en modelos_entrenados/ sin '.pkl'
+    activa = Column(Boolean, default=True, nullable=False)
+    fecha_creacion = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<Estacion(codigo='{self.codigo}', nombre='{self.nombre}', version_modelo='{self.version_modelo}')>"
+
+# Suscripciones a alertas de helada por estación e intensidad mínima
+class SuscripcionAlerta(Base):
+    __tablename__ = "suscripciones_alerta"
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    estacion = Column(String, index=True, nullable=False) # Igual a Prediccion.ubicacion
+    intensidad_minima = Column(Enum(IntensidadHelada), default=IntensidadHelada.fuerte, nullable=False)
+    canal = Column(String, nullable=False) # 'webhook', 'smtp', 'sms' o 'memoria'
+    destino = Column(String, nullable=False) # URL, correo o teléfono según el canal
+    activa = Column(Boolean, default=True, nullable=False)
+    fecha_creacion = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<SuscripcionAlerta(id={self.id}, estacion='{self.estacion}', canal='{self.canal}', intensidad_minima='{self.intensidad_minima}')>"
+
+# Alertas ya emitidas: una por (estación, noche, intensidad), lo que deduplica los envíos sin impedir
+# que un pronóstico más severo para la misma noche (p. ej. de leve a fuerte) se alerte como escalamiento
+class AlertaEmitida(Base):
+    __tablename__ = "alertas_emitidas"
+    __table_args__ = (UniqueConstraint('estacion', 'noche', 'intensidad', name='uq_alerta_estacion_noche_intensidad'),)
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    estacion = Column(String, nullable=False)
+    noche = Column(Date, nullable=False) # Fecha de la madrugada alertada
+    prediccion_id = Column(Integer, ForeignKey("predicciones.id"), nullable=True)
+    intensidad = Column(Enum(IntensidadHelada), nullable=True)
+    destinatarios = Column(Integer, default=0)
+    fecha_emision = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<AlertaEmitida(estacion='{self.estacion}', noche='{self.noche}', destinatarios={self.destinatarios})>"
+
+# Agregado diario de predicciones por (día, estación, intensidad), mantenido al insertar cada Prediccion.
+# Guarda sumas y conteos (no promedios) para poder sumarlo de nuevo por mes o año sin leer 'predicciones'.
+class ResumenDiarioPrediccion(Base):
+    __tablename__ = "resumen_diario_predicciones"
+    __table_args__ = (UniqueConstraint('dia', 'estacion', 'intensidad', name='uq_resumen_dia_estacion_intensidad'),)
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    dia = Column(Date, nullable=False, index=True) # Día de fecha_prediccion_para
+    anio = Column(Integer, nullable=False, index=True) # Año y mes explícitos: agrupar por mes sin funciones de fecha propias de cada motor
+    mes = Column(Integer, nullable=False)
+    estacion = Column(String, nullable=False) # Prediccion.ubicacion
+    intensidad = Column(Enum(IntensidadHelada), nullable=False)
+    n_predicciones = Column(Integer, default=0, nullable=False)
+    n_probables = Column(Integer, default=0, nullable=False) # Predicciones con resultado 'Probable'
+    n_con_probabilidad = Column(Integer, default=0, nullable=False)
+    suma_probabilidad = Column(Float, default=0.0, nullable=False)
+    suma_duracion_horas = Column(Float, default=0.0, nullable=False)
+
+    def __repr__(self):
+        return f"<ResumenDiarioPrediccion(dia='{self.dia}', estacion='{self.estacion}', intensidad='{self.intensidad}', n={self.n_predicciones})>"
+
 # La creación de tablas, SessionLocal y get_db se manejan en database.py.
 # El bloque if __name__ == "__main__": en database.py se encarga de la inicialización
 # si se ejecuta ese script directamente.
@@ -1,18 +1,42 @@
 # coding: utf-8
-from flask import Flask, render_template, jsonify, request, redirect, url_for
+"""
+Aplicación web de predicción de heladas.
+
+create_app() construye la aplicación (fábrica de Flask). El arranque es liviano: pandas, scikit-learn,
+requests y los módulos de pronóstico se importan dentro de las rutas que los usan, y el modelo se
+carga en un hilo en segundo plano (ver src/servicio_modelo.py). /salud/vivo y /salud/listo sirven
+como sondas de liveness y readiness. Uso con un servidor WSGI: gunicorn "main:create_app()".
+
+El canal /eventos/predicciones mantiene cada conexión abierta. En producción se recomienda un trabajador
+asíncrono (gunicorn -k gevent "main:create_app()"). Con hilos (gunicorn --threads N) hay que definir
+HILOS_WSGI=N: los flujos pueden ocupar como máximo la mitad de los hilos (ver src/difusion.py).
+"""
+from flask import Flask, Blueprint, current_app, render_template, jsonify, request, Response
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 import datetime
+import hmac
 import json
 import os
-import joblib
-import pandas as pd
+import threading
+import time
 import logging
-import database # Importamos el módulo para acceder a setup_database_engine
 
-# --- Importaciones de módulos del proyecto (desde src) ---
-from database.database import init_db, get_db, setup_database_engine # Añadido setup_database_engine
-from database.models import Prediccion, IntensidadHelada, ResultadoPrediccion
-from src.data_fetcher import obtener_datos_meteorologicos_openmeteo # FETCHED_COLUMNAS_MODELO será COLUMNAS_FEATURES_PREDICCION
+# --- Importaciones de módulos del proyecto (livianas; las pesadas se importan donde se usan) ---
+import database.database as base_datos
+from database.database import init_db, get_db, setup_database_engine
+from database.models import Prediccion, IntensidadHelada, ResultadoPrediccion, SuscripcionAlerta, Estacion
+from src.difusion import (DURACION_MAXIMA_FLUJO_SEGUNDOS, DifusorPredicciones, LimiteConexionesAlcanzado, TODAS_LAS_ESTACIONES,
+                          limite_conexiones, trabajador_asincrono)
+from src.cache_respuestas import (CacheRespuestas, EntradaCache, a_json_bytes, a_csv_bytes, respuesta_json,
+                                  responder_desde_cache, comprimir_respuesta, invalidar_al_insertar)
+from src.analitica import (AGRUPACIONES_VALIDAS, FUENTE_RESUMEN, consultar_resumen, inicializar_resumen_diario,
+                           registrar_mantenimiento_resumen)
+from src.servicio_modelo import CatalogoModelos
+from src.registro_estaciones import (ESTACION_PREDETERMINADA, RegistroEstaciones, sembrar_estaciones,
+                                     validar_datos_estacion)
+from src.reloj import RelojSistema
 
 # --- Configuración de Logging ---
 logging.basicConfig(level=logging.INFO)
@@ -20,65 +44,79 @@ logger = logging.getLogger(__name__) # Logger para este archivo main.py
 app_logger = logging.getLogger('werkzeug') # Logger de Flask/Werkzeug
 app_logger.setLevel(logging.INFO)
 
-# --- Configuración de la Aplicación Flask ---
-app = Flask(__name__,
-            instance_relative_config=True,  # Para que instance_path funcione como se espera
-            template_folder='interfaz_usuario',
-            static_folder='static')
-
-# Configuración de la base de datos usando instance_path
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-key968') # Buena práctica añadir una Secret Key
-try:
-    os.makedirs(app.instance_path, exist_ok=True) # Crea el directorio instance si no existe
-except OSError as e:
-    app.logger.error(f"Error creando el directorio de instancia {app.instance_path}: {e}")
-    # Considerar si la app debe detenerse aquí o continuar si la creación falla.
-
-default_sqlite_uri = f"sqlite:///{os.path.join(app.instance_path, 'predicciones.db')}"
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', default_sqlite_uri)
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.logger.info(f"Usando DATABASE_URL: {app.config['SQLALCHEMY_DATABASE_URI']}")
-
-# --- Carga del Modelo de Predicción y Constantes ---
+INSTANTE_IMPORTACION = time.monotonic() # Para informar el tiempo desde el arranque del proceso en /salud/vivo
+
+# --- Constantes del Modelo de Predicción ---
 # main.py está en la raíz.
 RUTA_MODELOS_ENTRENADOS = "modelos_entrenados/" # Relativo a la raíz
-NOMBRE_MODELO_PREDICCION_PKL = "modelo_arbol_decision.pkl"
-COLUMNAS_FEATURES_PREDICCION = ['Temperatura', 'HumedadRelativa', 'PresionAtmosferica', 'HumedadSuelo']
-
-prediction_model = None
-# Solo cargar modelo y configurar DB en el proceso principal de Werkzeug o cuando no se usa el reloader
-if os.environ.get("WERKZEUG_RUN_MAIN") == "true" or not app.debug:
-    try:
-        ruta_modelo_pkl = os.path.join(RUTA_MODELOS_ENTRENADOS, NOMBRE_MODELO_PREDICCION_PKL)
-        if os.path.exists(ruta_modelo_pkl):
-            prediction_model = joblib.load(ruta_modelo_pkl)
-            logger.info(f"Modelo de predicción cargado exitosamente desde: {ruta_modelo_pkl}")
-        else:
-            logger.error(f"Error crítico: No se encontró el modelo de predicción en la ruta especificada: {ruta_modelo_pkl}.")
-            logger.warning("La funcionalidad de predicción NO estará disponible.")
-    except Exception as e:
-        logger.error(f"Error crítico al cargar el modelo de predicción desde {ruta_modelo_pkl}: {e}", exc_info=True)
-        prediction_model = None
+VERSION_MODELO_PREDETERMINADA = "modelo_arbol_decision" # modelos_entrenados/modelo_arbol_decision.pkl
+ESTACION_PRONOSTICO_AUTOMATICO = ESTACION_PREDETERMINADA['codigo'] # Estación por defecto de /pronostico_automatico
+# Si ya existe un pronóstico para la misma madrugada registrado hace menos de estos minutos, se reutiliza
+# en lugar de recalcularlo (p. ej. varias pestañas abiertas pulsando el botón). ?forzar=true lo recalcula.
+MINUTOS_REUTILIZAR_PRONOSTICO = int(os.environ.get('MINUTOS_REUTILIZAR_PRONOSTICO', 30))
+# Espera máxima de una petición por el modelo mientras termina de cargarse en segundo plano
+SEGUNDOS_ESPERA_MODELO = float(os.environ.get('SEGUNDOS_ESPERA_MODELO', 10))
+
+rutas = Blueprint('prediccion', __name__)
+
+# Modelos por versión (con su explicador y estadísticas de entrenamiento); se cargan en segundo plano
+catalogo_modelos = CatalogoModelos(RUTA_MODELOS_ENTRENADOS, VERSION_MODELO_PREDETERMINADA)
+
+# Registro de estaciones (tabla 'estaciones') con caché en memoria
+registro_estaciones = RegistroEstaciones(lambda: next(get_db()))
+
+# Difusor en proceso de nuevas predicciones hacia los navegadores (Server-Sent Events)
+difusor_predicciones = DifusorPredicciones()
+
+# Caché de respuestas serializadas (/registros, /obtener_prediccion_actual), vaciada al confirmarse una nueva Prediccion
+cache_respuestas = CacheRespuestas()
+invalidar_al_insertar(cache_respuestas, Prediccion)
+# Cada INSERT en 'predicciones' suma su aporte al resumen diario (tabla resumen_diario_predicciones)
+registrar_mantenimiento_resumen()
+
+# --- Despachador de alertas (hilo asyncio propio); se construye al usarlo por primera vez ---
+_despachador_alertas = None
+_candado_despachador = threading.Lock()
+
+def configurar_despachador_alertas():
+    from src.alertas import DespachadorAlertas, CanalWebhook, CanalSMTP, CanalSMS, CanalMemoria
+    canales = [CanalWebhook()]
+    if os.environ.get('ALERTAS_SMTP_HOST'):
+        canales.append(CanalSMTP(
+            host=os.environ['ALERTAS_SMTP_HOST'],
+            puerto=int(os.environ.get('ALERTAS_SMTP_PUERTO', 587)),
+            usuario=os.environ.get('ALERTAS_SMTP_USUARIO'),
+            clave=os.environ.get('ALERTAS_SMTP_CLAVE'),
+            remitente=os.environ.get('ALERTAS_SMTP_REMITENTE'),
+        ))
+    if os.environ.get('ALERTAS_SMS_URL'):
+        canales.append(CanalSMS(url_pasarela=os.environ['ALERTAS_SMS_URL'], token=os.environ.get('ALERTAS_SMS_TOKEN')))
+    if os.environ.get('ALERTAS_CANAL_MEMORIA', 'false').lower() == 'true': # Canal local para pruebas
+        canales.append(CanalMemoria())
+    return DespachadorAlertas(canales)
+
+def obtener_despachador_alertas():
+    global _despachador_alertas
+    with _candado_despachador:
+        if _despachador_alertas is None:
+            _despachador_alertas = configurar_despachador_alertas()
+        return _despachador_alertas
+
+def _modelo_o_error(version=None):
+    """Modelo listo para predecir, o (None, respuesta de error) si sigue cargando o no está disponible."""
+    servicio = catalogo_modelos.servicio(version)
+    modelo = servicio.obtener(timeout=SEGUNDOS_ESPERA_MODELO)
+    if modelo is not None:
+        return modelo, None
+    if servicio.cargando:
+        respuesta = jsonify({"error": "El modelo de predicción se está cargando. Reintentar en unos segundos."})
+        respuesta.headers['Retry-After'] = '5'
+        return None, (respuesta, 503)
+    logger.error("Se solicitó una predicción pero el modelo no está cargado.")
+    return None, (jsonify({"error": "Modelo de predicción no disponible."}), 500)
 
 # --- Funciones Auxiliares (movidas desde el antiguo app.py) ---
-def estimar_humedad_suelo_volumetrica(humedad_relativa_percent, precipitacion_mm):
-    """
-    Estima la humedad volumétrica del suelo (m³/m³) basada en la humedad relativa y la precipitación.
-    Esta es una aproximación heurística y los coeficientes/escalas pueden necesitar ajuste.
-    """
-    if pd.isna(humedad_relativa_percent) or pd.isna(precipitacion_mm):
-        logger.warning("Datos de humedad relativa o precipitación faltantes para estimar humedad del suelo. Retornando NA.")
-        return pd.NA
-
-    # Fórmula base propuesta por el usuario, con ponderaciones
-    raw_score = (humedad_relativa_percent * 0.6) + (precipitacion_mm * 1.2)
-
-    estimated_sm_volumetric = raw_score / 200.0
-    capped_sm_volumetric = min(0.55, max(0.05, estimated_sm_volumetric))
-    
-    logger.info(f"HumedadSuelo estimada: HR={humedad_relativa_percent}%, Precip={precipitacion_mm}mm -> Raw={raw_score:.2f} -> Scaled={estimated_sm_volumetric:.3f} -> Capped={capped_sm_volumetric:.3f} m³/m³")
-    return capped_sm_volumetric
-
+# La estimación de HumedadSuelo ahora es parte de la imputación de src/especificacion_features.py.
 def determinar_estado_helada(prediccion_valor, probabilidad_helada, temperatura_actual_o_prevista):
     resultado_pred = ResultadoPrediccion.poco_probable
     intensidad_pred = IntensidadHelada.no_helada
@@ -97,208 +135,317 @@ def determinar_estado_helada(prediccion_valor, probabilidad_helada, temperatura_
             duracion_horas = 1.0
     return resultado_pred, intensidad_pred, duracion_horas
 
+# Campos públicos de una predicción: (clave en la respuesta, columna). Las fechas y enums los convierte a_json_bytes.
+CAMPOS_PREDICCION_ACTUAL = (
+    ("id", Prediccion.id),
+    ("fecha_prediccion_para", Prediccion.fecha_prediccion_para),
+    ("ubicacion", Prediccion.ubicacion),
+    ("estacion_meteorologica", Prediccion.estacion_meteorologica),
+    ("temperatura_pronosticada", Prediccion.temperatura_minima_prevista), # Renombrado para claridad
+    ("probabilidad_helada", Prediccion.probabilidad_helada),
+    ("resultado", Prediccion.resultado),
+    ("intensidad", Prediccion.intensidad),
+    ("duracion_estimada_horas", Prediccion.duracion_estimada_horas),
+    ("calidad_datos", Prediccion.calidad_datos), # Máscara de bits; ver src/calidad_datos.py
+)
+CAMPOS_REGISTRO = (
+    ("id", Prediccion.id),
+    ("fecha_registro", Prediccion.fecha_registro),
+    ("fecha_prediccion_para", Prediccion.fecha_prediccion_para),
+    ("ubicacion", Prediccion.ubicacion),
+    ("estacion_meteorologica", Prediccion.estacion_meteorologica),
+    ("resultado", Prediccion.resultado),
+    ("intensidad", Prediccion.intensidad),
+    ("duracion_estimada_horas", Prediccion.duracion_estimada_horas),
+    ("temperatura_minima_prevista", Prediccion.temperatura_minima_prevista),
+    ("probabilidad_helada", Prediccion.probabilidad_helada),
+)
+
+def _reloj():
+    """Reloj de la aplicación (RelojSistema salvo en la reproducción de grabaciones, que lo fija)."""
+    return current_app.config['RELOJ']
+
+def _columnas_consulta(campos):
+    """Columnas etiquetadas para consultar solo los campos publicados (filas ligeras en lugar de objetos ORM)."""
+    return [columna.label(clave) for clave, columna in campos]
+
+def _serializar_prediccion(prediccion):
+    """Campos públicos de una predicción, con el mismo formato que /obtener_prediccion_actual."""
+    return {clave: getattr(prediccion, columna.key) for clave, columna in CAMPOS_PREDICCION_ACTUAL}
+
 # --- Rutas de la Aplicación ---
-@app.route('/')
+@rutas.route('/')
 def index():
     return render_template('interfaz_prediccion.html')
 
-@app.route('/pronostico_automatico', methods=['GET'])
-def pronostico_automatico():
-    if prediction_model is None:
-        logger.error("Intento de pronóstico automático pero el modelo no está cargado.")
-        return jsonify({"error": "Modelo de predicción no disponible."}), 500
-
-    logger.info("Iniciando pronóstico automático con datos de Open-Meteo...")
-
-    # Coordenadas para Patala, Pucará
-    lat_pucara = -12.20892
-    lon_pucara = -75.07791
-
-    # Pedimos datos para los próximos 2 días para asegurar que cubrimos la madrugada siguiente.
-    datos_meteo_df = obtener_datos_meteorologicos_openmeteo(lat_pucara, lon_pucara, dias_prediccion=2)
-
-    if datos_meteo_df is None or datos_meteo_df.empty:
-        logger.error("No se pudieron obtener datos de Open-Meteo.")
-        return jsonify({"error": "No se pudieron obtener datos meteorológicos externos."}), 503
-    tz_datos = datos_meteo_df['time'].iloc[0].tzinfo if not datos_meteo_df.empty and datos_meteo_df['time'].iloc[0].tzinfo else None
-    ahora = datetime.datetime.now(tz_datos)
-    dia_siguiente = ahora.date() + pd.Timedelta(days=1)
-
-    hora_inicio_madrugada = 1
-    hora_fin_madrugada = 5
-
-    madrugada_inicio = datetime.datetime.combine(dia_siguiente, datetime.time(hora_inicio_madrugada), tzinfo=tz_datos)
-    madrugada_fin = datetime.datetime.combine(dia_siguiente, datetime.time(hora_fin_madrugada), tzinfo=tz_datos)
-
-    logger.info(f"Buscando datos completos para predicción en la madrugada del {dia_siguiente.strftime('%Y-%m-%d')} entre {madrugada_inicio.strftime('%H:%M')} y {madrugada_fin.strftime('%H:%M')}.")
-
-    # Filtrar el DataFrame para el rango de la madrugada del día siguiente
-    datos_madrugada_df = datos_meteo_df[
-        (datos_meteo_df['time'] >= madrugada_inicio) &
-        (datos_meteo_df['time'] <= madrugada_fin)
-    ].copy()
-
-    datos_para_modelo_serie = None
-    fecha_pred_dt = None
-    datos_hora_dict_seleccionados = None
+def _guardar_pronosticos(pronosticos, explicar=False):
+    """
+    Guarda en la base de datos los pronósticos sin error (un solo commit), guarda sus series crudas,
+    encola las alertas y publica cada predicción a los navegadores suscritos.
 
-    if datos_madrugada_df.empty:
-        logger.warning(f"No hay ningún dato horario disponible en Open-Meteo para el rango de {madrugada_inicio} a {madrugada_fin}.")
-    else:
-        # Iterar sobre las horas disponibles en la madrugada para encontrar la primera con datos completos
-        for index, fila_horaria_completa in datos_madrugada_df.iterrows():
-            datos_hora_actual_dict = fila_horaria_completa.to_dict()
-
-            # Estimación de HumedadSuelo si es necesario
-            if 'HumedadSuelo' not in datos_hora_actual_dict or pd.isna(datos_hora_actual_dict['HumedadSuelo']):
-                logger.warning(f"HumedadSuelo es NaN para {fila_horaria_completa['time']}. Intentando estimación.")
-                if 'HumedadRelativa' in datos_hora_actual_dict and 'PrecipitacionMM' in datos_hora_actual_dict:
-                    hr_val = datos_hora_actual_dict['HumedadRelativa']
-                    precip_val = datos_hora_actual_dict['PrecipitacionMM']
-                    # Actualizamos el diccionario directamente. La serie original no se modifica aquí.
-                    datos_hora_actual_dict['HumedadSuelo'] = estimar_humedad_suelo_volumetrica(hr_val, precip_val)
-                    if pd.isna(datos_hora_actual_dict['HumedadSuelo']):
-                        logger.error(f"Estimación de HumedadSuelo falló (resulto en NaN) para {fila_horaria_completa['time']}. No se puede proceder con esta hora.")
-                        # Continuar al siguiente registro horario si la estimación falla críticamente
-                        continue 
-                else:
-                    logger.error(f"No se puede estimar HumedadSuelo para {fila_horaria_completa['time']} por falta de HumedadRelativa o PrecipitacionMM.")
-
-                    continue
-            
-            completo_y_valido = True
-            # Usamos una copia del dict para no enviar 'PrecipitacionMM' al modelo si no es una feature directa.
-            datos_para_modelo_dict = {}
-            for col_feature in COLUMNAS_FEATURES_PREDICCION:
-                if col_feature not in datos_hora_actual_dict or pd.isna(datos_hora_actual_dict[col_feature]):
-                    completo_y_valido = False
-                    logger.debug(f"Dato faltante o NaN para la feature del modelo '{col_feature}' en {fila_horaria_completa['time']}: {datos_hora_actual_dict.get(col_feature)}")
-                    break # No es necesario seguir verificando esta fila para el modelo
-                datos_para_modelo_dict[col_feature] = datos_hora_actual_dict[col_feature]
-
-            if completo_y_valido:
-                datos_para_modelo_serie = fila_horaria_completa # Esta serie puede tener más columnas que las del modelo (ej. PrecipitacionMM)
-                fecha_pred_dt = fila_horaria_completa['time']
-                datos_hora_dict_seleccionados_para_log_y_bd = datos_hora_actual_dict.copy() # Contiene HumedadSuelo estimada y otras
-                
-                logger.info(f"Datos listos para la predicción a las {fecha_pred_dt.strftime('%Y-%m-%d %H:%M:%S')}. Features: {datos_para_modelo_dict}")
-                break # Salir del bucle, ya encontramos la primera hora válida y procesada
-            else:
-                logger.info(f"Datos incompletos para el modelo en {fila_horaria_completa['time']} incluso después de intentar estimar. Valores: {datos_hora_actual_dict}. Buscando siguiente hora...")
-
-    if datos_para_modelo_serie is None or fecha_pred_dt is None or datos_para_modelo_dict is None:
-        msg = f"No se encontraron datos horarios completos (o no se pudieron estimar satisfactoriamente) para las variables {COLUMNAS_FEATURES_PREDICCION} en el rango de la madrugada del {dia_siguiente.strftime('%Y-%m-%d')} ({hora_inicio_madrugada:02d}:00-{hora_fin_madrugada:02d}:00)."
-        logger.error(msg)
-        return jsonify({"error": msg}), 400
-
-    # Si llegamos aquí, tenemos datos_para_modelo_dict válidos y completos para el modelo
-    df_pred_hora = pd.DataFrame([datos_para_modelo_dict], columns=COLUMNAS_FEATURES_PREDICCION)
-    logger.info(f"DataFrame para predicción única (solo features del modelo): \n{df_pred_hora.to_string()}")
+    Returns:
+        list: Para cada pronóstico, el dict de respuesta de la API o {"estacion", "error"}.
+    """
+    from src.almacen_series import AlmacenSeriesHorarias
+    from src.alertas import procesar_alertas_prediccion
+    from src.especificacion_features import COLUMNAS_MODELO
+    from src.calidad_datos import describir_calidad
+
+    # Se guarda la respuesta cruda completa (unidades de origen) para re-pronosticar o entrenar sin volver a descargar.
+    # El almacén guarda en UTC tanto la emisión como las horas locales de la serie (ver src/almacen_series.py).
+    almacen_series = AlmacenSeriesHorarias(current_app.config['RUTA_SERIES_HORARIAS'])
+    emision = _reloj().ahora(datetime.timezone.utc)
+    for pronostico in pronosticos:
+        if pronostico.serie_cruda is not None:
+            try:
+                almacen_series.anexar(pronostico.estacion.codigo, pronostico.serie_cruda, emision,
+                                      zona_horaria=pronostico.estacion.zona_horaria)
+            except Exception as e:
+                logger.error(f"No se pudo guardar la serie horaria de '{pronostico.estacion.codigo}' en el almacén: {e}", exc_info=True)
 
+    respuestas = [None] * len(pronosticos)
+    guardados = [] # (índice, pronóstico, Prediccion, explicación)
+    db_session: Session = next(get_db())
     try:
-        pred_array = prediction_model.predict(df_pred_hora)
-        prob_array = prediction_model.predict_proba(df_pred_hora)
-        pred_valor = int(pred_array[0])
-        prob_helada = float(prob_array[0][1])
-        # temp_pronosticada se toma del diccionario que tiene todos los datos de esa hora
-        temp_pronosticada = datos_hora_dict_seleccionados_para_log_y_bd['Temperatura'] 
-
-        resultado, intensidad, duracion = determinar_estado_helada(pred_valor, prob_helada, temp_pronosticada)
-
-        db_session: Session = next(get_db())
-        try:
-            # Usamos datos_hora_dict_seleccionados_para_log_y_bd para parametros_entrada
-            # porque este contiene la HumedadSuelo (potencialmente estimada) y otras variables como PrecipitacionMM.
-            parametros_entrada_json = json.dumps({k: v for k, v in datos_hora_dict_seleccionados_para_log_y_bd.items() if not pd.isna(v) and k != 'time'})
+        for i, pronostico in enumerate(pronosticos):
+            if pronostico.error is not None:
+                logger.error(f"Estación '{pronostico.estacion.codigo}': {pronostico.error}")
+                respuestas[i] = {"estacion": pronostico.estacion.codigo, "error": pronostico.error}
+                continue
+            logger.info(f"Estación '{pronostico.estacion.codigo}': datos a las {pronostico.fecha_prediccion:%Y-%m-%d %H:%M}. Features: {pronostico.features}")
+            # temp_pronosticada se toma del diccionario que tiene todos los datos de esa hora
+            temp_pronosticada = pronostico.features['Temperatura']
+            resultado, intensidad, duracion = determinar_estado_helada(pronostico.prediccion, pronostico.probabilidad, temp_pronosticada)
+
+            explicacion = None
+            explicacion_json = None
+            servicio = catalogo_modelos.servicio(pronostico.version_modelo)
+            if servicio.explicador is not None:
+                explicacion = servicio.explicador.explicar([pronostico.features[c] for c in COLUMNAS_MODELO])
+                explicacion_json = json.dumps(servicio.explicador.explicacion_compacta(explicacion), separators=(',', ':'))
+            elif explicar:
+                # Modelos que no están hechos de árboles de sklearn (p. ej. HistGradientBoosting): se indica en vez de omitirla.
+                explicacion = {"disponible": False,
+                               "motivo": f"Explicación no disponible para modelos {type(servicio.modelo_original).__name__}."}
 
             nueva_pred = Prediccion(
-                fecha_prediccion_para=fecha_pred_dt.to_pydatetime(),
-                ubicacion="Patala, Pucará (Open-Meteo)",
+                fecha_registro=_reloj().utcnow(),
+                fecha_prediccion_para=pronostico.fecha_prediccion,
+                ubicacion=pronostico.estacion.nombre,
                 estacion_meteorologica="Open-Meteo Forecast",
                 temperatura_minima_prevista=temp_pronosticada,
-                probabilidad_helada=prob_helada, resultado=resultado,
+                probabilidad_helada=pronostico.probabilidad, resultado=resultado,
                 intensidad=intensidad, duracion_estimada_horas=duracion,
-                parametros_entrada=parametros_entrada_json,
+                # Contiene HumedadSuelo (estimada si faltaba) y otras variables como PrecipitacionMM.
+                parametros_entrada=json.dumps(pronostico.features),
+                explicacion=explicacion_json,
+                version_modelo=pronostico.version_modelo,
+                calidad_datos=pronostico.calidad,
                 fuente_datos_entrada="Open-Meteo API via src.data_fetcher (Pred. Madrugada)"
             )
             db_session.add(nueva_pred)
-            db_session.commit()
-            db_session.refresh(nueva_pred)
-
-            mensaje_final = f"Pronóstico para la madrugada del {dia_siguiente} (aprox. {fecha_pred_dt.strftime('%H:%M')}) guardado."
-            logger.info(f"{mensaje_final} (ID: {nueva_pred.id})")
-
-            respuesta_api = {
-                "id": nueva_pred.id,
-                "fecha_prediccion_para": nueva_pred.fecha_prediccion_para.isoformat(),
-                "ubicacion": nueva_pred.ubicacion,
-                "estacion_meteorologica": nueva_pred.estacion_meteorologica,
-                "temperatura_pronosticada": nueva_pred.temperatura_minima_prevista, # Renombrado para claridad
-                "probabilidad_helada": nueva_pred.probabilidad_helada,
-                "resultado": nueva_pred.resultado.value if nueva_pred.resultado else None,
-                "intensidad": nueva_pred.intensidad.value if nueva_pred.intensidad else None,
-                "duracion_estimada_horas": nueva_pred.duracion_estimada_horas,
-                "mensaje": mensaje_final
-            }
-            return jsonify(respuesta_api), 200
-
-        except Exception as db_exc:
-            db_session.rollback()
-            msg = f"Error guardando predicción para {fecha_pred_dt} en BD: {db_exc}"
-            logger.error(msg, exc_info=True)
-            return jsonify({"error": msg}), 500
+            guardados.append((i, pronostico, nueva_pred, explicacion))
+        db_session.commit()
+
+        for i, pronostico, nueva_pred, explicacion in guardados:
+            # Las alertas solo se encolan: el envío ocurre en el hilo del despachador.
+            try:
+                procesar_alertas_prediccion(db_session, nueva_pred, obtener_despachador_alertas(), ahora=_reloj().utcnow())
+            except Exception as alerta_exc:
+                db_session.rollback()
+                logger.error(f"Error al procesar alertas para la predicción {nueva_pred.id}: {alerta_exc}", exc_info=True)
+
+            mensaje_final = f"Pronóstico para la madrugada del {pronostico.dia_siguiente} (aprox. {pronostico.fecha_prediccion:%H:%M}) guardado."
+            logger.info(f"{mensaje_final} (ID: {nueva_pred.id}, estación '{pronostico.estacion.codigo}', modelo '{pronostico.version_modelo}')")
+            respuesta_api = _serializar_prediccion(nueva_pred)
+            respuesta_api["mensaje"] = mensaje_final
+            respuesta_api["calidad"] = describir_calidad(pronostico.calidad)
+            # Las pestañas suscritas a /eventos/predicciones reciben la nueva predicción sin volver a consultar.
+            difusor_predicciones.publicar(nueva_pred.ubicacion, respuesta_api)
+            if explicar:
+                respuesta_api["explicacion"] = explicacion
+            respuestas[i] = respuesta_api
+        return respuestas
+    except Exception:
+        db_session.rollback()
+        raise
+    finally:
+        db_session.close()
+
+@rutas.route('/pronostico_automatico', methods=['GET'])
+def pronostico_automatico():
+    """Pronóstico de la madrugada siguiente para una estación del registro: ?estacion=<codigo> (por defecto la predeterminada)."""
+    codigo = request.args.get('estacion', ESTACION_PRONOSTICO_AUTOMATICO)
+    estacion = registro_estaciones.obtener(codigo)
+    if estacion is None:
+        return jsonify({"error": f"Estación no registrada o inactiva: {codigo}"}), 404
+
+    logger.info(f"Iniciando pronóstico automático con datos de Open-Meteo para '{estacion.codigo}'...")
+    # Modo explicación: ?explicar=true añade a la respuesta el camino de decisión y las contribuciones por variable
+    explicar = request.args.get('explicar', 'false').lower() in ('1', 'true', 'si', 'sí')
+    forzar = request.args.get('forzar', 'false').lower() in ('1', 'true', 'si', 'sí')
+
+    if not forzar and not explicar and MINUTOS_REUTILIZAR_PRONOSTICO > 0:
+        db_session: Session = next(get_db())
+        try:
+            manana = _reloj().ahora(estacion.zona).date() + datetime.timedelta(days=1)
+            reciente = db_session.query(Prediccion).filter(
+                Prediccion.ubicacion == estacion.nombre,
+                Prediccion.fecha_registro >= _reloj().utcnow() - datetime.timedelta(minutes=MINUTOS_REUTILIZAR_PRONOSTICO),
+                Prediccion.fecha_prediccion_para >= datetime.datetime.combine(manana, datetime.time.min),
+                Prediccion.fecha_prediccion_para <= datetime.datetime.combine(manana, datetime.time.max),
+            ).order_by(Prediccion.fecha_registro.desc()).first()
+            if reciente is not None:
+                logger.info(f"Reutilizando el pronóstico {reciente.id} registrado hace menos de {MINUTOS_REUTILIZAR_PRONOSTICO} minutos.")
+                respuesta = _serializar_prediccion(reciente)
+                respuesta["mensaje"] = f"Pronóstico reciente para la madrugada del {manana} (calculado a las {reciente.fecha_registro:%H:%M} UTC)."
+                return respuesta_json(respuesta)
         finally:
             db_session.close()
 
-    except Exception as model_exc:
-        msg = f"Error en predicción del modelo para {fecha_pred_dt}: {model_exc}"
+    _, error = _modelo_o_error(estacion.version_modelo) # Tras la reutilización: un pronóstico reciente no necesita el modelo
+    if error is not None:
+        return error
+    # Importación pesada diferida (pandas, requests): solo la paga la primera petición de pronóstico.
+    from src.pronostico_estaciones import pronosticar_estaciones
+
+    try:
+        pronostico, = pronosticar_estaciones([estacion], lambda version: catalogo_modelos.obtener(version, timeout=SEGUNDOS_ESPERA_MODELO),
+                                             ahora=_reloj().ahora(datetime.timezone.utc), obtener_servicio=catalogo_modelos.servicio)
+        if pronostico.error is not None:
+            logger.error(pronostico.error)
+            return jsonify({"error": pronostico.error}), 503 if pronostico.serie_cruda is None else 400
+        respuesta_api, = _guardar_pronosticos([pronostico], explicar=explicar)
+        return respuesta_json(respuesta_api)
+    except Exception as exc:
+        msg = f"Error en el pronóstico de la estación '{estacion.codigo}': {exc}"
         logger.error(msg, exc_info=True)
         return jsonify({"error": msg}), 500
 
-@app.route('/registros', methods=['GET'])
-def ver_registros():
+@rutas.route('/pronostico_estaciones', methods=['POST'])
+def pronostico_estaciones():
+    """
+    Pronóstico en lote de todas las estaciones activas (o ?estaciones=a,b). Una descarga multi-ubicación
+    por zona horaria y una inferencia por versión de modelo.
+    """
+    codigos = [c for c in request.args.get('estaciones', '').split(',') if c]
+    estaciones = [registro_estaciones.obtener(c) for c in codigos] if codigos else registro_estaciones.activas()
+    desconocidas = [c for c, e in zip(codigos, estaciones) if e is None]
+    if desconocidas:
+        return jsonify({"error": f"Estaciones no registradas o inactivas: {desconocidas}"}), 404
+    if not estaciones:
+        return jsonify({"error": "No hay estaciones activas en el registro."}), 404
+
+    from src.pronostico_estaciones import pronosticar_estaciones
+    catalogo_modelos.precargar(sorted({e.version_modelo for e in estaciones})) # Carga en paralelo las versiones del lote
+    try:
+        pronosticos = pronosticar_estaciones(
+            estaciones, lambda version: catalogo_modelos.obtener(version, timeout=SEGUNDOS_ESPERA_MODELO),
+            ahora=_reloj().ahora(datetime.timezone.utc), obtener_servicio=catalogo_modelos.servicio)
+        respuestas = _guardar_pronosticos(pronosticos)
+    except Exception as exc:
+        logger.error(f"Error en el pronóstico en lote de estaciones: {exc}", exc_info=True)
+        return jsonify({"error": f"Error en el pronóstico en lote: {exc}"}), 500
+    return respuesta_json({"estaciones": len(estaciones),
+                           "guardadas": sum(1 for r in respuestas if "error" not in r),
+                           "resultados": respuestas})
+
+@rutas.route('/estaciones', methods=['GET'])
+def listar_estaciones():
+    """Estaciones activas del registro, con su versión de modelo asignada."""
+    return respuesta_json([e.a_dict() for e in registro_estaciones.activas()])
+
+@rutas.route('/estaciones', methods=['POST'])
+def crear_estacion():
+    """Registra una estación: JSON {codigo, nombre, latitud, longitud, altitud_m?, zona_horaria?, version_modelo?}."""
+    datos = request.get_json(silent=True) or {}
+    errores = validar_datos_estacion(datos)
+    version = datos.get('version_modelo') or VERSION_MODELO_PREDETERMINADA
+    if not catalogo_modelos.existe(version):
+        errores.append(f"No existe el modelo '{version}' en {RUTA_MODELOS_ENTRENADOS}.")
+    if errores:
+        return jsonify({"error": errores}), 400
+
     db_session: Session = next(get_db())
     try:
-        query = db_session.query(Prediccion)
-        fecha_filtro = request.args.get('fecha')
-        estacion_filtro = request.args.get('estacion')
+        if db_session.query(Estacion.id).filter(Estacion.codigo == datos['codigo']).first() is not None:
+            return jsonify({"error": f"Ya existe una estación con el código '{datos['codigo']}'."}), 409
+        # El nombre identifica a la estación en predicciones, alertas y eventos (Prediccion.ubicacion)
+        if db_session.query(Estacion.id).filter(Estacion.nombre == datos['nombre']).first() is not None:
+            return jsonify({"error": f"Ya existe una estación con el nombre '{datos['nombre']}'."}), 409
+        estacion = Estacion(
+            codigo=datos['codigo'], nombre=datos['nombre'],
+            latitud=float(datos['latitud']), longitud=float(datos['longitud']),
+            altitud_m=float(datos['altitud_m']) if datos.get('altitud_m') is not None else None,
+            zona_horaria=datos.get('zona_horaria') or ESTACION_PREDETERMINADA['zona_horaria'],
+            version_modelo=version,
+        )
+        db_session.add(estacion)
+        db_session.commit()
+        db_session.refresh(estacion)
+        registro_estaciones.invalidar()
+        catalogo_modelos.precargar([version])
+        return jsonify({"id": estacion.id, "codigo": estacion.codigo, "version_modelo": estacion.version_modelo}), 201
+    except IntegrityError: # Otra petición registró el mismo código o nombre entre la verificación y el commit
+        db_session.rollback()
+        return jsonify({"error": f"Ya existe una estación con el código '{datos['codigo']}' o el nombre '{datos['nombre']}'."}), 409
+    except Exception as e:
+        db_session.rollback()
+        logger.error(f"Error al registrar la estación: {e}", exc_info=True)
+        return jsonify({"error": f"Error al registrar la estación: {str(e)}"}), 500
+    finally:
+        db_session.close()
 
-        if fecha_filtro:
-            try:
-                # strptime returns a datetime object, so calling .date() is correct here.
-                fecha_dt = datetime.datetime.strptime(fecha_filtro, "%Y-%m-%d").date()
-                query = query.filter( Prediccion.fecha_prediccion_para >= datetime.datetime.combine(fecha_dt, datetime.datetime.min.time()),
-                                      Prediccion.fecha_prediccion_para <= datetime.datetime.combine(fecha_dt, datetime.datetime.max.time()))
-            except ValueError:
-                logger.warning(f"Formato de fecha inválido: {fecha_filtro}")
-                return jsonify({"error": "Formato de fecha inválido. Usar YYYY-MM-DD."}), 400
+def _generar_registros(fecha_dt, estacion_filtro, formato):
+    """Consulta y serializa /registros. Retorna (cuerpo_bytes, mimetype, status) para la caché de respuestas."""
+    db_session: Session = next(get_db())
+    try:
+        query = db_session.query(*_columnas_consulta(CAMPOS_REGISTRO))
+        if fecha_dt:
+            query = query.filter( Prediccion.fecha_prediccion_para >= datetime.datetime.combine(fecha_dt, datetime.datetime.min.time()),
+                                  Prediccion.fecha_prediccion_para <= datetime.datetime.combine(fecha_dt, datetime.datetime.max.time()))
         if estacion_filtro:
             query = query.filter(Prediccion.estacion_meteorologica.ilike(f"%{estacion_filtro}%"))
-
         registros = query.order_by(Prediccion.fecha_prediccion_para.desc()).all()
-        registros_list = [{
-                "id": reg.id, "fecha_registro": reg.fecha_registro.isoformat(),
-                "fecha_prediccion_para": reg.fecha_prediccion_para.isoformat(),
-                "ubicacion": reg.ubicacion, "estacion_meteorologica": reg.estacion_meteorologica,
-                "resultado": reg.resultado.value if reg.resultado else None,
-                "intensidad": reg.intensidad.value if reg.intensidad else None,
-                "duracion_estimada_horas": reg.duracion_estimada_horas,
-                "temperatura_minima_prevista": reg.temperatura_minima_prevista,
-                "probabilidad_helada": reg.probabilidad_helada
-            } for reg in registros]
-        return jsonify(registros_list), 200
+    finally:
+        db_session.close()
+
+    if formato == 'csv':
+        return a_csv_bytes([clave for clave, _ in CAMPOS_REGISTRO], registros), 'text/csv', 200
+    return a_json_bytes([reg._asdict() for reg in registros]), 'application/json', 200
+
+@rutas.route('/registros', methods=['GET'])
+def ver_registros():
+    fecha_filtro = request.args.get('fecha')
+    estacion_filtro = request.args.get('estacion')
+    formato = request.args.get('formato', 'json').lower() # ?formato=csv descarga los registros como CSV
+    if formato not in ('json', 'csv'):
+        return jsonify({"error": "Formato inválido. Usar 'json' o 'csv'."}), 400
+
+    fecha_dt = None
+    if fecha_filtro:
+        try:
+            # strptime returns a datetime object, so calling .date() is correct here.
+            fecha_dt = datetime.datetime.strptime(fecha_filtro, "%Y-%m-%d").date()
+        except ValueError:
+            logger.warning(f"Formato de fecha inválido: {fecha_filtro}")
+            return jsonify({"error": "Formato de fecha inválido. Usar YYYY-MM-DD."}), 400
+
+    try:
+        entrada = cache_respuestas.obtener_o_generar(
+            ('registros', fecha_dt, estacion_filtro or None, formato),
+            lambda: _generar_registros(fecha_dt, estacion_filtro, formato))
+        return responder_desde_cache(entrada, nombre_descarga="registros_predicciones.csv" if formato == 'csv' else None)
     except Exception as e:
         logger.error(f"Error al obtener registros de la BD: {e}", exc_info=True)
         return jsonify({"error": f"Error al obtener registros: {str(e)}"}), 500
-    finally:
-        db_session.close()
 
-@app.route('/registros_ui', methods=['GET'])
+@rutas.route('/registros_ui', methods=['GET'])
 def ver_registros_ui():
     db_session: Session = next(get_db())
     try:
         registros = db_session.query(Prediccion).order_by(Prediccion.fecha_prediccion_para.desc()).all()
-        current_year = datetime.datetime.now().year
+        current_year = _reloj().ahora().year
         return render_template('interfaz_registros.html', registros=registros, current_year=current_year)
     except Exception as e:
         logger.error(f"Error en la ruta /registros_ui: {e}", exc_info=True)
@@ -306,37 +453,227 @@ def ver_registros_ui():
     finally:
         db_session.close()
 
-@app.route('/obtener_prediccion_actual', methods=['GET'])
-def obtener_prediccion_actual():
+def _generar_prediccion_actual(hoy):
+    """Primera predicción desde hoy, serializada. Retorna (cuerpo_bytes, mimetype, status) para la caché de respuestas."""
     db_session: Session = next(get_db())
     try:
-        hoy_inicio = datetime.datetime.combine(datetime.date.today(), datetime.datetime.min.time())
-
-        prediccion_actual = db_session.query(Prediccion)\
+        hoy_inicio = datetime.datetime.combine(hoy, datetime.datetime.min.time())
+        prediccion_actual = db_session.query(*_columnas_consulta(CAMPOS_PREDICCION_ACTUAL))\
             .filter(Prediccion.fecha_prediccion_para >= hoy_inicio)\
             .order_by(Prediccion.fecha_prediccion_para.asc())\
             .first()
+    finally:
+        db_session.close()
 
-        if prediccion_actual:
-            return jsonify({
-                "id": prediccion_actual.id,
-                "fecha_prediccion_para": prediccion_actual.fecha_prediccion_para.isoformat(),
-                "ubicacion": prediccion_actual.ubicacion,
-                "estacion_meteorologica": prediccion_actual.estacion_meteorologica,
-                "temperatura_pronosticada": prediccion_actual.temperatura_minima_prevista,
-                "probabilidad_helada": prediccion_actual.probabilidad_helada,
-                "resultado": prediccion_actual.resultado.value if prediccion_actual.resultado else None,
-                "intensidad": prediccion_actual.intensidad.value if prediccion_actual.intensidad else None,
-                "duracion_estimada_horas": prediccion_actual.duracion_estimada_horas,
-                "mensaje": "Predicción actual recuperada."
-            }), 200
-        else:
-            return jsonify({"mensaje": "No hay predicción actual disponible."}), 404
+    if prediccion_actual:
+        respuesta = prediccion_actual._asdict()
+        respuesta["mensaje"] = "Predicción actual recuperada."
+        return a_json_bytes(respuesta), 'application/json', 200
+    return a_json_bytes({"mensaje": "No hay predicción actual disponible."}), 'application/json', 404
+
+@rutas.route('/obtener_prediccion_actual', methods=['GET'])
+def obtener_prediccion_actual():
+    try:
+        hoy = _reloj().hoy() # Forma parte de la clave: al cambiar el día la entrada anterior deja de usarse
+        entrada = cache_respuestas.obtener_o_generar(('prediccion_actual', hoy), lambda: _generar_prediccion_actual(hoy))
+        return responder_desde_cache(entrada)
     except Exception as e:
         logger.error(f"Error al obtener la predicción actual de la BD: {e}", exc_info=True)
         return jsonify({"error": f"Error al obtener predicción actual: {str(e)}"}), 500
+
+
+def _generar_resumen_analitica(agrupar, desde, hasta, estacion, fuente):
+    """Estadísticas agregadas serializadas. Retorna (cuerpo_bytes, mimetype, status) para la caché de respuestas."""
+    db_session: Session = next(get_db())
+    try:
+        grupos = consultar_resumen(db_session, agrupar, desde=desde, hasta=hasta, estacion=estacion, fuente=fuente)
     finally:
         db_session.close()
+    return a_json_bytes({"agrupar": agrupar, "fuente": fuente, "grupos": grupos}), 'application/json', 200
+
+@rutas.route('/analitica/resumen', methods=['GET'])
+def analitica_resumen():
+    """
+    Conteos, probabilidad media y horas estimadas de helada agrupados en SQL.
+    Parámetros: agrupar=anio,mes,dia,estacion,intensidad (por defecto anio,mes,estacion,intensidad),
+    desde/hasta=YYYY-MM-DD, estacion, fuente=resumen|predicciones.
+    """
+    agrupar = [a.strip() for a in request.args.get('agrupar', 'anio,mes,estacion,intensidad').split(',') if a.strip()]
+    invalidas = [a for a in agrupar if a not in AGRUPACIONES_VALIDAS]
+    if invalidas:
+        return jsonify({"error": f"Agrupación inválida: {invalidas}. Usar una combinación de {list(AGRUPACIONES_VALIDAS)}."}), 400
+    fuente = request.args.get('fuente', FUENTE_RESUMEN)
+    estacion = request.args.get('estacion') or None
+    try:
+        desde = datetime.datetime.strptime(request.args['desde'], "%Y-%m-%d").date() if request.args.get('desde') else None
+        hasta = datetime.datetime.strptime(request.args['hasta'], "%Y-%m-%d").date() if request.args.get('hasta') else None
+    except ValueError:
+        return jsonify({"error": "Formato de fecha inválido. Usar YYYY-MM-DD."}), 400
+
+    try:
+        entrada = cache_respuestas.obtener_o_generar(
+            ('analitica', tuple(agrupar), desde, hasta, estacion, fuente),
+            lambda: _generar_resumen_analitica(agrupar, desde, hasta, estacion, fuente))
+        return responder_desde_cache(entrada)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error al calcular la analítica de predicciones: {e}", exc_info=True)
+        return jsonify({"error": f"Error al calcular la analítica: {str(e)}"}), 500
+
+
+def _responder_raster(raster, formato):
+    """
+    El ráster ya está en la caché en disco de la grilla; aquí solo se serializa con ETag, para que el
+    navegador revalide con un 304, y comprimido si el cliente lo admite.
+    """
+    from src.pronostico_grilla import raster_a_dict, raster_a_npy
+    if formato == 'npy':
+        respuesta = responder_desde_cache(EntradaCache(raster_a_npy(raster), 'application/octet-stream'))
+        respuesta.headers['X-Raster-Forma'] = f"{raster['riesgo'].shape[0]}x{raster['riesgo'].shape[1]}"
+        return respuesta
+    return responder_desde_cache(EntradaCache(a_json_bytes(raster_a_dict(raster))))
+
+@rutas.route('/grilla/riesgo', methods=['GET'])
+def grilla_riesgo():
+    """
+    Ráster de riesgo de helada para un recuadro: ?lat_min=&lat_max=&lon_min=&lon_max=&resolucion=[&formato=npy][&zona_horaria=]
+    Con &guardar=true el ráster además se guarda como .npz en instance/rasters.
+    """
+    prediction_model, error = _modelo_o_error()
+    if error is not None:
+        return error
+    from src.pronostico_grilla import calcular_raster_riesgo, guardar_raster, ZONA_HORARIA_GRILLA
+    try:
+        lat_min, lat_max, lon_min, lon_max = (float(request.args[k]) for k in ('lat_min', 'lat_max', 'lon_min', 'lon_max'))
+        resolucion = float(request.args.get('resolucion', 0.01))
+        raster = calcular_raster_riesgo(prediction_model, lat_min, lat_max, lon_min, lon_max, resolucion,
+                                        ruta_cache=os.path.join(current_app.instance_path, 'cache_grilla'),
+                                        ahora=_reloj().ahora(datetime.timezone.utc),
+                                        zona_horaria=request.args.get('zona_horaria', ZONA_HORARIA_GRILLA))
+    except (KeyError, ValueError) as e:
+        return jsonify({"error": f"Parámetros de grilla inválidos: {e}"}), 400
+    if raster is None:
+        return jsonify({"error": "No se pudieron obtener datos meteorológicos para la grilla."}), 503
+
+    if request.args.get('guardar', 'false').lower() == 'true':
+        nombre_archivo = f"riesgo_{raster['madrugada_inicio']:%Y%m%d}_{lat_min:.4f}_{lat_max:.4f}_{lon_min:.4f}_{lon_max:.4f}_{resolucion:g}.npz"
+        ruta_raster = guardar_raster(os.path.join(current_app.instance_path, 'rasters', nombre_archivo), raster)
+        logger.info(f"Ráster de riesgo {raster['riesgo'].shape} guardado en {ruta_raster}")
+    return _responder_raster(raster, request.args.get('formato', 'json'))
+
+@rutas.route('/grilla/teselas/<int:z>/<int:x>/<int:y>', methods=['GET'])
+def grilla_tesela(z, x, y):
+    """Tesela XYZ del ráster de riesgo (CELDAS_POR_LADO_TESELA x CELDAS_POR_LADO_TESELA celdas)."""
+    prediction_model, error = _modelo_o_error()
+    if error is not None:
+        return error
+    from src.pronostico_grilla import calcular_raster_riesgo, recuadro_tesela, CELDAS_POR_LADO_TESELA, ZONA_HORARIA_GRILLA
+    try:
+        lat_min, lat_max, lon_min, lon_max = recuadro_tesela(z, x, y)
+        raster = calcular_raster_riesgo(prediction_model, lat_min, lat_max, lon_min, lon_max,
+                                        (lat_max - lat_min) / CELDAS_POR_LADO_TESELA, (lon_max - lon_min) / CELDAS_POR_LADO_TESELA,
+                                        ruta_cache=os.path.join(current_app.instance_path, 'cache_grilla'),
+                                        ahora=_reloj().ahora(datetime.timezone.utc),
+                                        zona_horaria=request.args.get('zona_horaria', ZONA_HORARIA_GRILLA))
+    except (KeyError, ValueError) as e: # ZoneInfoNotFoundError es un KeyError
+        return jsonify({"error": str(e)}), 400
+    if raster is None:
+        return jsonify({"error": "No se pudieron obtener datos meteorológicos para la tesela."}), 503
+    return _responder_raster(raster, request.args.get('formato', 'json'))
+
+
+@rutas.route('/eventos/predicciones', methods=['GET'])
+def eventos_predicciones():
+    """Canal Server-Sent Events: ?estacion=<ubicacion> (o todas). Envía cada predicción al guardarse."""
+    estacion = request.args.get('estacion', TODAS_LAS_ESTACIONES)
+    try:
+        cola = difusor_predicciones.suscribir(estacion) # El límite se comprueba antes de responder
+    except LimiteConexionesAlcanzado as e:
+        return jsonify({"error": str(e)}), 503
+    # Sin stream_with_context (el flujo no usa la petición): así el close() del servidor llega al flujo
+    # aunque cierre la respuesta antes del primer fragmento, y la conexión se libera.
+    return Response(difusor_predicciones.flujo(estacion, cola), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def _error_token_administracion():
+    """None si la petición trae 'Authorization: Bearer <TOKEN_ADMIN_ALERTAS>'; si no, la respuesta de error."""
+    token = current_app.config.get('TOKEN_ADMIN_ALERTAS')
+    if not token:
+        return jsonify({"error": "La administración de alertas está deshabilitada (definir ALERTAS_TOKEN_ADMIN)."}), 403
+    esquema, _, recibido = request.headers.get('Authorization', '').partition(' ')
+    if esquema.lower() != 'bearer' or not hmac.compare_digest(recibido.strip().encode('utf-8'), token.encode('utf-8')):
+        respuesta = jsonify({"error": "Token de administración inválido o ausente."})
+        respuesta.headers['WWW-Authenticate'] = 'Bearer'
+        return respuesta, 401
+    return None
+
+@rutas.route('/alertas/suscripciones', methods=['POST'])
+def crear_suscripcion_alerta():
+    """
+    Crea una suscripción: JSON {estacion, canal, destino, intensidad_minima (nombre del enum, por defecto 'fuerte')}.
+    Requiere 'Authorization: Bearer <ALERTAS_TOKEN_ADMIN>'; el destino se valida según el canal.
+    """
+    from src.alertas import DestinoNoPermitido, validar_destino
+    error_token = _error_token_administracion()
+    if error_token:
+        return error_token
+    datos = request.get_json(silent=True) or {}
+    faltantes = [k for k in ('estacion', 'canal', 'destino') if not datos.get(k)]
+    if faltantes:
+        return jsonify({"error": f"Faltan campos obligatorios: {faltantes}"}), 400
+    despachador_alertas = obtener_despachador_alertas()
+    if datos['canal'] not in despachador_alertas.canales:
+        return jsonify({"error": f"Canal no disponible. Canales configurados: {list(despachador_alertas.canales)}"}), 400
+    try:
+        validar_destino(datos['canal'], datos['destino'])
+    except DestinoNoPermitido as e:
+        return jsonify({"error": f"Destino inválido para el canal '{datos['canal']}': {e}"}), 400
+    try:
+        intensidad_minima = IntensidadHelada[datos.get('intensidad_minima', 'fuerte')]
+    except KeyError:
+        return jsonify({"error": f"Intensidad inválida. Usar una de: {[i.name for i in IntensidadHelada]}"}), 400
+
+    db_session: Session = next(get_db())
+    try:
+        suscripcion = SuscripcionAlerta(estacion=datos['estacion'], canal=datos['canal'],
+                                        destino=datos['destino'], intensidad_minima=intensidad_minima)
+        db_session.add(suscripcion)
+        db_session.commit()
+        db_session.refresh(suscripcion)
+        return jsonify({"id": suscripcion.id, "estacion": suscripcion.estacion, "canal": suscripcion.canal,
+                        "destino": suscripcion.destino, "intensidad_minima": suscripcion.intensidad_minima.value}), 201
+    except Exception as e:
+        db_session.rollback()
+        logger.error(f"Error al crear la suscripción de alerta: {e}", exc_info=True)
+        return jsonify({"error": f"Error al crear la suscripción: {str(e)}"}), 500
+    finally:
+        db_session.close()
+
+@rutas.route('/alertas/metricas', methods=['GET'])
+def metricas_alertas():
+    """Métricas por canal del despachador: encolados, enviados, fallidos, reintentos, descartados y mensajes/s."""
+    return jsonify(obtener_despachador_alertas().metricas()), 200
+
+
+@rutas.route('/salud/vivo', methods=['GET'])
+def salud_vivo():
+    """Sonda de liveness: el proceso responde. No toca la base de datos ni el modelo."""
+    return jsonify({"estado": "vivo", "segundos_activo": round(time.monotonic() - INSTANTE_IMPORTACION, 3)}), 200
+
+@rutas.route('/salud/listo', methods=['GET'])
+def salud_listo():
+    """Sonda de readiness: 200 solo cuando el modelo está cargado y la base de datos responde."""
+    base_datos_ok = False
+    try:
+        with base_datos.engine.connect() as conexion:
+            conexion.execute(text("SELECT 1"))
+        base_datos_ok = True
+    except Exception as e:
+        logger.warning(f"Readiness: la base de datos no responde: {e}")
+    modelos = catalogo_modelos.estado()
+    listo = base_datos_ok and catalogo_modelos.servicio().listo # Basta el modelo predeterminado; los demás se cargan a demanda
+    return jsonify({"listo": listo, "base_datos": base_datos_ok, "modelos": modelos}), 200 if listo else 503
 
 
 # --- Lógica de inicialización y ejecución (del antiguo src/main.py) ---
@@ -349,17 +686,93 @@ def inicializar_aplicacion(flask_app):
     logger.info("Inicializando la base de datos (creando tablas si es necesario)...")
     init_db() # Esta función ahora usa el motor configurado por setup_database_engine
     logger.info("Base de datos lista y tablas verificadas/creadas.")
+
+    db_session: Session = next(get_db())
+    try:
+        inicializar_resumen_diario(db_session) # Solo recalcula si el resumen está vacío y ya hay predicciones
+        sembrar_estaciones(db_session) # Registro vacío: se crea la estación predeterminada
+    finally:
+        db_session.close()
     # Aquí se podrían añadir otras inicializaciones si fueran necesarias
 
+def create_app(configuracion=None):
+    """
+    Fábrica de la aplicación Flask.
+
+    Args:
+        configuracion (dict, opcional): Valores que reemplazan la configuración tomada del entorno.
+
+    PRECARGA_MODELO=true (por defecto) inicia la carga del modelo en segundo plano al crear la app;
+    con false se carga en la primera petición que lo necesita.
+    """
+    app = Flask(__name__,
+                instance_relative_config=True,  # Para que instance_path funcione como se espera
+                template_folder='interfaz_usuario',
+                static_folder='static')
+
+    # Configuración de la base de datos usando instance_path
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-key968') # Buena práctica añadir una Secret Key
+    try:
+        os.makedirs(app.instance_path, exist_ok=True) # Crea el directorio instance si no existe
+    except OSError as e:
+        app.logger.error(f"Error creando el directorio de instancia {app.instance_path}: {e}")
+        # Considerar si la app debe detenerse aquí o continuar si la creación falla.
+
+    default_sqlite_uri = f"sqlite:///{os.path.join(app.instance_path, 'predicciones.db')}"
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', default_sqlite_uri)
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Los archivos estáticos (JS) se guardan en el navegador; Flask ya añade ETag y responde 304 al revalidar.
+    app.config['SEND_FILE_MAX_AGE_DEFAULT'] = int(os.environ.get('SEGUNDOS_CACHE_ESTATICOS', 3600))
+    # Almacén columnar de las series horarias crudas de Open-Meteo (todas las horas de cada respuesta)
+    app.config['RUTA_SERIES_HORARIAS'] = os.environ.get('RUTA_SERIES_HORARIAS', os.path.join(app.instance_path, 'series_horarias'))
+    app.config['PRECARGA_MODELO'] = os.environ.get('PRECARGA_MODELO', 'true').lower() == 'true'
+    app.config['RELOJ'] = RelojSistema() # La reproducción de grabaciones lo reemplaza por un RelojFijo
+    # Si se define, cada respuesta de Open-Meteo se guarda como grabación para reproducirla sin red (src/replay_pronosticos.py)
+    app.config['DIRECTORIO_GRABACION_OPENMETEO'] = os.environ.get('GRABAR_OPENMETEO')
+    # Token para crear suscripciones de alerta; sin él, POST /alertas/suscripciones queda deshabilitado
+    app.config['TOKEN_ADMIN_ALERTAS'] = os.environ.get('ALERTAS_TOKEN_ADMIN')
+    # Conexiones SSE simultáneas por proceso: según el tipo de trabajador, salvo que se fije MAX_CONEXIONES_EVENTOS
+    app.config['HILOS_WSGI'] = int(os.environ.get('HILOS_WSGI', 8))
+    app.config['MAX_CONEXIONES_EVENTOS'] = (int(os.environ['MAX_CONEXIONES_EVENTOS']) if os.environ.get('MAX_CONEXIONES_EVENTOS')
+                                            else limite_conexiones(app.config['HILOS_WSGI']))
+    app.config.update(configuracion or {})
+    app.logger.info(f"Usando DATABASE_URL: {app.config['SQLALCHEMY_DATABASE_URI']}")
+
+    app.register_blueprint(rutas)
+    app.after_request(comprimir_respuesta)
+    difusor_predicciones.max_conexiones = app.config['MAX_CONEXIONES_EVENTOS']
+    if not trabajador_asincrono():
+        # Con hilos, cada flujo se recicla periódicamente para no retener un hilo indefinidamente
+        difusor_predicciones.duracion_maxima = DURACION_MAXIMA_FLUJO_SEGUNDOS
+        logger.warning(f"Trabajador WSGI con hilos: /eventos/predicciones admite {difusor_predicciones.max_conexiones} conexiones "
+                       f"simultáneas ({app.config['HILOS_WSGI']} hilos). Usar gunicorn -k gevent para más clientes en vivo.")
+    if app.config['DIRECTORIO_GRABACION_OPENMETEO']:
+        from src import data_fetcher
+        from src.grabacion_openmeteo import AdaptadorGrabacion
+        data_fetcher.configurar_transporte(AdaptadorGrabacion(app.config['DIRECTORIO_GRABACION_OPENMETEO'], app.config['RELOJ']))
+        logger.info(f"Grabando las respuestas de Open-Meteo en {app.config['DIRECTORIO_GRABACION_OPENMETEO']}")
+
+    logger.info("Iniciando aplicación de predicción de heladas...")
+    inicializar_aplicacion(app)
+    if app.config['PRECARGA_MODELO']:
+        # En segundo plano: la app atiende /salud/vivo mientras tanto. Se precargan todas las versiones en uso.
+        catalogo_modelos.precargar([VERSION_MODELO_PREDETERMINADA] + registro_estaciones.versiones_modelo())
+    return app
+
 if __name__ == '__main__':
-    # Solo inicializar la app en el proceso principal de Werkzeug o cuando no se usa el reloader
-    if os.environ.get("WERKZEUG_RUN_MAIN") == "true" or not app.debug:
-        logger.info("Iniciando aplicación de predicción de heladas...")
-        inicializar_aplicacion(app) # Pasar la instancia de la app Flask
+    depuracion = os.environ.get("FLASK_DEBUG", "True").lower() == "true"
+    # El recargador de Werkzeug arranca un segundo proceso que vuelve a crear la app; solo se activa a pedido.
+    recargador = os.environ.get("FLASK_RECARGADOR", "false").lower() == "true"
+    if recargador and depuracion and os.environ.get("WERKZEUG_RUN_MAIN") != "true":
+        # Proceso vigilante del recargador: no necesita base de datos ni modelo.
+        app = Flask(__name__)
+    else:
+        app = create_app()
     # El logger para el servidor Flask se mostrará igualmente, lo cual es útil.
     logger.info(f"Iniciando servidor Flask. Accede a la interfaz en http://{os.environ.get('FLASK_HOST', '0.0.0.0')}:{os.environ.get('FLASK_PORT', 5000)}")
     app.run(
         host=os.environ.get("FLASK_HOST", "0.0.0.0"),
         port=int(os.environ.get("FLASK_PORT", 5000)),
-        debug=(os.environ.get("FLASK_DEBUG", "True").lower() == "true")
+        debug=depuracion,
+        use_reloader=recargador
     )
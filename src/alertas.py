@@ -0,0 +1,496 @@
+# coding: utf-8
+"""
+Subsistema de alertas de helada.
+
+- Las suscripciones (tabla 'suscripciones_alerta') indican estación, intensidad mínima, canal y destino.
+- Cada (estación, noche, intensidad) se alerta una sola vez: la tabla 'alertas_emitidas' tiene una
+  restricción única sobre ese trío, de modo que dos pronósticos concurrentes no pueden duplicar el envío,
+  pero un pronóstico posterior más severo para la misma noche sí se alerta (escalamiento).
+- El DespachadorAlertas corre un bucle asyncio en un hilo propio. El camino de pronóstico solo encola
+  mensajes (operación no bloqueante); cada canal los agrupa en lotes, respeta su límite de tasa
+  (token bucket), reintenta con espera exponencial y lleva métricas de rendimiento.
+- Los canales son intercambiables: webhook, SMTP, pasarela SMS y un canal en memoria para pruebas locales.
+- validar_destino() comprueba el destino de una suscripción según su canal. Un webhook solo puede
+  apuntar a http/https de hosts públicos (no a la red interna ni a loopback); se vuelve a comprobar
+  al enviar, porque el DNS del host puede cambiar después de crear la suscripción.
+"""
+import abc
+import asyncio
+import datetime
+import ipaddress
+import logging
+import re
+import smtplib
+import socket
+import threading
+import time
+from dataclasses import dataclass, field
+from email.message import EmailMessage
+from urllib.parse import urlsplit
+
+import requests
+from sqlalchemy.exc import IntegrityError
+
+from database.models import AlertaEmitida, IntensidadHelada, ResultadoPrediccion, SuscripcionAlerta
+
+logger = logging.getLogger(__name__)
+
+# Orden de severidad para comparar con la intensidad mínima de cada suscripción.
+ORDEN_INTENSIDAD = {
+    IntensidadHelada.no_helada: 0,
+    IntensidadHelada.leve: 1,
+    IntensidadHelada.moderada: 2,
+    IntensidadHelada.fuerte: 3,
+}
+
+MAX_REINTENTOS = 5
+ESPERA_BASE_REINTENTO_SEGUNDOS = 1.0
+VENTANA_LOTE_SEGUNDOS = 0.05  # Tiempo máximo que un mensaje espera a que se complete su lote
+
+PATRON_CORREO = re.compile(r"[^@\s<>,;]+@[^@\s<>,;]+\.[A-Za-z]{2,}")
+PATRON_TELEFONO = re.compile(r"\+?[1-9]\d{7,14}") # E.164, con o sin '+'
+
+
+class DestinoNoPermitido(ValueError):
+    """El destino de una alerta no es válido para su canal o apunta a una dirección no pública."""
+
+
+def _verificar_host_publico(host, puerto):
+    """Lanza DestinoNoPermitido si alguna dirección del host es privada, loopback, link-local, reservada o multicast."""
+    try:
+        direcciones = {info[4][0] for info in socket.getaddrinfo(host, puerto, proto=socket.IPPROTO_TCP)}
+    except (socket.gaierror, UnicodeError) as e:
+        raise DestinoNoPermitido(f"No se pudo resolver el host '{host}': {e}")
+    for direccion in direcciones:
+        ip = ipaddress.ip_address(direccion.split('%', 1)[0])
+        if not ip.is_global or ip.is_multicast:
+            raise DestinoNoPermitido(f"El host '{host}' resuelve a una dirección no pública ({ip}).")
+
+
+def validar_destino(canal, destino):
+    """
+    Valida el destino de una suscripción según su canal.
+
+    Raises:
+        DestinoNoPermitido: Con el motivo, si el destino no es aceptable.
+    """
+    if not isinstance(destino, str) or not destino.strip():
+        raise DestinoNoPermitido("El destino está vacío.")
+    if canal == 'webhook':
+        partes = urlsplit(destino)
+        if partes.scheme not in ('http', 'https') or not partes.hostname:
+            raise DestinoNoPermitido("El webhook debe ser una URL http o https con host.")
+        if partes.username or partes.password:
+            raise DestinoNoPermitido("El webhook no puede incluir credenciales en la URL.")
+        try:
+            puerto = partes.port or (443 if partes.scheme == 'https' else 80)
+        except ValueError:
+            raise DestinoNoPermitido("Puerto inválido en la URL del webhook.")
+        _verificar_host_publico(partes.hostname, puerto)
+    elif canal == 'smtp':
+        if not PATRON_CORREO.fullmatch(destino):
+            raise DestinoNoPermitido("Correo electrónico inválido.")
+    elif canal == 'sms':
+        if not PATRON_TELEFONO.fullmatch(destino.replace(' ', '')):
+            raise DestinoNoPermitido("Teléfono inválido: usar formato internacional E.164 (p. ej. +51987654321).")
+
+
+@dataclass
+class MensajeAlerta:
+    canal: str
+    destino: str
+    asunto: str
+    cuerpo: str
+    datos: dict = field(default_factory=dict)
+    intentos: int = 0
+
+
+class LimitadorTasa:
+    """Token bucket asíncrono: como máximo `tasa_por_segundo` envíos sostenidos, ráfagas de `capacidad`."""
+
+    def __init__(self, tasa_por_segundo, capacidad=None):
+        self.tasa = float(tasa_por_segundo)
+        self.capacidad = float(capacidad or tasa_por_segundo)
+        self.fichas = self.capacidad
+        self.ultimo = time.monotonic()
+
+    async def adquirir(self, n=1):
+        n = min(n, self.capacidad)
+        while True:
+            ahora = time.monotonic()
+            self.fichas = min(self.capacidad, self.fichas + (ahora - self.ultimo) * self.tasa)
+            self.ultimo = ahora
+            if self.fichas >= n:
+                self.fichas -= n
+                return
+            await asyncio.sleep((n - self.fichas) / self.tasa)
+
+
+class CanalAlerta(abc.ABC):
+    """
+    Canal base (abstracto). Las subclases implementan `enviar_lote`, que recibe una lista de MensajeAlerta y devuelve
+    una lista del mismo largo con True (enviado) o la excepción del fallo de cada mensaje.
+    """
+    nombre = 'base'
+
+    def __init__(self, tasa_por_segundo=500, tamano_lote=100, trabajadores=4):
+        self.tamano_lote = tamano_lote
+        self.trabajadores = trabajadores
+        self.limitador = LimitadorTasa(tasa_por_segundo, capacidad=max(tasa_por_segundo, tamano_lote))
+
+    @abc.abstractmethod
+    async def enviar_lote(self, mensajes):
+        """Envía un lote; devuelve True o la excepción de cada mensaje, en el mismo orden."""
+
+
+class CanalWebhook(CanalAlerta):
+    """POST JSON a la URL de cada suscriptor; los envíos del lote se hacen en paralelo."""
+    nombre = 'webhook'
+
+    def __init__(self, timeout=5, **kwargs):
+        super().__init__(**kwargs)
+        self.timeout = timeout
+        self.sesion = requests.Session()
+
+    def _enviar(self, mensaje):
+        validar_destino(self.nombre, mensaje.destino)
+        # Sin redirecciones: una respuesta 3xx no debe llevar el POST hacia otro host (p. ej. uno interno)
+        respuesta = self.sesion.post(mensaje.destino, json={'asunto': mensaje.asunto, 'mensaje': mensaje.cuerpo, **mensaje.datos},
+                                     timeout=self.timeout, allow_redirects=False)
+        respuesta.raise_for_status()
+        return True
+
+    async def enviar_lote(self, mensajes):
+        return await asyncio.gather(*(asyncio.to_thread(self._enviar, m) for m in mensajes), return_exceptions=True)
+
+
+class CanalSMTP(CanalAlerta):
+    """Correo electrónico: una sola conexión SMTP por lote."""
+    nombre = 'smtp'
+
+    def __init__(self, host, puerto=587, usuario=None, clave=None, remitente=None, usar_tls=True, **kwargs):
+        super().__init__(**kwargs)
+        self.host, self.puerto = host, puerto
+        self.usuario, self.clave = usuario, clave
+        self.remitente = remitente or usuario
+        self.usar_tls = usar_tls
+
+    def _enviar_lote_sincrono(self, mensajes):
+        resultados = []
+        with smtplib.SMTP(self.host, self.puerto, timeout=10) as servidor:
+            if self.usar_tls:
+                servidor.starttls()
+            if self.usuario:
+                servidor.login(self.usuario, self.clave)
+            for mensaje in mensajes:
+                correo = EmailMessage()
+                correo['From'] = self.remitente
+                correo['To'] = mensaje.destino
+                correo['Subject'] = mensaje.asunto
+                correo.set_content(mensaje.cuerpo)
+                try:
+                    servidor.send_message(correo)
+                    resultados.append(True)
+                except smtplib.SMTPException as e:
+                    resultados.append(e)
+        return resultados
+
+    async def enviar_lote(self, mensajes):
+        try:
+            return await asyncio.to_thread(self._enviar_lote_sincrono, mensajes)
+        except Exception as e: # Falla de conexión: todo el lote se reintenta
+            return [e] * len(mensajes)
+
+
+class CanalSMS(CanalAlerta):
+    """Pasarela SMS HTTP con envío masivo: todo el lote en una sola petición."""
+    nombre = 'sms'
+
+    def __init__(self, url_pasarela, token=None, timeout=10, **kwargs):
+        super().__init__(**kwargs)
+        self.url_pasarela = url_pasarela
+        self.timeout = timeout
+        self.sesion = requests.Session()
+        if token:
+            self.sesion.headers['Authorization'] = f"Bearer {token}"
+
+    def _enviar_lote_sincrono(self, mensajes):
+        carga = {'mensajes': [{'destino': m.destino, 'texto': m.cuerpo} for m in mensajes]}
+        respuesta = self.sesion.post(self.url_pasarela, json=carga, timeout=self.timeout)
+        respuesta.raise_for_status()
+        return [True] * len(mensajes)
+
+    async def enviar_lote(self, mensajes):
+        try:
+            return await asyncio.to_thread(self._enviar_lote_sincrono, mensajes)
+        except Exception as e:
+            return [e] * len(mensajes)
+
+
+class CanalMemoria(CanalAlerta):
+    """Canal local para pruebas: guarda los mensajes enviados y puede simular fallos y latencia."""
+    nombre = 'memoria'
+
+    def __init__(self, fallar_cada=0, latencia_segundos=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.enviados = []
+        self.fallar_cada = fallar_cada
+        self.latencia_segundos = latencia_segundos
+        self._llamadas = 0
+
+    async def enviar_lote(self, mensajes):
+        if self.latencia_segundos:
+            await asyncio.sleep(self.latencia_segundos)
+        resultados = []
+        for mensaje in mensajes:
+            self._llamadas += 1
+            if self.fallar_cada and self._llamadas % self.fallar_cada == 0:
+                resultados.append(RuntimeError("Fallo simulado"))
+            else:
+                self.enviados.append(mensaje)
+                resultados.append(True)
+        return resultados
+
+
+class DespachadorAlertas:
+    """Despachador asíncrono por lotes con reintentos y métricas por canal, en un hilo propio."""
+
+    def __init__(self, canales, max_reintentos=MAX_REINTENTOS, espera_base=ESPERA_BASE_REINTENTO_SEGUNDOS, ventana_lote=VENTANA_LOTE_SEGUNDOS):
+        self.canales = {canal.nombre: canal for canal in canales}
+        self.max_reintentos = max_reintentos
+        self.espera_base = espera_base
+        self.ventana_lote = ventana_lote
+        self.no_entregados = [] # Mensajes que agotaron los reintentos
+        self._metricas = {nombre: {'encolados': 0, 'enviados': 0, 'fallidos': 0, 'reintentos': 0, 'descartados': 0,
+                                   'lotes': 0, 'segundos_envio': 0.0, 'primer_envio': None, 'ultimo_envio': None}
+                          for nombre in self.canales}
+        self._candado = threading.Lock()
+        self._candado_ciclo = threading.Lock() # Serializa iniciar/detener entre hilos del servidor
+        self._pendientes = 0
+        self._bucle = None
+        self._hilo = None
+        self._colas = {}
+
+    # --- Ciclo de vida ---
+    def iniciar(self):
+        """Arranca el hilo del bucle (idempotente y seguro entre hilos). Retorna cuando el bucle acepta mensajes."""
+        with self._candado_ciclo:
+            if self._bucle is not None:
+                return self
+            listo = threading.Event()
+            bucle = asyncio.new_event_loop()
+
+            def ejecutar():
+                asyncio.set_event_loop(bucle)
+                for nombre, canal in self.canales.items():
+                    self._colas[nombre] = asyncio.Queue()
+                    for _ in range(canal.trabajadores):
+                        bucle.create_task(self._trabajador(nombre))
+                bucle.call_soon(listo.set) # Las colas y los trabajadores ya existen cuando el bucle gira
+                bucle.run_forever()
+
+            hilo = threading.Thread(target=ejecutar, name='despachador-alertas', daemon=True)
+            hilo.start()
+            listo.wait()
+            # Solo se publica el bucle cuando está listo: otro hilo que lo vea distinto de None puede encolar.
+            self._hilo, self._bucle = hilo, bucle
+        logger.info(f"Despachador de alertas iniciado con canales: {list(self.canales)}")
+        return self
+
+    def detener(self):
+        with self._candado_ciclo:
+            if self._bucle is not None:
+                self._bucle.call_soon_threadsafe(self._bucle.stop)
+                self._hilo.join(timeout=5)
+                self._bucle = self._hilo = None
+
+    # --- API no bloqueante para el camino de pronóstico ---
+    def encolar(self, mensajes):
+        """Encola mensajes desde cualquier hilo y retorna de inmediato. Devuelve cuántos se aceptaron."""
+        self.iniciar()
+        bucle = self._bucle
+        aceptados = 0
+        for mensaje in mensajes:
+            if mensaje.canal not in self.canales:
+                logger.warning(f"Canal de alerta no configurado: '{mensaje.canal}'. Mensaje para {mensaje.destino} descartado.")
+                continue
+            with self._candado:
+                self._pendientes += 1
+                self._metricas[mensaje.canal]['encolados'] += 1
+            bucle.call_soon_threadsafe(self._colas[mensaje.canal].put_nowait, mensaje)
+            aceptados += 1
+        return aceptados
+
+    def esperar_pendientes(self, timeout=30.0):
+        """Bloquea hasta que todos los mensajes se entreguen o descarten (útil en pruebas y reproducciones)."""
+        limite = time.monotonic() + timeout
+        while time.monotonic() < limite:
+            with self._candado:
+                if self._pendientes == 0:
+                    return True
+            time.sleep(0.01)
+        return False
+
+    def metricas(self):
+        """Copia de las métricas por canal, con el rendimiento (mensajes/s) calculado."""
+        with self._candado:
+            resultado = {}
+            for nombre, m in self._metricas.items():
+                m = dict(m)
+                duracion = (m['ultimo_envio'] - m['primer_envio']) if m['primer_envio'] is not None else 0.0
+                m['mensajes_por_segundo'] = round(m['enviados'] / duracion, 2) if duracion > 0 else None
+                m['segundos_envio'] = round(m['segundos_envio'], 4)
+                m.pop('primer_envio')
+                m.pop('ultimo_envio')
+                resultado[nombre] = m
+            resultado['pendientes'] = self._pendientes
+            return resultado
+
+    # --- Internos (se ejecutan en el bucle asyncio) ---
+    async def _tomar_lote(self, cola, tamano):
+        lote = [await cola.get()]
+        limite = time.monotonic() + self.ventana_lote
+        while len(lote) < tamano:
+            try:
+                lote.append(cola.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                lote.append(await asyncio.wait_for(cola.get(), restante))
+            except asyncio.TimeoutError:
+                break
+        return lote
+
+    async def _trabajador(self, nombre):
+        canal = self.canales[nombre]
+        cola = self._colas[nombre]
+        while True:
+            lote = await self._tomar_lote(cola, canal.tamano_lote)
+            await canal.limitador.adquirir(len(lote))
+            inicio = time.monotonic()
+            try:
+                resultados = await canal.enviar_lote(lote)
+            except Exception as e:
+                resultados = [e] * len(lote)
+            fin = time.monotonic()
+
+            exitosos = 0
+            for mensaje, resultado in zip(lote, resultados):
+                if resultado is True:
+                    exitosos += 1
+                else:
+                    self._reprogramar(mensaje, resultado)
+            with self._candado:
+                m = self._metricas[nombre]
+                m['lotes'] += 1
+                m['enviados'] += exitosos
+                m['fallidos'] += len(lote) - exitosos
+                m['segundos_envio'] += fin - inicio
+                m['primer_envio'] = inicio if m['primer_envio'] is None else m['primer_envio']
+                m['ultimo_envio'] = fin
+                self._pendientes -= exitosos
+
+    def _reprogramar(self, mensaje, error):
+        mensaje.intentos += 1
+        if mensaje.intentos > self.max_reintentos:
+            logger.error(f"Alerta a {mensaje.destino} por '{mensaje.canal}' descartada tras {self.max_reintentos} reintentos: {error}")
+            with self._candado:
+                self._metricas[mensaje.canal]['descartados'] += 1
+                self._pendientes -= 1
+            self.no_entregados.append(mensaje)
+            return
+        with self._candado:
+            self._metricas[mensaje.canal]['reintentos'] += 1
+        espera = self.espera_base * 2 ** (mensaje.intentos - 1)
+        self._bucle.call_later(espera, self._colas[mensaje.canal].put_nowait, mensaje)
+
+
+def construir_mensajes(prediccion, suscripciones):
+    """Un MensajeAlerta por suscripción para la predicción dada."""
+    asunto = f"Alerta de helada {prediccion.intensidad.value} - {prediccion.ubicacion}"
+    cuerpo = (
+        f"Helada {prediccion.resultado.value.lower()} para la madrugada del "
+        f"{prediccion.fecha_prediccion_para:%d/%m/%Y} en {prediccion.ubicacion}. "
+        f"Intensidad: {prediccion.intensidad.value}. Probabilidad: {prediccion.probabilidad_helada:.0%}."
+    )
+    if prediccion.temperatura_minima_prevista is not None:
+        cuerpo += f" Temperatura prevista: {prediccion.temperatura_minima_prevista:.1f} °C."
+    datos = {
+        'prediccion_id': prediccion.id,
+        'estacion': prediccion.ubicacion,
+        'fecha_prediccion_para': prediccion.fecha_prediccion_para.isoformat(),
+        'intensidad': prediccion.intensidad.value,
+        'probabilidad_helada': prediccion.probabilidad_helada,
+    }
+    return [MensajeAlerta(canal=s.canal, destino=s.destino, asunto=asunto, cuerpo=cuerpo, datos=datos) for s in suscripciones]
+
+
+def procesar_alertas_prediccion(db_session, prediccion, despachador, ahora=None):
+    """
+    Registra y encola las alertas de una predicción recién guardada, si corresponde.
+
+    Solo se alertan predicciones 'Probable'. La (estación, noche, intensidad) se reserva insertando en
+    'alertas_emitidas'; si ya existía, no se vuelve a alertar. Una intensidad mayor para la misma noche
+    es una reserva distinta y se alerta a las suscripciones que cubre. Si el encolado falla o no acepta
+    ningún mensaje, la reserva se elimina para que el siguiente pronóstico de esa noche vuelva a intentarlo.
+
+    Args:
+        ahora (datetime.datetime, opcional): Instante UTC sin zona registrado como emisión de la alerta
+                                             (el reloj de la aplicación); por defecto, el actual.
+
+    Returns:
+        int: Número de mensajes encolados.
+    """
+    if prediccion.resultado != ResultadoPrediccion.probable or prediccion.intensidad is None:
+        return 0
+    severidad = ORDEN_INTENSIDAD.get(prediccion.intensidad, 0)
+    intensidades_cubiertas = [i for i, orden in ORDEN_INTENSIDAD.items() if 0 < orden <= severidad]
+    suscripciones = db_session.query(SuscripcionAlerta).filter(
+        SuscripcionAlerta.estacion == prediccion.ubicacion,
+        SuscripcionAlerta.activa.is_(True),
+        SuscripcionAlerta.intensidad_minima.in_(intensidades_cubiertas),
+    ).all()
+    if not suscripciones:
+        return 0
+
+    alerta = AlertaEmitida(
+        estacion=prediccion.ubicacion,
+        noche=prediccion.fecha_prediccion_para.date(),
+        prediccion_id=prediccion.id,
+        intensidad=prediccion.intensidad,
+        destinatarios=len(suscripciones),
+        fecha_emision=ahora or datetime.datetime.utcnow(),
+    )
+    db_session.add(alerta)
+    try:
+        db_session.commit()
+    except IntegrityError:
+        db_session.rollback()
+        logger.info(f"Alerta {prediccion.intensidad.value} para {prediccion.ubicacion} la noche del {alerta.noche} ya emitida; no se duplica.")
+        return 0
+
+    try:
+        encolados = despachador.encolar(construir_mensajes(prediccion, suscripciones))
+    except Exception:
+        _liberar_reserva(db_session, alerta)
+        raise
+    if encolados == 0:
+        _liberar_reserva(db_session, alerta)
+        logger.warning(f"Ningún canal aceptó la alerta de {prediccion.ubicacion} la noche del {alerta.noche}; reserva liberada.")
+        return 0
+    logger.info(f"Alerta de helada {prediccion.intensidad.value} encolada para {encolados} suscriptores de {prediccion.ubicacion}.")
+    return encolados
+
+
+def _liberar_reserva(db_session, alerta):
+    """Elimina la reserva de una alerta que no llegó a encolarse."""
+    try:
+        db_session.delete(alerta)
+        db_session.commit()
+    except Exception as e:
+        db_session.rollback()
+        logger.error(f"No se pudo liberar la reserva de alerta de {alerta.estacion} la noche del {alerta.noche}: {e}")
@@ -0,0 +1,288 @@
+# coding: utf-8
+"""
+Almacén columnar, de solo anexado, para las series horarias crudas (observaciones y pronósticos)
+por estación y hora de emisión del pronóstico.
+
+Organización en disco:
+
+    <raiz>/<codigo_estacion>/<AAAA-MM>/emision_<AAAAMMDDTHHMM>.npz
+    <raiz>/<codigo_estacion>/<AAAA-MM>/compactado.npz
+
+- Cada archivo de emisión contiene, para una estación, un mes de 'valid_time' y una emisión, los arreglos
+  tipados 'valid_time' (datetime64[s]) y una columna float32 por variable, comprimidos con np.savez_compressed.
+- La clave de deduplicación es (estacion, valid_time, issue_time): la estación y el mes están en la ruta,
+  la emisión en el nombre del archivo, y dentro de cada archivo 'valid_time' es único. Volver a anexar la
+  misma emisión fusiona las filas, con prioridad para las nuevas.
+- Con emisiones horarias un mes acumula cientos de archivos por estación. Cuando un mes queda cerrado
+  (DIAS_GRACIA_COMPACTACION después de su fin ya no recibe emisiones), anexar lo compacta en un único
+  'compactado.npz' que guarda además el arreglo 'emision', y borra los archivos de emisión.
+- Las lecturas por rango solo abren las particiones de los meses involucrados.
+
+Todas las horas se guardan en UTC sin zona: 'valid_time' se convierte desde la zona horaria de la estación
+(Open-Meteo entrega hora local) y la emisión es el instante UTC de la descarga, truncado a la hora. Así el
+corte 'emitido_hasta' de leer_rango compara instantes del mismo reloj. Los límites de lectura con zona se
+convierten a UTC; los que no tienen zona se interpretan como UTC.
+"""
+import datetime
+import logging
+import os
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+PREFIJO_ARCHIVO = "emision_"
+FORMATO_EMISION = "%Y%m%dT%H%M"
+NOMBRE_COMPACTADO = "compactado.npz"
+COLUMNA_TIEMPO = 'time'
+COLUMNA_EMISION = 'emision'
+DIAS_GRACIA_COMPACTACION = 7 # Un mes se compacta cuando ya no entra en el horizonte de las emisiones nuevas
+PATRON_CODIGO_ESTACION = re.compile(r'^[a-z0-9_\-]{1,64}$') # El mismo que valida el registro de estaciones
+
+
+def _directorio_estacion(codigo):
+    """El código de la estación (único y estable, a diferencia del nombre) es el nombre de su directorio."""
+    if not PATRON_CODIGO_ESTACION.match(str(codigo)):
+        raise ValueError(f"Código de estación inválido: {codigo!r}")
+    return str(codigo)
+
+
+def _es_archivo_emision(nombre):
+    return nombre.startswith(PREFIJO_ARCHIVO) and nombre.endswith('.npz') and not nombre.endswith('.tmp.npz')
+
+
+def _emision_del_archivo(nombre):
+    return np.datetime64(datetime.datetime.strptime(nombre[len(PREFIJO_ARCHIVO):-len('.npz')], FORMATO_EMISION), 's')
+
+
+def _a_datetime64_utc(valores, zona_horaria=None):
+    """
+    Convierte a datetime64[s] UTC sin zona. Valores con zona se convierten; valores sin zona se interpretan
+    en zona_horaria (p. ej. la hora local de Open-Meteo) o, si no se indica, como UTC.
+    """
+    tiempos = pd.DatetimeIndex(pd.to_datetime(valores))
+    if tiempos.tz is None and zona_horaria:
+        tiempos = tiempos.tz_localize(zona_horaria, ambiguous='NaT', nonexistent='shift_forward')
+    if tiempos.tz is not None:
+        tiempos = tiempos.tz_convert('UTC').tz_localize(None)
+    return tiempos.values.astype('datetime64[s]')
+
+
+def _instante_utc(instante):
+    """pandas.Timestamp UTC sin zona de un instante con zona (convertido) o sin ella (ya UTC)."""
+    instante = pd.Timestamp(instante)
+    if instante.tzinfo is not None:
+        instante = instante.tz_convert('UTC').tz_localize(None)
+    return instante
+
+
+class AlmacenSeriesHorarias:
+    """Almacén de series horarias particionado por estación (código) y mes."""
+
+    def __init__(self, ruta_raiz, dias_gracia_compactacion=DIAS_GRACIA_COMPACTACION):
+        self.ruta_raiz = ruta_raiz
+        self.dias_gracia_compactacion = dias_gracia_compactacion
+        self._candado_compactacion = threading.Lock()
+
+    def _ruta_particion(self, estacion, mes):
+        return os.path.join(self.ruta_raiz, _directorio_estacion(estacion), mes)
+
+    def anexar(self, estacion, df, emision, columnas=None, zona_horaria=None):
+        """
+        Anexa las filas horarias de una emisión de pronóstico (u observación).
+
+        Args:
+            estacion (str): Código de la estación.
+            df (pandas.DataFrame): Datos con la columna 'time' y las variables a guardar.
+            emision (datetime.datetime): Instante de emisión, con zona o en UTC sin zona. Se trunca a la hora:
+                                         descargas repetidas dentro de la misma hora se fusionan en una emisión.
+            columnas (list, opcional): Variables a guardar; por defecto todas las numéricas salvo 'time'.
+            zona_horaria (str, opcional): Zona IANA de las horas sin zona de 'time'; por defecto, UTC.
+
+        Returns:
+            int: Número de filas escritas.
+        """
+        if df is None or df.empty:
+            return 0
+        columnas = columnas or [c for c in df.columns if c != COLUMNA_TIEMPO and pd.api.types.is_numeric_dtype(df[c])]
+        tiempos = _a_datetime64_utc(df[COLUMNA_TIEMPO], zona_horaria)
+        validos = ~np.isnat(tiempos) # Horas ambiguas del cambio de horario: no tienen un instante único
+        tiempos = tiempos[validos]
+        valores = {c: pd.to_numeric(df[c], errors='coerce').to_numpy(dtype=np.float32)[validos] for c in columnas}
+        sufijo_emision = _instante_utc(emision).floor('h').strftime(FORMATO_EMISION)
+
+        meses = tiempos.astype('datetime64[M]')
+        escritas = 0
+        for mes in np.unique(meses):
+            en_mes = meses == mes
+            ruta_particion = self._ruta_particion(estacion, str(mes))
+            os.makedirs(ruta_particion, exist_ok=True)
+            ruta_archivo = os.path.join(ruta_particion, f"{PREFIJO_ARCHIVO}{sufijo_emision}.npz")
+
+            tiempos_mes = tiempos[en_mes]
+            columnas_mes = {c: v[en_mes] for c, v in valores.items()}
+            if os.path.exists(ruta_archivo):
+                # Misma estación, mes y emisión: se fusiona conservando las filas nuevas ante duplicados.
+                with np.load(ruta_archivo) as existente:
+                    tiempos_mes = np.concatenate([tiempos_mes, existente['valid_time']])
+                    for c in set(columnas_mes) | (set(existente.files) - {'valid_time'}):
+                        nuevos = columnas_mes.get(c, np.full(en_mes.sum(), np.nan, dtype=np.float32))
+                        previos = existente[c] if c in existente.files else np.full(len(existente['valid_time']), np.nan, dtype=np.float32)
+                        columnas_mes[c] = np.concatenate([nuevos, previos])
+            # np.unique devuelve la primera aparición de cada valid_time: las filas nuevas van primero.
+            tiempos_mes, primeros = np.unique(tiempos_mes, return_index=True)
+            columnas_mes = {c: v[primeros] for c, v in columnas_mes.items()}
+
+            ruta_temporal = ruta_archivo + ".tmp.npz"
+            np.savez_compressed(ruta_temporal, valid_time=tiempos_mes, **columnas_mes)
+            os.replace(ruta_temporal, ruta_archivo) # Escritura atómica: los lectores nunca ven archivos a medias
+            escritas += int(en_mes.sum())
+
+        self.compactar(estacion, antes_de=_instante_utc(emision) - pd.Timedelta(days=self.dias_gracia_compactacion))
+        return escritas
+
+    def compactar(self, estacion, antes_de):
+        """
+        Fusiona los archivos de emisión de cada mes terminado antes de 'antes_de' en el 'compactado.npz'
+        del mes, y borra esos archivos. Ante la misma (valid_time, emisión), el archivo de emisión prevalece.
+
+        Returns:
+            int: Número de archivos de emisión compactados.
+        """
+        ruta_estacion = os.path.join(self.ruta_raiz, _directorio_estacion(estacion))
+        if not os.path.isdir(ruta_estacion):
+            return 0
+        mes_limite = np.datetime64(_instante_utc(antes_de).to_datetime64(), 'M') # Meses anteriores a este ya terminaron
+        compactados = 0
+        with self._candado_compactacion:
+            for mes in sorted(os.listdir(ruta_estacion)):
+                try:
+                    if np.datetime64(mes, 'M') >= mes_limite:
+                        continue
+                except ValueError:
+                    continue
+                ruta_mes = os.path.join(ruta_estacion, mes)
+                nombres = sorted(n for n in os.listdir(ruta_mes) if _es_archivo_emision(n))
+                if nombres:
+                    compactados += self._compactar_mes(ruta_mes, nombres)
+        return compactados
+
+    def _compactar_mes(self, ruta_mes, nombres):
+        ruta_compactado = os.path.join(ruta_mes, NOMBRE_COMPACTADO)
+        partes, estados = [], {}
+        for nombre in nombres:
+            ruta_archivo = os.path.join(ruta_mes, nombre)
+            estados[ruta_archivo] = os.stat(ruta_archivo).st_mtime_ns
+            with np.load(ruta_archivo) as datos:
+                parte = {c: datos[c] for c in datos.files}
+            parte['emision'] = np.full(len(parte['valid_time']), _emision_del_archivo(nombre))
+            partes.append(parte)
+        if os.path.exists(ruta_compactado):
+            with np.load(ruta_compactado) as datos:
+                partes.append({c: datos[c] for c in datos.files}) # Al final: pierde ante los archivos de emisión
+
+        columnas = sorted(set().union(*partes) - {'valid_time', 'emision'})
+        tiempos = np.concatenate([p['valid_time'] for p in partes])
+        emisiones = np.concatenate([p['emision'] for p in partes])
+        valores = {c: np.concatenate([p.get(c, np.full(len(p['valid_time']), np.nan, dtype=np.float32)) for p in partes])
+                   for c in columnas}
+        # Orden estable por (valid_time, emisión) y una fila por clave: la primera aparición.
+        orden = np.lexsort((emisiones, tiempos))
+        primeros = np.ones(len(orden), dtype=bool)
+        primeros[1:] = (np.diff(tiempos[orden].astype(np.int64)) != 0) | (np.diff(emisiones[orden].astype(np.int64)) != 0)
+        primeros = orden[primeros]
+        ruta_temporal = ruta_compactado + ".tmp.npz"
+        np.savez_compressed(ruta_temporal, valid_time=tiempos[primeros], emision=emisiones[primeros],
+                            **{c: v[primeros] for c, v in valores.items()})
+        os.replace(ruta_temporal, ruta_compactado)
+
+        for ruta_archivo, mtime in estados.items():
+            # Un archivo reescrito mientras se compactaba se conserva: su versión nueva se fusionará la próxima vez.
+            if os.stat(ruta_archivo).st_mtime_ns == mtime:
+                os.remove(ruta_archivo)
+        logger.info(f"Mes {ruta_mes} compactado: {len(nombres)} archivos de emisión fusionados en {NOMBRE_COMPACTADO}.")
+        return len(nombres)
+
+    def _archivos_en_rango(self, estacion, desde, hasta):
+        ruta_estacion = os.path.join(self.ruta_raiz, _directorio_estacion(estacion))
+        if not os.path.isdir(ruta_estacion):
+            return []
+        mes_desde = np.datetime64(pd.Timestamp(desde).to_datetime64(), 'M') if desde is not None else None
+        mes_hasta = np.datetime64(pd.Timestamp(hasta).to_datetime64(), 'M') if hasta is not None else None
+        archivos = []
+        for mes in sorted(os.listdir(ruta_estacion)):
+            try:
+                mes_particion = np.datetime64(mes, 'M')
+            except ValueError:
+                continue
+            if (mes_desde is not None and mes_particion < mes_desde) or (mes_hasta is not None and mes_particion > mes_hasta):
+                continue
+            ruta_mes = os.path.join(ruta_estacion, mes)
+            nombres = os.listdir(ruta_mes)
+            # El compactado va antes que los archivos de emisión del mismo mes, que prevalecen ante duplicados.
+            if NOMBRE_COMPACTADO in nombres:
+                archivos.append(os.path.join(ruta_mes, NOMBRE_COMPACTADO))
+            archivos.extend(os.path.join(ruta_mes, nombre) for nombre in sorted(nombres) if _es_archivo_emision(nombre))
+        return archivos
+
+    def leer_rango(self, estacion, desde=None, hasta=None, emitido_hasta=None, solo_ultima_emision=True):
+        """
+        Lectura por rango de 'valid_time' (inclusive) de una estación.
+
+        Args:
+            estacion (str): Código de la estación.
+            desde, hasta (datetime, opcional): Límites del rango de horas válidas (con zona, o UTC sin zona).
+            emitido_hasta (datetime, opcional): Ignora emisiones posteriores (re-pronóstico sin fuga de información).
+            solo_ultima_emision (bool): Si es True, deja una fila por hora válida (la emisión más reciente).
+
+        Returns:
+            pandas.DataFrame: Columnas 'time' y 'emision' (UTC sin zona) y las variables guardadas, ordenado por
+                              tiempo y emisión.
+        """
+        desde = _instante_utc(desde) if desde is not None else None
+        hasta = _instante_utc(hasta) if hasta is not None else None
+        desde64 = np.datetime64(desde.to_datetime64(), 's') if desde is not None else None
+        hasta64 = np.datetime64(hasta.to_datetime64(), 's') if hasta is not None else None
+        emitido_hasta = _instante_utc(emitido_hasta) if emitido_hasta is not None else None
+        emitido_hasta64 = np.datetime64(emitido_hasta.to_datetime64(), 's') if emitido_hasta is not None else None
+
+        partes = []
+        for ruta_archivo in self._archivos_en_rango(estacion, desde, hasta):
+            nombre = os.path.basename(ruta_archivo)
+            emision = None if nombre == NOMBRE_COMPACTADO else _emision_del_archivo(nombre)
+            if emision is not None and emitido_hasta64 is not None and emision > emitido_hasta64:
+                continue
+            with np.load(ruta_archivo) as datos:
+                tiempos = datos['valid_time']
+                emisiones = datos['emision'] if emision is None else np.full(len(tiempos), emision)
+                mascara = np.ones(len(tiempos), dtype=bool)
+                if desde64 is not None:
+                    mascara &= tiempos >= desde64
+                if hasta64 is not None:
+                    mascara &= tiempos <= hasta64
+                if emitido_hasta64 is not None:
+                    mascara &= emisiones <= emitido_hasta64
+                if not mascara.any():
+                    continue
+                parte = {COLUMNA_TIEMPO: tiempos[mascara], COLUMNA_EMISION: emisiones[mascara]}
+                parte.update({c: datos[c][mascara] for c in datos.files if c not in ('valid_time', 'emision')})
+            partes.append(pd.DataFrame(parte))
+
+        if not partes:
+            return pd.DataFrame(columns=[COLUMNA_TIEMPO, COLUMNA_EMISION])
+        df = pd.concat(partes, ignore_index=True).sort_values([COLUMNA_TIEMPO, COLUMNA_EMISION], kind='stable')
+        # Una emisión re-anexada después de compactar su mes está en ambos lados: prevalece la del archivo de emisión.
+        df = df.drop_duplicates(subset=[COLUMNA_TIEMPO, COLUMNA_EMISION], keep='last')
+        if solo_ultima_emision:
+            df = df.drop_duplicates(subset=[COLUMNA_TIEMPO], keep='last')
+        columnas = [COLUMNA_TIEMPO, COLUMNA_EMISION] + [c for c in df.columns if c not in (COLUMNA_TIEMPO, COLUMNA_EMISION)]
+        return df[columnas].reset_index(drop=True)
+
+    def estaciones(self):
+        """Códigos de las estaciones con datos en el almacén."""
+        if not os.path.isdir(self.ruta_raiz):
+            return []
+        return sorted(d for d in os.listdir(self.ruta_raiz) if os.path.isdir(os.path.join(self.ruta_raiz, d)))
@@ -1,8 +1,19 @@
 # coding: utf-8
+import argparse
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 import joblib
 import os
+from sklearn.inspection import permutation_importance
+
+try:
+    from src.especificacion_features import COLUMNAS_MODELO, FUENTE_MODELO, transformar_features
+    from src.explicabilidad import construir_tabla_contribuciones, calcular_contribuciones
+    from src.reportes_graficos import calcular_huella, graficar_barras_horizontales, graficar_distribuciones
+except ImportError:  # Ejecución directa desde src/
+    from especificacion_features import COLUMNAS_MODELO, FUENTE_MODELO, transformar_features
+    from explicabilidad import construir_tabla_contribuciones, calcular_contribuciones
+    from reportes_graficos import calcular_huella, graficar_barras_horizontales, graficar_distribuciones
 
 # --- Configuración de Rutas ---
 RUTA_BASE = "../" # Ajustar si es necesario para que las rutas relativas funcionen desde src/
@@ -21,14 +32,27 @@ NOMBRE_MODELO_PKL = "modelo_arbol_decision.pkl"
 # El archivo 'datos_prueba_importancia.csv' fue el 'test.csv' original.
 NOMBRE_DATOS_PARA_ANALISIS = "datos_prueba_importancia.csv"
 # Estas deben ser las mismas columnas usadas para entrenar el modelo cargado.
-COLUMNAS_FEATURES = ['Temperatura', 'HumedadRelativa', 'PresionAtmosferica', 'HumedadSuelo']
+COLUMNAS_FEATURES = COLUMNAS_MODELO # Definidas (con unidades y rangos) en especificacion_features.py
+COLUMNA_TARGET = 'HeladaSuelo'
 NOMBRE_GRAFICA_IMPORTANCIA = "importancia_variables.png"
 
-def analizar_importancia_de_variables():
+# --- Constantes de Importancia por Permutación y Contribuciones ---
+N_REPETICIONES_PERMUTACION = 30
+SEMILLA_PERMUTACION = 42
+N_TRABAJOS_PARALELOS = -1 # -1 usa todos los núcleos disponibles
+METRICA_PERMUTACION = 'f1'
+NOMBRE_IMPORTANCIA_PERMUTACION_CSV = "importancia_permutacion.csv"
+NOMBRE_CONTRIBUCIONES_CSV = "contribuciones_por_fila.csv"
+NOMBRE_RESUMEN_IMPORTANCIAS_CSV = "resumen_importancias.csv"
+NOMBRE_GRAFICA_PERMUTACION = "importancia_permutacion.png"
+NOMBRE_GRAFICA_CONTRIBUCIONES = "contribuciones_por_fila.png"
+
+def analizar_importancia_de_variables(generar_graficas=True):
     """
-    Carga un modelo de árbol de decisión entrenado,
-    calcula y grafica la importancia de las variables.
-    Guarda la gráfica en la carpeta de resultados.
+    Carga un modelo de árbol de decisión entrenado y los datos de prueba reservados,
+    calcula la importancia de las variables por impureza, por permutación (repetida en paralelo)
+    y por contribuciones exactas del camino del árbol para cada fila.
+    Exporta las distribuciones por variable a CSV y las grafica en la carpeta de resultados.
     """
     print("--- Iniciando Análisis de Importancia de Variables ---")
 
@@ -44,20 +68,23 @@ def analizar_importancia_de_variables():
         print(f"Error al cargar el modelo: {e}")
         return
 
-    # 2. Cargar el CSV con los datos (solo para obtener los nombres de las features si es necesario, el modelo ya está entrenado)
-    # ruta_csv_datos = os.path.join(RUTA_DATOS_PROCESADOS, NOMBRE_DATOS_PARA_ANALISIS)
-    # try:
-    #     df_datos = pd.read_csv(ruta_csv_datos)
-    #     print(f"Datos para nombres de features (si es necesario) cargados desde: {ruta_csv_datos}")
-    # except FileNotFoundError:
-    #     print(f"Error: No se encontró el archivo de datos en {ruta_csv_datos}")
-    #     return
-    # except Exception as e:
-    #     print(f"Error al cargar los datos para nombres de features: {e}")
-    #     return
-
-    # if not all(columna in df_datos.columns for columna in COLUMNAS_FEATURES):
-    #     print(f"Advertencia: No todas las columnas {COLUMNAS_FEATURES} se encuentran en {ruta_csv_datos}.")
+    # 2. Cargar el CSV con los datos de prueba reservados
+    ruta_csv_datos = os.path.join(RUTA_DATOS_PROCESADOS, NOMBRE_DATOS_PARA_ANALISIS)
+    try:
+        df_datos = pd.read_csv(ruta_csv_datos)
+        print(f"Datos para el análisis cargados desde: {ruta_csv_datos}")
+    except FileNotFoundError:
+        print(f"Error: No se encontró el archivo de datos en {ruta_csv_datos}")
+        return
+    except Exception as e:
+        print(f"Error al cargar los datos para el análisis: {e}")
+        return
+
+    if not all(columna in df_datos.columns for columna in COLUMNAS_FEATURES):
+        print(f"Error: No todas las columnas {COLUMNAS_FEATURES} se encuentran en {ruta_csv_datos}.")
+        return
+    df_datos = transformar_features(df_datos, fuente=FUENTE_MODELO, limite_interpolacion=0).dropna(subset=COLUMNAS_FEATURES)
+    X_datos = df_datos[COLUMNAS_FEATURES]
 
     # 3. Obtener importancias de las variables desde el modelo
     try:
@@ -97,30 +124,109 @@ def analizar_importancia_de_variables():
         'Importancia': importancias
     }).sort_values(by='Importancia', ascending=False)
 
-    print("\n--- Importancia de Variables ---")
+    print("\n--- Importancia de Variables (impureza) ---")
     print(df_importancias.to_string(index=False, float_format='{:,.4f}'.format))
 
-    # 5. Graficar y guardar la importancia de variables
-    plt.figure(figsize=(12, 8))
-    plt.barh(df_importancias['Variable'], df_importancias['Importancia'], color='lightcoral')
-    plt.xlabel('Importancia Relativa')
-    plt.ylabel('Variable Meteorológica')
-    plt.title('Importancia de las Variables en la Predicción de Heladas (Árbol de Decisión)')
-    plt.gca().invert_yaxis()
-    plt.grid(True, axis='x', linestyle=':', alpha=0.7)
-    plt.tight_layout()
-
-    ruta_guardado_grafica = os.path.join(RUTA_GRAFICAS, NOMBRE_GRAFICA_IMPORTANCIA)
+    # 4.1 Importancia por permutación sobre los datos reservados, repetida con distintas permutaciones en paralelo
+    if COLUMNA_TARGET in df_datos.columns:
+        y_referencia = df_datos[COLUMNA_TARGET]
+    else:
+        # 'datos_prueba_importancia.csv' no trae la variable objetivo: se mide la pérdida de fidelidad
+        # respecto a las predicciones del propio modelo sobre los datos sin permutar.
+        print(f"Advertencia: '{COLUMNA_TARGET}' no está en {ruta_csv_datos}. Se usan las predicciones del modelo como referencia.")
+        y_referencia = modelo.predict(X_datos)
+
+    print(f"\nCalculando importancia por permutación ({N_REPETICIONES_PERMUTACION} repeticiones, métrica '{METRICA_PERMUTACION}')...")
+    resultado_permutacion = permutation_importance(
+        modelo, X_datos, y_referencia,
+        scoring=METRICA_PERMUTACION,
+        n_repeats=N_REPETICIONES_PERMUTACION,
+        random_state=SEMILLA_PERMUTACION,
+        n_jobs=N_TRABAJOS_PARALELOS
+    )
+    # importances tiene forma (variables x repeticiones): se exporta en formato largo para conservar la distribución
+    df_permutacion = pd.DataFrame(resultado_permutacion.importances.T, columns=COLUMNAS_FEATURES)
+    df_permutacion.index.name = 'Repeticion'
+    df_permutacion_largo = df_permutacion.reset_index().melt(id_vars='Repeticion', var_name='Variable', value_name='Disminucion_metrica')
+
+    # 4.2 Contribuciones exactas por camino del árbol para cada fila (una sola multiplicación dispersa)
     try:
-        plt.savefig(ruta_guardado_grafica)
-        print(f"Gráfica de importancia de variables guardada en: {ruta_guardado_grafica}")
-    except Exception as e:
-        print(f"Error al guardar la gráfica: {e}")
-
-    # plt.show() # Descomentar si se desea mostrar interactivamente al ejecutar el script
-    plt.close() # Cerrar la figura para liberar memoria
+        valor_base, contribuciones = calcular_contribuciones(modelo, X_datos, construir_tabla_contribuciones(modelo))
+    except TypeError as e:
+        print(f"Advertencia: No se pueden calcular contribuciones por camino: {e}")
+        valor_base, contribuciones = None, None
+
+    df_resumen = pd.DataFrame({
+        'Variable': COLUMNAS_FEATURES,
+        'Importancia_impureza': pd.Series(importancias, index=nombres_variables).reindex(COLUMNAS_FEATURES).values,
+        'Permutacion_media': resultado_permutacion.importances_mean,
+        'Permutacion_desviacion': resultado_permutacion.importances_std,
+    })
+    if contribuciones is not None:
+        df_contribuciones = pd.DataFrame(contribuciones, columns=COLUMNAS_FEATURES)
+        df_contribuciones['ValorBase'] = valor_base
+        df_contribuciones['ProbabilidadHelada'] = valor_base + contribuciones.sum(axis=1)
+        df_resumen['Contribucion_abs_media'] = np.abs(contribuciones).mean(axis=0)
+
+    print("\n--- Resumen de Importancias ---")
+    print(df_resumen.to_string(index=False, float_format='{:,.4f}'.format))
+
+    for nombre_csv, df_exportar, con_indice in (
+        (NOMBRE_IMPORTANCIA_PERMUTACION_CSV, df_permutacion_largo, False),
+        (NOMBRE_RESUMEN_IMPORTANCIAS_CSV, df_resumen, False),
+        (NOMBRE_CONTRIBUCIONES_CSV, df_contribuciones if contribuciones is not None else None, True),
+    ):
+        if df_exportar is None:
+            continue
+        ruta_csv = os.path.join(RUTA_RESULTADOS_EVALUACION, nombre_csv)
+        try:
+            df_exportar.to_csv(ruta_csv, index=con_indice, index_label='Fila' if con_indice else None, float_format='%.6f')
+            print(f"Resultados exportados a: {ruta_csv}")
+        except Exception as e:
+            print(f"Error al exportar {nombre_csv}: {e}")
+
+    # 5. Graficar importancias y distribuciones por variable (etapa opcional; matplotlib se importa solo aquí)
+    if generar_graficas:
+        huella = calcular_huella(
+            [ruta_modelo_pkl, ruta_csv_datos],
+            parametros=(COLUMNAS_FEATURES, N_REPETICIONES_PERMUTACION, SEMILLA_PERMUTACION, METRICA_PERMUTACION)
+        )
+        try:
+            ruta_guardado_grafica = os.path.join(RUTA_GRAFICAS, NOMBRE_GRAFICA_IMPORTANCIA)
+            if graficar_barras_horizontales(
+                df_importancias['Variable'], df_importancias['Importancia'], ruta_guardado_grafica, huella,
+                titulo='Importancia de las Variables en la Predicción de Heladas (Árbol de Decisión)',
+                etiqueta_x='Importancia Relativa', etiqueta_y='Variable Meteorológica'
+            ):
+                print(f"Gráfica de importancia de variables guardada en: {ruta_guardado_grafica}")
+
+            distribuciones_a_graficar = [(
+                NOMBRE_GRAFICA_PERMUTACION, df_permutacion,
+                f"Disminución de {METRICA_PERMUTACION.upper()} al permutar",
+                'Importancia por Permutación (distribución entre repeticiones)'
+            )]
+            if contribuciones is not None:
+                distribuciones_a_graficar.append((
+                    NOMBRE_GRAFICA_CONTRIBUCIONES, df_contribuciones,
+                    'Contribución a la probabilidad de helada',
+                    'Contribuciones por Camino del Árbol (distribución entre filas)'
+                ))
+            for nombre_grafica, df_distribucion, etiqueta_x, titulo in distribuciones_a_graficar:
+                ruta_guardado = os.path.join(RUTA_GRAFICAS, nombre_grafica)
+                if graficar_distribuciones(
+                    [df_distribucion[c].values for c in COLUMNAS_FEATURES], COLUMNAS_FEATURES, ruta_guardado, huella,
+                    titulo=titulo, etiqueta_x=etiqueta_x, etiqueta_y='Variable Meteorológica'
+                ):
+                    print(f"Gráfica guardada en: {ruta_guardado}")
+        except Exception as e:
+            print(f"Error al generar las gráficas: {e}")
 
     print("--- Análisis de Importancia de Variables Finalizado ---")
 
 if __name__ == '__main__':
-    analizar_importancia_de_variables()
+    parser = argparse.ArgumentParser(description="Análisis de importancia de variables del modelo de heladas.")
+    parser.add_argument('--sin-graficas', action='store_true', help="Solo exportar CSV, sin generar gráficas.")
+    args = parser.parse_args()
+    analizar_importancia_de_variables(
+        generar_graficas=os.environ.get('GENERAR_GRAFICAS', 'true').lower() == 'true' and not args.sin_graficas
+    )
@@ -0,0 +1,185 @@
+# coding: utf-8
+"""
+Estadísticas agregadas de las predicciones (por año, mes, día, estación e intensidad) calculadas en SQL.
+
+- La tabla 'resumen_diario_predicciones' guarda, por (día, estación, intensidad), conteos y sumas.
+  Se actualiza en la misma transacción que cada INSERT en 'predicciones' (evento after_insert) con un
+  upsert INSERT ... ON CONFLICT DO UPDATE, disponible tanto en SQLite (>= 3.24) como en PostgreSQL.
+- consultar_resumen agrupa con GROUP BY sobre el resumen diario (unas pocas filas por día) o, con
+  fuente='predicciones', directamente sobre las filas crudas (útil para verificar el resumen).
+- Solo se usan funciones portables: date(), EXTRACT (SQLAlchemy lo traduce a strftime en SQLite),
+  CASE, COALESCE y NULLIF. El resumen guarda año y mes como enteros para no depender de funciones de fecha.
+"""
+import datetime
+import logging
+
+from sqlalchemy import Integer, and_, case, cast, event, extract, func, literal
+from sqlalchemy.dialects.postgresql import insert as insert_postgresql
+from sqlalchemy.dialects.sqlite import insert as insert_sqlite
+
+from database.models import IntensidadHelada, Prediccion, ResultadoPrediccion, ResumenDiarioPrediccion
+
+logger = logging.getLogger(__name__)
+
+ESTACION_NO_ESPECIFICADA = "No especificada"
+CLAVES_RESUMEN = ('dia', 'estacion', 'intensidad')
+COLUMNAS_ACUMULADAS = ('n_predicciones', 'n_probables', 'n_con_probabilidad', 'suma_probabilidad', 'suma_duracion_horas')
+AGRUPACIONES_VALIDAS = ('anio', 'mes', 'dia', 'estacion', 'intensidad')
+FUENTE_RESUMEN = 'resumen'
+FUENTE_PREDICCIONES = 'predicciones'
+
+
+def _fila_resumen(prediccion):
+    """Aporte de una predicción a su fila del resumen diario."""
+    dia = prediccion.fecha_prediccion_para.date()
+    return {
+        'dia': dia,
+        'anio': dia.year,
+        'mes': dia.month,
+        'estacion': prediccion.ubicacion or ESTACION_NO_ESPECIFICADA,
+        'intensidad': prediccion.intensidad or IntensidadHelada.no_helada,
+        'n_predicciones': 1,
+        'n_probables': int(prediccion.resultado == ResultadoPrediccion.probable),
+        'n_con_probabilidad': int(prediccion.probabilidad_helada is not None),
+        'suma_probabilidad': prediccion.probabilidad_helada or 0.0,
+        'suma_duracion_horas': prediccion.duracion_estimada_horas or 0.0,
+    }
+
+
+def acumular_en_resumen(conexion, fila):
+    """Suma una fila de aportes al resumen diario con un upsert atómico."""
+    tabla = ResumenDiarioPrediccion.__table__
+    dialecto = conexion.dialect.name
+    if dialecto in ('sqlite', 'postgresql'):
+        insertar = insert_sqlite if dialecto == 'sqlite' else insert_postgresql
+        sentencia = insertar(tabla).values(**fila)
+        sentencia = sentencia.on_conflict_do_update(
+            index_elements=list(CLAVES_RESUMEN),
+            set_={c: tabla.c[c] + sentencia.excluded[c] for c in COLUMNAS_ACUMULADAS},
+        )
+        conexion.execute(sentencia)
+        return
+    # Otros motores: UPDATE y, si no existía la fila, INSERT.
+    filtro = and_(*(tabla.c[c] == fila[c] for c in CLAVES_RESUMEN))
+    resultado = conexion.execute(tabla.update().where(filtro).values({c: tabla.c[c] + fila[c] for c in COLUMNAS_ACUMULADAS}))
+    if resultado.rowcount == 0:
+        conexion.execute(tabla.insert().values(**fila))
+
+
+def _al_insertar_prediccion(mapper, conexion, prediccion):
+    # Misma conexión y transacción que el INSERT: si la predicción se revierte, su aporte también.
+    acumular_en_resumen(conexion, _fila_resumen(prediccion))
+
+
+def registrar_mantenimiento_resumen():
+    """Activa la actualización del resumen diario en cada inserción de Prediccion (idempotente)."""
+    if not event.contains(Prediccion, 'after_insert', _al_insertar_prediccion):
+        event.listen(Prediccion, 'after_insert', _al_insertar_prediccion)
+
+
+def reconstruir_resumen_diario(db_session):
+    """
+    Recalcula todo el resumen diario desde 'predicciones' con un único INSERT ... SELECT ... GROUP BY.
+    Se usa para poblarlo por primera vez sobre una base de datos con predicciones previas.
+    """
+    tabla = ResumenDiarioPrediccion.__table__
+    dia = func.date(Prediccion.fecha_prediccion_para)
+    estacion = func.coalesce(Prediccion.ubicacion, ESTACION_NO_ESPECIFICADA)
+    intensidad = func.coalesce(Prediccion.intensidad, literal(IntensidadHelada.no_helada, type_=Prediccion.intensidad.type))
+    seleccion = db_session.query(
+        dia,
+        cast(extract('year', Prediccion.fecha_prediccion_para), Integer),
+        cast(extract('month', Prediccion.fecha_prediccion_para), Integer),
+        estacion,
+        intensidad,
+        func.count(Prediccion.id),
+        func.sum(case((Prediccion.resultado == ResultadoPrediccion.probable, 1), else_=0)),
+        func.count(Prediccion.probabilidad_helada),
+        func.coalesce(func.sum(Prediccion.probabilidad_helada), 0.0),
+        func.coalesce(func.sum(Prediccion.duracion_estimada_horas), 0.0),
+    ).group_by(dia, estacion, intensidad)
+
+    db_session.execute(tabla.delete())
+    db_session.execute(tabla.insert().from_select(
+        ['dia', 'anio', 'mes', 'estacion', 'intensidad', *COLUMNAS_ACUMULADAS], seleccion.statement))
+    db_session.commit()
+    filas = db_session.query(func.count(ResumenDiarioPrediccion.id)).scalar()
+    logger.info(f"Resumen diario de predicciones reconstruido: {filas} filas.")
+    return filas
+
+
+def inicializar_resumen_diario(db_session):
+    """Puebla el resumen diario si está vacío pero ya hay predicciones (bases de datos anteriores a la tabla)."""
+    if db_session.query(ResumenDiarioPrediccion.id).first() is None and db_session.query(Prediccion.id).first() is not None:
+        return reconstruir_resumen_diario(db_session)
+    return 0
+
+
+def consultar_resumen(db_session, agrupar, desde=None, hasta=None, estacion=None, fuente=FUENTE_RESUMEN):
+    """
+    Estadísticas de heladas agrupadas.
+
+    Args:
+        db_session: Sesión de SQLAlchemy.
+        agrupar (list): Subconjunto ordenado de AGRUPACIONES_VALIDAS ('mes' implica 'anio').
+        desde, hasta (datetime.date, opcional): Rango inclusivo de días de predicción.
+        estacion (str, opcional): Filtra por estación (ubicación) exacta.
+        fuente (str): 'resumen' (tabla diaria) o 'predicciones' (filas crudas).
+
+    Returns:
+        list: Un dict por grupo con las claves de agrupación, n_predicciones, n_probables,
+              probabilidad_media y duracion_total_horas.
+    """
+    invalidas = [a for a in agrupar if a not in AGRUPACIONES_VALIDAS]
+    if invalidas:
+        raise ValueError(f"Agrupación inválida: {invalidas}. Usar una combinación de {list(AGRUPACIONES_VALIDAS)}.")
+    if 'mes' in agrupar and 'anio' not in agrupar:
+        agrupar = ['anio'] + list(agrupar)
+
+    if fuente == FUENTE_RESUMEN:
+        R = ResumenDiarioPrediccion
+        columnas_grupo = {'anio': R.anio, 'mes': R.mes, 'dia': R.dia, 'estacion': R.estacion, 'intensidad': R.intensidad}
+        agregados = [
+            func.sum(R.n_predicciones).label('n_predicciones'),
+            func.sum(R.n_probables).label('n_probables'),
+            (func.sum(R.suma_probabilidad) / func.nullif(func.sum(R.n_con_probabilidad), 0)).label('probabilidad_media'),
+            func.sum(R.suma_duracion_horas).label('duracion_total_horas'),
+        ]
+        filtros = []
+        if desde is not None:
+            filtros.append(R.dia >= desde)
+        if hasta is not None:
+            filtros.append(R.dia <= hasta)
+        if estacion:
+            filtros.append(R.estacion == estacion)
+    elif fuente == FUENTE_PREDICCIONES:
+        P = Prediccion
+        columnas_grupo = {
+            'anio': cast(extract('year', P.fecha_prediccion_para), Integer),
+            'mes': cast(extract('month', P.fecha_prediccion_para), Integer),
+            'dia': func.date(P.fecha_prediccion_para),
+            'estacion': func.coalesce(P.ubicacion, ESTACION_NO_ESPECIFICADA),
+            'intensidad': P.intensidad,
+        }
+        agregados = [
+            func.count(P.id).label('n_predicciones'),
+            func.sum(case((P.resultado == ResultadoPrediccion.probable, 1), else_=0)).label('n_probables'),
+            func.avg(P.probabilidad_helada).label('probabilidad_media'),
+            func.coalesce(func.sum(P.duracion_estimada_horas), 0.0).label('duracion_total_horas'),
+        ]
+        filtros = []
+        # Se filtra sobre la columna (no sobre date(...)) para aprovechar su índice.
+        if desde is not None:
+            filtros.append(P.fecha_prediccion_para >= datetime.datetime.combine(desde, datetime.time.min))
+        if hasta is not None:
+            filtros.append(P.fecha_prediccion_para < datetime.datetime.combine(hasta + datetime.timedelta(days=1), datetime.time.min))
+        if estacion:
+            filtros.append(P.ubicacion == estacion)
+    else:
+        raise ValueError(f"Fuente inválida: {fuente!r}. Usar '{FUENTE_RESUMEN}' o '{FUENTE_PREDICCIONES}'.")
+
+    grupo = [columnas_grupo[a].label(a) for a in agrupar]
+    consulta = db_session.query(*grupo, *agregados).filter(*filtros)
+    if grupo:
+        consulta = consulta.group_by(*grupo).order_by(*grupo)
+    return [fila._asdict() for fila in consulta.all()]
@@ -0,0 +1,114 @@
+# coding: utf-8
+"""
+Benchmark del arranque en frío de la aplicación web.
+
+Cada repetición corre en un proceso Python nuevo (arranque realmente en frío) y mide:
+- importacion: import de main.py
+- create_app: construcción de la app (configuración, base de datos, inicio de la precarga del modelo)
+- primera_peticion_vivo: primera respuesta de /salud/vivo
+- primera_peticion_datos: primera respuesta de /obtener_prediccion_actual (consulta a la base de datos)
+- hasta_listo: tiempo desde create_app hasta que /salud/listo responde 200 (modelo cargado)
+Además lista qué módulos pesados quedaron importados solo por el import de main.py.
+
+Uso (desde la raíz del proyecto):  python src/benchmark_arranque.py --repeticiones 5 [--sin-precarga] [--importtime]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+RAIZ_PROYECTO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULOS_PESADOS = ('pandas', 'numpy', 'sklearn', 'joblib', 'requests', 'matplotlib')
+FASES = ('importacion', 'create_app', 'primera_peticion_vivo', 'primera_peticion_datos', 'hasta_listo')
+
+# Código que corre dentro del proceso hijo; imprime una línea JSON con los tiempos en segundos.
+CODIGO_MEDICION = """
+import json, sys, time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+pesados = [m for m in {pesados!r} if m in sys.modules]
+app = main.create_app({{'PRECARGA_MODELO': {precarga!r}}})
+t2 = time.perf_counter()
+cliente = app.test_client()
+cliente.get('/salud/vivo')
+t3 = time.perf_counter()
+cliente.get('/obtener_prediccion_actual')
+t4 = time.perf_counter()
+if not {precarga!r}:
+    main.catalogo_modelos.precargar()
+hasta_listo = None
+while time.perf_counter() - t2 < {espera_maxima!r}:
+    if cliente.get('/salud/listo').status_code == 200:
+        hasta_listo = time.perf_counter() - t2
+        break
+    time.sleep(0.02)
+print(json.dumps({{
+    'importacion': t1 - t0, 'create_app': t2 - t1, 'primera_peticion_vivo': t3 - t2,
+    'primera_peticion_datos': t4 - t3, 'hasta_listo': hasta_listo, 'modulos_pesados_al_importar': pesados,
+}}))
+"""
+
+
+def medir_arranque(precarga=True, espera_maxima=60.0, importtime=False):
+    """Ejecuta una medición en un proceso nuevo con una base de datos SQLite temporal."""
+    with tempfile.TemporaryDirectory() as directorio:
+        entorno = dict(os.environ)
+        entorno['DATABASE_URL'] = f"sqlite:///{os.path.join(directorio, 'benchmark.db')}"
+        entorno['RUTA_SERIES_HORARIAS'] = os.path.join(directorio, 'series_horarias')
+        entorno['FLASK_DEBUG'] = 'false'
+        comando = [sys.executable]
+        if importtime:
+            comando.append('-X')
+            comando.append('importtime')
+        comando += ['-c', CODIGO_MEDICION.format(pesados=MODULOS_PESADOS, precarga=precarga, espera_maxima=espera_maxima)]
+        proceso = subprocess.run(comando, cwd=RAIZ_PROYECTO, env=entorno, capture_output=True, text=True)
+    if proceso.returncode != 0:
+        raise RuntimeError(f"La medición falló:\n{proceso.stderr[-2000:]}")
+    resultado = json.loads(proceso.stdout.strip().splitlines()[-1])
+    if importtime:
+        resultado['importtime'] = _modulos_mas_lentos(proceso.stderr)
+    return resultado
+
+
+def _modulos_mas_lentos(salida_importtime, n=10):
+    """Módulos con mayor tiempo acumulado de importación según 'python -X importtime'."""
+    filas = []
+    for linea in salida_importtime.splitlines():
+        # Formato: "import time: <propio us> | <acumulado us> | <módulo>" (la primera línea es el encabezado)
+        if not linea.startswith('import time:') or 'cumulative' in linea:
+            continue
+        partes = linea[len('import time:'):].split('|')
+        if len(partes) == 3:
+            filas.append((int(partes[1]), partes[2].strip()))
+    return [{'modulo': m, 'acumulado_ms': round(us / 1000, 1)} for us, m in sorted(filas, reverse=True)[:n]]
+
+
+def ejecutar_benchmark(repeticiones=5, precarga=True, importtime=False):
+    mediciones = [medir_arranque(precarga=precarga, importtime=importtime and i == 0) for i in range(repeticiones)]
+    print(f"Arranque en frío ({repeticiones} repeticiones, precarga del modelo: {'sí' if precarga else 'no'})")
+    print(f"{'fase':<26}{'mediana ms':>12}{'mín ms':>10}{'máx ms':>10}")
+    for fase in FASES:
+        valores = [m[fase] for m in mediciones if m[fase] is not None]
+        if not valores:
+            print(f"{fase:<26}{'n/d':>12}")
+            continue
+        print(f"{fase:<26}{statistics.median(valores) * 1000:>12.1f}{min(valores) * 1000:>10.1f}{max(valores) * 1000:>10.1f}")
+    print(f"Módulos pesados importados por 'import main': {mediciones[0]['modulos_pesados_al_importar'] or 'ninguno'}")
+    if importtime:
+        print("Módulos con mayor tiempo de importación (primera repetición):")
+        for fila in mediciones[0]['importtime']:
+            print(f"  {fila['modulo']:<40}{fila['acumulado_ms']:>10.1f} ms")
+    return mediciones
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark del arranque en frío de la aplicación de heladas.")
+    parser.add_argument('--repeticiones', type=int, default=5, help="Número de procesos nuevos a medir.")
+    parser.add_argument('--sin-precarga', action='store_true', help="No precargar el modelo al crear la app (carga diferida).")
+    parser.add_argument('--importtime', action='store_true', help="Mostrar los módulos más lentos de importar (python -X importtime).")
+    args = parser.parse_args()
+    ejecutar_benchmark(repeticiones=args.repeticiones, precarga=not args.sin_precarga, importtime=args.importtime)
@@ -0,0 +1,137 @@
+# coding: utf-8
+"""
+Presupuesto de latencia de inferencia de los modelos entrenados.
+
+Para cada versión de modelo (archivo .pkl en modelos_entrenados/) mide predict_proba del estimador de
+sklearn y del predictor compilado (src/predictor_compilado.py) en dos escenarios:
+- individual: una fila por llamada (pronóstico de una estación)
+- lote: --tamano-lote filas por llamada (pronóstico en lote de estaciones o de una grilla)
+Reporta p50/p99 por escenario y la diferencia máxima de probabilidades entre ambos predictores. El
+proceso termina con código 1 si el predictor que usaría el servicio supera el p99 permitido, para
+poder usarlo como control en CI al cambiar de modelo.
+
+Uso (desde la raíz del proyecto):
+    python src/benchmark_inferencia.py [--modelos modelo_bosque_aleatorio,...] [--repeticiones 1000]
+                                       [--p99-individual-ms 5] [--p99-lote-ms 50] [--tamano-lote 256]
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+try:
+    from src.especificacion_features import COLUMNAS_MODELO
+    from src.predictor_compilado import compilar_predictor, generar_filas_sinteticas
+except ImportError:  # Ejecución directa desde src/
+    from especificacion_features import COLUMNAS_MODELO
+    from predictor_compilado import compilar_predictor, generar_filas_sinteticas
+
+RAIZ_PROYECTO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUTA_MODELOS_ENTRENADOS = os.path.join(RAIZ_PROYECTO, "modelos_entrenados")
+RUTA_DATOS_PRUEBA = os.path.join(RAIZ_PROYECTO, "datos", "procesados", "datos_prueba_evaluacion.csv")
+
+REPETICIONES = 1000
+TAMANO_LOTE = 256
+P99_INDIVIDUAL_MS = 5.0
+P99_LOTE_MS = 50.0
+REPETICIONES_CALENTAMIENTO = 20
+
+
+def cargar_filas_prueba(n_minimo):
+    """Filas reales de prueba (unidades del modelo) si existen; si no, filas sintéticas dentro de los rangos válidos."""
+    if os.path.exists(RUTA_DATOS_PRUEBA):
+        filas = pd.read_csv(RUTA_DATOS_PRUEBA)[COLUMNAS_MODELO].dropna().to_numpy(dtype=np.float64)
+        if len(filas):
+            return np.resize(filas, (max(n_minimo, len(filas)), len(COLUMNAS_MODELO)))
+    return generar_filas_sinteticas(n_minimo)
+
+
+def medir_latencias(predecir, lotes, repeticiones):
+    """Latencias en ms de 'predecir' sobre los lotes dados, rotándolos, tras unas llamadas de calentamiento."""
+    for i in range(REPETICIONES_CALENTAMIENTO):
+        predecir(lotes[i % len(lotes)])
+    latencias = np.empty(repeticiones)
+    for i in range(repeticiones):
+        lote = lotes[i % len(lotes)]
+        inicio = time.perf_counter()
+        predecir(lote)
+        latencias[i] = (time.perf_counter() - inicio) * 1000
+    return latencias
+
+
+def medir_modelo(ruta_modelo, filas, repeticiones, tamano_lote):
+    """Mediciones de un .pkl: {'sklearn': {...}, 'compilado': {...} o None, 'diferencia_maxima'}."""
+    modelo = joblib.load(ruta_modelo)
+    compilado = compilar_predictor(modelo, X_verificacion=filas[:tamano_lote])
+    # Igual que en el servicio: el estimador de sklearn recibe un DataFrame con las columnas del modelo.
+    individuales = [pd.DataFrame(filas[i:i + 1], columns=COLUMNAS_MODELO) for i in range(min(len(filas), 200))]
+    lotes = [pd.DataFrame(filas[i:i + tamano_lote], columns=COLUMNAS_MODELO)
+             for i in range(0, len(filas) - tamano_lote + 1, tamano_lote)]
+
+    resultado = {'compilado': None, 'diferencia_maxima': None}
+    predictores = {'sklearn': modelo, 'compilado': compilado}
+    for nombre, predictor in predictores.items():
+        if predictor is None:
+            continue
+        individual = medir_latencias(predictor.predict_proba, individuales, repeticiones)
+        lote = medir_latencias(predictor.predict_proba, lotes, max(1, repeticiones // 10))
+        resultado[nombre] = {
+            'individual_p50': float(np.percentile(individual, 50)), 'individual_p99': float(np.percentile(individual, 99)),
+            'lote_p50': float(np.percentile(lote, 50)), 'lote_p99': float(np.percentile(lote, 99)),
+            'filas_por_segundo': tamano_lote / (float(np.median(lote)) / 1000),
+        }
+    if compilado is not None:
+        X = pd.DataFrame(filas, columns=COLUMNAS_MODELO)
+        resultado['diferencia_maxima'] = float(np.max(np.abs(compilado.predict_proba(X) - modelo.predict_proba(X))))
+    return resultado
+
+
+def ejecutar_benchmark(versiones=None, repeticiones=REPETICIONES, tamano_lote=TAMANO_LOTE,
+                       p99_individual_ms=P99_INDIVIDUAL_MS, p99_lote_ms=P99_LOTE_MS):
+    """Mide cada versión e imprime la tabla. Retorna la lista de versiones que exceden el presupuesto."""
+    if not versiones:
+        versiones = sorted(os.path.splitext(os.path.basename(r))[0] for r in glob.glob(os.path.join(RUTA_MODELOS_ENTRENADOS, "*.pkl")))
+    filas = cargar_filas_prueba(max(tamano_lote * 4, 1000))
+
+    print(f"Presupuesto p99: individual {p99_individual_ms:.1f} ms, lote de {tamano_lote} filas {p99_lote_ms:.1f} ms")
+    print(f"{'modelo':<34}{'predictor':<11}{'ind p50':>9}{'ind p99':>9}{'lote p50':>10}{'lote p99':>10}{'filas/s':>11}")
+    excedidos = []
+    for version in versiones:
+        mediciones = medir_modelo(os.path.join(RUTA_MODELOS_ENTRENADOS, f"{version}.pkl"), filas, repeticiones, tamano_lote)
+        for nombre in ('sklearn', 'compilado'):
+            m = mediciones[nombre]
+            if m is None:
+                print(f"{version:<34}{nombre:<11}{'no compilable':>20}")
+                continue
+            print(f"{version:<34}{nombre:<11}{m['individual_p50']:>9.3f}{m['individual_p99']:>9.3f}"
+                  f"{m['lote_p50']:>10.3f}{m['lote_p99']:>10.3f}{m['filas_por_segundo']:>11.0f}")
+        if mediciones['diferencia_maxima'] is not None:
+            print(f"{'':<34}diferencia máxima de probabilidad compilado vs sklearn: {mediciones['diferencia_maxima']:.2e}")
+
+        # El servicio usa el compilado si existe (ver ServicioModelo._cargar); el presupuesto se aplica a ese.
+        servido = mediciones['compilado'] or mediciones['sklearn']
+        if servido['individual_p99'] > p99_individual_ms or servido['lote_p99'] > p99_lote_ms:
+            excedidos.append(version)
+    if excedidos:
+        print(f"Modelos que exceden el presupuesto de latencia: {excedidos}")
+    else:
+        print("Todos los modelos cumplen el presupuesto de latencia.")
+    return excedidos
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark y presupuesto de latencia de inferencia de los modelos de heladas.")
+    parser.add_argument('--modelos', default='', help="Versiones (nombre del .pkl sin extensión) separadas por comas; por defecto, todas.")
+    parser.add_argument('--repeticiones', type=int, default=REPETICIONES, help="Llamadas individuales medidas por predictor.")
+    parser.add_argument('--tamano-lote', type=int, default=TAMANO_LOTE, help="Filas por llamada en el escenario de lote.")
+    parser.add_argument('--p99-individual-ms', type=float, default=P99_INDIVIDUAL_MS, help="p99 máximo de una predicción individual.")
+    parser.add_argument('--p99-lote-ms', type=float, default=P99_LOTE_MS, help="p99 máximo de una predicción en lote.")
+    args = parser.parse_args()
+    excedidos = ejecutar_benchmark([v for v in args.modelos.split(',') if v], args.repeticiones, args.tamano_lote,
+                                   args.p99_individual_ms, args.p99_lote_ms)
+    sys.exit(1 if excedidos else 0)
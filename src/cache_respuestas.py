@@ -0,0 +1,248 @@
+# coding: utf-8
+"""
+Caché HTTP de respuestas JSON/CSV: serialización rápida, ETag por contenido, 304 y compresión.
+
+- a_json_bytes serializa directamente fechas (ISO 8601), enums (su valor) y escalares NumPy, sin armar
+  diccionarios campo por campo. Usa orjson si está instalado y, si no, el módulo json estándar.
+- CacheRespuestas guarda en memoria el cuerpo ya serializado de cada consulta junto con su ETag (hash del
+  contenido) y sus versiones comprimidas (gzip y, si está instalado el paquete brotli, br), calculadas una
+  sola vez. Se invalida completa al confirmarse una nueva Prediccion en la base de datos.
+- responder_desde_cache responde 304 Not Modified si el navegador ya tiene la versión vigente y elige la
+  codificación según Accept-Encoding.
+"""
+import csv
+import datetime
+import decimal
+import enum
+import gzip
+import hashlib
+import io
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from flask import Response, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+TAMANO_MINIMO_COMPRESION = 1024  # Bytes; por debajo la cabecera gzip no compensa
+NIVEL_GZIP = 6
+CALIDAD_BROTLI = 5
+MAX_ENTRADAS_CACHE = 256
+SEGUNDOS_VIGENCIA_CACHE = 300  # Tope de vida de una entrada aunque no haya inserciones
+TIPOS_COMPRIMIBLES = ('application/json', 'text/csv', 'text/html', 'text/plain', 'application/javascript', 'text/css')
+CLAVE_INVALIDAR_SESION = 'invalidar_cache_respuestas'
+
+
+def _valor_por_defecto(obj):
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, enum.Enum):
+        return obj.value
+    # NumPy no se importa aquí (arranque liviano): si no está cargado, no puede haber objetos NumPy.
+    np = sys.modules.get('numpy')
+    if np is not None and isinstance(obj, np.generic):
+        return obj.item()
+    if np is not None and isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    raise TypeError(f"Tipo no serializable a JSON: {type(obj).__name__}")
+
+
+class CodificadorJSON(json.JSONEncoder):
+    """Codificador JSON que entiende fechas, enums y escalares NumPy."""
+
+    def default(self, obj):
+        try:
+            return _valor_por_defecto(obj)
+        except TypeError:
+            return super().default(obj)
+
+
+def a_json_bytes(datos):
+    """Serializa a JSON compacto (UTF-8)."""
+    if orjson is not None:
+        return orjson.dumps(datos, default=_valor_por_defecto, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(datos, cls=CodificadorJSON, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def a_csv_bytes(encabezados, filas):
+    """Serializa filas a CSV (UTF-8) con las mismas conversiones que a_json_bytes (fechas ISO, valor de los enums)."""
+    salida = io.StringIO()
+    escritor = csv.writer(salida)
+    escritor.writerow(encabezados)
+    for fila in filas:
+        escritor.writerow(['' if v is None else _valor_por_defecto(v) if isinstance(v, (datetime.date, datetime.time, enum.Enum)) else v
+                           for v in fila])
+    return salida.getvalue().encode('utf-8')
+
+
+def calcular_etag(cuerpo):
+    return hashlib.sha1(cuerpo).hexdigest()
+
+
+def _comprimir(cuerpo, codificacion):
+    if codificacion == 'br':
+        return brotli.compress(cuerpo, quality=CALIDAD_BROTLI)
+    return gzip.compress(cuerpo, compresslevel=NIVEL_GZIP)
+
+
+def _codificacion_aceptada(tamano):
+    """Mejor codificación admitida por el cliente para un cuerpo del tamaño dado, o None."""
+    if tamano < TAMANO_MINIMO_COMPRESION:
+        return None
+    if brotli is not None and request.accept_encodings['br']:
+        return 'br'
+    if request.accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+class EntradaCache:
+    """Respuesta serializada con su ETag y sus versiones comprimidas (calculadas a demanda)."""
+
+    def __init__(self, cuerpo, mimetype='application/json', status=200):
+        self.cuerpo = cuerpo
+        self.mimetype = mimetype
+        self.status = status
+        self.etag = calcular_etag(cuerpo)
+        self.creada = time.monotonic()
+        self._comprimidos = {}
+
+    def cuerpo_codificado(self, codificacion):
+        if codificacion is None:
+            return self.cuerpo
+        if codificacion not in self._comprimidos:
+            self._comprimidos[codificacion] = _comprimir(self.cuerpo, codificacion)
+        return self._comprimidos[codificacion]
+
+
+class CacheRespuestas:
+    """Caché LRU en proceso de respuestas serializadas, segura entre hilos."""
+
+    def __init__(self, max_entradas=MAX_ENTRADAS_CACHE, segundos_vigencia=SEGUNDOS_VIGENCIA_CACHE):
+        self.max_entradas = max_entradas
+        self.segundos_vigencia = segundos_vigencia
+        self._entradas = OrderedDict()
+        self._generacion = 0
+        self._candado = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def invalidar(self):
+        with self._candado:
+            self._entradas.clear()
+            self._generacion += 1
+
+    def obtener_o_generar(self, clave, generar):
+        """
+        Devuelve la EntradaCache de la clave, generándola con generar() si no existe o venció.
+
+        generar() debe retornar (cuerpo_bytes, mimetype, status). Solo se guardan las respuestas 200 y 404,
+        y solo si no hubo una invalidación mientras se generaban (evita guardar datos ya obsoletos).
+        """
+        with self._candado:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and time.monotonic() - entrada.creada <= self.segundos_vigencia:
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return entrada
+            generacion = self._generacion
+            self.fallos += 1
+
+        entrada = EntradaCache(*generar())
+        if entrada.status in (200, 404):
+            with self._candado:
+                if generacion == self._generacion:
+                    self._entradas[clave] = entrada
+                    self._entradas.move_to_end(clave)
+                    while len(self._entradas) > self.max_entradas:
+                        self._entradas.popitem(last=False)
+        return entrada
+
+    def metricas(self):
+        with self._candado:
+            return {"entradas": len(self._entradas), "aciertos": self.aciertos, "fallos": self.fallos,
+                    "generacion": self._generacion}
+
+
+def responder_desde_cache(entrada, max_age=0, nombre_descarga=None):
+    """
+    Respuesta Flask para una EntradaCache: 304 si el ETag coincide, cuerpo comprimido si el cliente lo admite.
+    Con max_age=0 el navegador guarda la respuesta pero la revalida siempre (barata gracias al 304).
+    """
+    codificacion = _codificacion_aceptada(len(entrada.cuerpo))
+    # Cada representación (sin comprimir, gzip, br) tiene su propio ETag, como exige HTTP.
+    etag = entrada.etag if codificacion is None else f"{entrada.etag}-{codificacion}"
+    cabeceras = {
+        'ETag': f'"{etag}"',
+        'Cache-Control': f"public, max-age={max_age}" if max_age else "no-cache",
+        'Vary': 'Accept-Encoding',
+    }
+    if entrada.status == 200 and request.if_none_match.contains(etag):
+        return Response(status=304, headers=cabeceras)
+
+    if codificacion is not None:
+        cabeceras['Content-Encoding'] = codificacion
+    if nombre_descarga:
+        cabeceras['Content-Disposition'] = f'attachment; filename="{nombre_descarga}"'
+    return Response(entrada.cuerpo_codificado(codificacion), status=entrada.status, mimetype=entrada.mimetype, headers=cabeceras)
+
+
+def respuesta_json(datos, status=200):
+    """Alternativa a jsonify con el serializador rápido (sin caché)."""
+    return Response(a_json_bytes(datos), status=status, mimetype='application/json')
+
+
+def comprimir_respuesta(respuesta):
+    """
+    Hook after_request: comprime con gzip/br las respuestas grandes que no pasaron por la caché
+    (p. ej. el ráster JSON de la grilla o las páginas HTML). No toca flujos (SSE), archivos estáticos
+    ni respuestas que ya tienen codificación o ETag propio.
+    """
+    if (respuesta.status_code != 200 or respuesta.direct_passthrough or respuesta.is_streamed
+            or 'Content-Encoding' in respuesta.headers or 'ETag' in respuesta.headers
+            or respuesta.mimetype not in TIPOS_COMPRIMIBLES):
+        return respuesta
+    cuerpo = respuesta.get_data()
+    codificacion = _codificacion_aceptada(len(cuerpo))
+    if codificacion is None:
+        return respuesta
+    respuesta.set_data(_comprimir(cuerpo, codificacion))
+    respuesta.headers['Content-Encoding'] = codificacion
+    respuesta.vary.add('Accept-Encoding')
+    return respuesta
+
+
+def invalidar_al_insertar(cache, *modelos):
+    """
+    Invalida la caché cuando se confirma (commit) una sesión que insertó instancias de los modelos dados.
+    Se espera al commit para que una consulta concurrente no vuelva a guardar datos previos a la inserción.
+    """
+    @event.listens_for(Session, 'after_flush')
+    def _marcar(session, contexto_flush):
+        # En after_flush, session.new todavía muestra los objetos recién insertados.
+        if any(isinstance(obj, modelos) for obj in session.new):
+            session.info[CLAVE_INVALIDAR_SESION] = True
+
+    @event.listens_for(Session, 'after_commit')
+    def _invalidar(session):
+        if session.info.pop(CLAVE_INVALIDAR_SESION, False):
+            cache.invalidar()
+
+    @event.listens_for(Session, 'after_rollback')
+    def _descartar(session):
+        session.info.pop(CLAVE_INVALIDAR_SESION, None)
@@ -0,0 +1,142 @@
+# coding: utf-8
+"""
+Control de calidad vectorizado de los pronósticos descargados, previo a la predicción.
+
+Sobre el cubo completo de un lote (horas x estaciones x variables) se calcula, en una sola pasada
+NumPy, una máscara de bits por hora y estación con los problemas de las variables del modelo:
+
+    FUERA_DE_RANGO        valor crudo físicamente imposible (p. ej. presión en Pa o humedad > 100 %),
+                          descartado por la especificación antes de imputar
+    FUERA_DE_ENTRENAMIENTO  valor final fuera del rango visto en el entrenamiento (más un margen)
+    CAMBIO_BRUSCO         salto entre horas consecutivas mayor que 'max_cambio_horario'
+    INTERPOLADO           valor faltante o descartado rellenado por interpolación
+    HUECO_EXCEDIDO        hueco más largo que el límite de interpolación: la variable queda sin valor
+    ESTIMADO              humedad del suelo estimada a partir de la humedad relativa y la precipitación
+
+La máscara de la hora elegida se guarda en Prediccion.calidad_datos (0 = sin observaciones).
+Los límites se precalculan una vez por modelo (LimitesCalidad.desde_estadisticas) a partir de la
+especificación y de las estadísticas de entrenamiento.
+"""
+import numpy as np
+
+try:
+    from src.especificacion_features import (COLUMNAS_MODELO, ESPECIFICACION_FEATURES, FUENTE_OPENMETEO)
+except ImportError:  # Ejecución directa desde src/
+    from especificacion_features import (COLUMNAS_MODELO, ESPECIFICACION_FEATURES, FUENTE_OPENMETEO)
+
+CALIDAD_OK = 0
+FUERA_DE_RANGO = 1
+FUERA_DE_ENTRENAMIENTO = 2
+CAMBIO_BRUSCO = 4
+INTERPOLADO = 8
+HUECO_EXCEDIDO = 16
+ESTIMADO = 32
+
+NOMBRES_BITS_CALIDAD = {
+    FUERA_DE_RANGO: 'fuera_de_rango',
+    FUERA_DE_ENTRENAMIENTO: 'fuera_de_entrenamiento',
+    CAMBIO_BRUSCO: 'cambio_brusco',
+    INTERPOLADO: 'interpolado',
+    HUECO_EXCEDIDO: 'hueco_excedido',
+    ESTIMADO: 'estimado',
+}
+
+# Horas con estos bits se evitan al elegir la hora de la madrugada si hay otra hora completa sin ellos.
+BITS_RECHAZO = FUERA_DE_RANGO | CAMBIO_BRUSCO
+
+# Margen sobre el rango [mínimo, máximo] del entrenamiento, como fracción de su amplitud.
+MARGEN_RANGO_ENTRENAMIENTO = 0.10
+
+
+class LimitesCalidad:
+    """Límites por variable del modelo (en el orden de COLUMNAS_MODELO), como arreglos listos para comparar."""
+
+    def __init__(self, minimo_fisico, maximo_fisico, minimo_entrenamiento, maximo_entrenamiento, max_cambio_horario):
+        self.minimo_fisico = minimo_fisico
+        self.maximo_fisico = maximo_fisico
+        self.minimo_entrenamiento = minimo_entrenamiento
+        self.maximo_entrenamiento = maximo_entrenamiento
+        self.max_cambio_horario = max_cambio_horario
+
+    @classmethod
+    def desde_estadisticas(cls, estadisticas=None, margen=MARGEN_RANGO_ENTRENAMIENTO):
+        """
+        Sin estadísticas de entrenamiento, el rango de entrenamiento es el físico (el bit
+        FUERA_DE_ENTRENAMIENTO no se activa nunca).
+        """
+        specs = [ESPECIFICACION_FEATURES[c] for c in COLUMNAS_MODELO]
+        minimo_fisico = np.array([s['rango_valido'][0] for s in specs], dtype=np.float64)
+        maximo_fisico = np.array([s['rango_valido'][1] for s in specs], dtype=np.float64)
+        minimo_entrenamiento, maximo_entrenamiento = minimo_fisico.copy(), maximo_fisico.copy()
+        for j, nombre in enumerate(COLUMNAS_MODELO):
+            stats = (estadisticas or {}).get(nombre)
+            if stats and 'minimo' in stats and 'maximo' in stats:
+                holgura = (stats['maximo'] - stats['minimo']) * margen
+                minimo_entrenamiento[j] = stats['minimo'] - holgura
+                maximo_entrenamiento[j] = stats['maximo'] + holgura
+        max_cambio_horario = np.array([s.get('max_cambio_horario', np.inf) for s in specs], dtype=np.float64)
+        return cls(minimo_fisico, maximo_fisico, minimo_entrenamiento, maximo_entrenamiento, max_cambio_horario)
+
+
+LIMITES_PREDETERMINADOS = LimitesCalidad.desde_estadisticas()
+
+
+def evaluar_calidad(cubo, nombres_variables, cubo_modelo, nombres_modelo, limites=None, fuente=FUENTE_OPENMETEO):
+    """
+    Máscara de calidad por (hora, serie) de un lote, en una sola pasada vectorizada.
+
+    Args:
+        cubo (np.ndarray): Cubo crudo (horas, series, variables) en unidades de `fuente`, tal como se descargó.
+        nombres_variables (list): Nombre de cada variable del último eje de `cubo`.
+        cubo_modelo (np.ndarray): Resultado de transformar_cubo sobre `cubo` (unidades del modelo, imputado).
+        nombres_modelo (list): Nombres del último eje de `cubo_modelo`.
+        limites (LimitesCalidad, opcional): Límites precalculados; por defecto, solo la especificación.
+
+    Returns:
+        np.ndarray: (horas, series) int32 con los bits de calidad combinados de todas las variables del modelo.
+    """
+    limites = limites or LIMITES_PREDETERMINADOS
+    n_horas, n_series = cubo_modelo.shape[:2]
+    presentes = np.array([c in nombres_variables for c in COLUMNAS_MODELO])
+    factores = np.array([ESPECIFICACION_FEATURES[c]['conversiones'].get(fuente, (1.0, 0.0)) for c in COLUMNAS_MODELO])
+
+    # Valores crudos de las variables del modelo en unidades del modelo (NaN si la variable no vino)
+    crudo = np.full((n_horas, n_series, len(COLUMNAS_MODELO)), np.nan)
+    indices_crudos = [nombres_variables.index(c) for c in np.array(COLUMNAS_MODELO)[presentes]]
+    crudo[:, :, presentes] = np.asarray(cubo, dtype=np.float64)[:, :, indices_crudos] * factores[presentes, 0] + factores[presentes, 1]
+    final = cubo_modelo[:, :, [nombres_modelo.index(c) for c in COLUMNAS_MODELO]]
+
+    fuera_de_rango = (crudo < limites.minimo_fisico) | (crudo > limites.maximo_fisico)
+    ausente = np.isnan(crudo) | fuera_de_rango
+    sin_valor = np.isnan(final)
+    imputado = ausente & ~sin_valor
+    es_estimacion = np.array([ESPECIFICACION_FEATURES[c]['imputacion'] == 'estimar_humedad_suelo' for c in COLUMNAS_MODELO])
+    fuera_de_entrenamiento = (final < limites.minimo_entrenamiento) | (final > limites.maximo_entrenamiento)
+
+    # Un salto excesivo marca las dos horas que lo forman (un pico aislado marca la hora del pico y sus vecinas).
+    cambio_brusco = np.zeros_like(sin_valor)
+    if n_horas > 1:
+        salto = np.abs(np.diff(final, axis=0)) > limites.max_cambio_horario
+        cambio_brusco[1:] |= salto
+        cambio_brusco[:-1] |= salto
+
+    bits = (fuera_de_rango * FUERA_DE_RANGO
+            | fuera_de_entrenamiento * FUERA_DE_ENTRENAMIENTO
+            | cambio_brusco * CAMBIO_BRUSCO
+            | (imputado & ~es_estimacion) * INTERPOLADO
+            | sin_valor * HUECO_EXCEDIDO
+            | (imputado & es_estimacion) * ESTIMADO)
+    return np.bitwise_or.reduce(bits.astype(np.int32), axis=2)
+
+
+def describir_calidad(mascara):
+    """Nombres de los bits activos de una máscara de calidad (lista vacía si es CALIDAD_OK)."""
+    if mascara is None:
+        return []
+    return [nombre for bit, nombre in NOMBRES_BITS_CALIDAD.items() if int(mascara) & bit]
+
+
+def resumir_calidad(mascaras):
+    """{nombre_bit: número de filas con ese bit} para registrar el resumen de un lote."""
+    mascaras = np.asarray(mascaras)
+    return {nombre: int(np.count_nonzero(mascaras & bit)) for bit, nombre in NOMBRES_BITS_CALIDAD.items() if (mascaras & bit).any()}
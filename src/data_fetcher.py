@@ -1,22 +1,35 @@
 import requests
+import numpy as np
 import pandas as pd
 import logging
 from datetime import datetime, timedelta
 
-logger = logging.getLogger(__name__)
+try:
+    from src.especificacion_features import COLUMNAS_MODELO, VARIABLES_OPENMETEO, transformar_features
+except ImportError:  # Ejecución directa desde src/
+    from especificacion_features import COLUMNAS_MODELO, VARIABLES_OPENMETEO, transformar_features
 
-COLUMNAS_MODELO = ['Temperatura', 'HumedadRelativa', 'PresionAtmosferica', 'HumedadSuelo']
+logger = logging.getLogger(__name__)
 
-OPENMETEO_VARIABLES = {
-    'Temperatura': 'temperature_2m',
-    'HumedadRelativa': 'relativehumidity_2m',
-    'PresionAtmosferica': 'surface_pressure', # en Pa, el modelo debe estar entrenado con esto o se necesita conversión
-    'HumedadSuelo': 'soil_moisture_0_to_7cm', # m³/m³
-    'PrecipitacionMM': 'precipitation_sum' # mm
-}
+# Mapeo columna del proyecto -> variable horaria de Open-Meteo, definido en especificacion_features.py
+# junto con las unidades y conversiones de cada variable.
+OPENMETEO_VARIABLES = VARIABLES_OPENMETEO
 
 COLUMNAS_A_SOLICITAR_API = list(OPENMETEO_VARIABLES.keys())
 
+OPENMETEO_URL_PRONOSTICO = "https://api.open-meteo.com/v1/forecast"
+# Máximo de coordenadas por petición multi-ubicación (limita el largo de la URL y el tamaño de la respuesta).
+MAX_COORDENADAS_POR_PETICION = 100
+
+# Sesión HTTP compartida (reutiliza conexiones). Su transporte se puede reemplazar con configurar_transporte
+# para grabar las respuestas o reproducirlas sin red (src/grabacion_openmeteo.py).
+sesion_http = requests.Session()
+
+
+def configurar_transporte(adaptador, prefijo="https://api.open-meteo.com/"):
+    """Monta un adaptador de transporte de requests para las URL de Open-Meteo."""
+    sesion_http.mount(prefijo, adaptador)
+
 
 def obtener_datos_meteorologicos_openmeteo(latitud: float, longitud: float, dias_prediccion: int = 1):
     """
@@ -28,12 +41,14 @@ def obtener_datos_meteorologicos_openmeteo(latitud: float, longitud: float, dias
         dias_prediccion (int): Número de días de pronóstico a obtener (1 a 16).
 
     Returns:
-        pandas.DataFrame: Un DataFrame con los datos meteorológicos horarios,
-                          con columnas 'time', 'Temperatura', 'HumedadRelativa',
-                          'PresionAtmosferica', 'HumedadSuelo'.
+        pandas.DataFrame: Un DataFrame con los datos meteorológicos horarios en las unidades de
+                          origen de Open-Meteo, con columnas 'time', 'Temperatura', 'HumedadRelativa',
+                          'PresionAtmosferica', 'HumedadSuelo', 'PrecipitacionMM' (NaN si la API no
+                          las devuelve). Usar especificacion_features.transformar_features para
+                          llevarlas a las unidades del modelo.
                           Retorna None si ocurre un error.
     """
-    base_url = "https://api.open-meteo.com/v1/forecast"
+    base_url = OPENMETEO_URL_PRONOSTICO
     params = {
         "latitude": latitud,
         "longitude": longitud,
@@ -44,7 +59,7 @@ def obtener_datos_meteorologicos_openmeteo(latitud: float, longitud: float, dias
 
     try:
         logger.info(f"Solicitando datos a Open-Meteo API: {base_url} con params: {params}")
-        response = requests.get(base_url, params=params, timeout=10) 
+        response = sesion_http.get(base_url, params=params, timeout=10)
         response.raise_for_status() 
         data = response.json()
         logger.info(f"Datos recibidos de Open-Meteo para {latitud},{longitud}.")
@@ -67,22 +82,15 @@ def obtener_datos_meteorologicos_openmeteo(latitud: float, longitud: float, dias
         columnas_finales_df = ['time'] + columnas_presentes_en_df
         df = df[columnas_finales_df]
 
-        for col_modelo in COLUMNAS_MODELO:
-            if col_modelo not in df.columns:
-                # Si HumedadSuelo no está, es esperado. Para otras, es un problema.
-                if col_modelo == 'HumedadSuelo':
-                    logger.info(f"La columna '{col_modelo}' no fue encontrada en los datos de Open-Meteo y será estimada.")
-                    df[col_modelo] = pd.NA 
+        # Las columnas ausentes se añaden como NaN; la imputación (estimación de HumedadSuelo,
+        # precipitación faltante = 0) la resuelve transformar_features según la especificación.
+        for col_esperada in COLUMNAS_A_SOLICITAR_API:
+            if col_esperada not in df.columns:
+                if col_esperada in COLUMNAS_MODELO and col_esperada != 'HumedadSuelo':
+                    logger.warning(f"La columna '{col_esperada}' esperada por el modelo no fue encontrada en los datos de Open-Meteo.")
                 else:
-                    logger.warning(f"La columna '{col_modelo}' esperada por el modelo no fue encontrada en los datos de Open-Meteo.")
-        
-        # Verificar si PrecipitacionMM está presente, ya que es necesaria para la estimación
-        if 'PrecipitacionMM' not in df.columns:
-            logger.warning("La columna 'PrecipitacionMM' necesaria para estimar HumedadSuelo no fue encontrada en los datos de Open-Meteo.")
-            # Podríamos añadirla con pd.NA o 0 si queremos que la estimación proceda con un default para precipitación
-            df['PrecipitacionMM'] = 0.0 # O pd.NA, si la función de estimación lo maneja
-            logger.info("Se añadió 'PrecipitacionMM' con valores por defecto (0.0) debido a su ausencia en la API.")
-
+                    logger.info(f"La columna '{col_esperada}' no fue encontrada en los datos de Open-Meteo y será imputada.")
+                df[col_esperada] = float('nan')
 
         logger.info(f"DataFrame procesado de Open-Meteo con {len(df)} filas y columnas: {df.columns.tolist()}")
         # Ejemplo de inspección de datos:
@@ -106,6 +114,63 @@ def obtener_datos_meteorologicos_openmeteo(latitud: float, longitud: float, dias
 
     return None
 
+def obtener_cubo_meteorologico_openmeteo(latitudes, longitudes, dias_prediccion: int = 1, elevaciones=None, zona_horaria="auto"):
+    """
+    Obtiene datos horarios de Open-Meteo para varias coordenadas con una sola petición multi-ubicación
+    (listas de latitudes/longitudes separadas por comas) y los ensambla en un arreglo.
+
+    Args:
+        latitudes (sequence): Latitudes de cada punto (a lo sumo MAX_COORDENADAS_POR_PETICION).
+        longitudes (sequence): Longitudes de cada punto, en el mismo orden.
+        dias_prediccion (int): Número de días de pronóstico a obtener (1 a 16).
+        elevaciones (sequence, opcional): Altitud en metros de cada punto, para la corrección por altura de
+                                          Open-Meteo. Si falta alguna se usa el modelo de elevación de la API.
+        zona_horaria (str): Zona horaria de las horas devueltas. Con "auto" cada punto usa la suya, por lo que
+                            todos los puntos deben compartir zona para que las horas coincidan.
+
+    Returns:
+        tuple: (tiempos, cubo) con tiempos un pandas.DatetimeIndex de las horas y cubo un np.ndarray
+               float32 de forma (horas, puntos, len(COLUMNAS_A_SOLICITAR_API)) en unidades de origen
+               (NaN donde la API no devuelva la variable). Retorna None si ocurre un error.
+    """
+    if len(latitudes) != len(longitudes) or not 0 < len(latitudes) <= MAX_COORDENADAS_POR_PETICION:
+        raise ValueError(f"Se esperan entre 1 y {MAX_COORDENADAS_POR_PETICION} pares latitud/longitud.")
+
+    params = {
+        "latitude": ",".join(f"{lat:.5f}" for lat in latitudes),
+        "longitude": ",".join(f"{lon:.5f}" for lon in longitudes),
+        "hourly": ",".join(OPENMETEO_VARIABLES.values()),
+        "forecast_days": dias_prediccion,
+        "timezone": zona_horaria
+    }
+    if elevaciones is not None and all(e is not None and not np.isnan(e) for e in elevaciones):
+        params["elevation"] = ",".join(f"{e:.0f}" for e in elevaciones)
+    try:
+        logger.info(f"Solicitando datos multi-ubicación a Open-Meteo para {len(latitudes)} puntos.")
+        response = sesion_http.get(OPENMETEO_URL_PRONOSTICO, params=params, timeout=30)
+        response.raise_for_status()
+        data = response.json()
+        respuestas = data if isinstance(data, list) else [data] # Con un solo punto la API no devuelve lista
+
+        tiempos = pd.to_datetime(respuestas[0]['hourly']['time'])
+        cubo = np.full((len(tiempos), len(respuestas), len(COLUMNAS_A_SOLICITAR_API)), np.nan, dtype=np.float32)
+        for i, respuesta in enumerate(respuestas):
+            horario = respuesta['hourly']
+            if len(horario['time']) != len(tiempos):
+                logger.error("Las series horarias de Open-Meteo no tienen la misma longitud para todos los puntos.")
+                return None
+            for j, columna in enumerate(COLUMNAS_A_SOLICITAR_API):
+                valores = horario.get(OPENMETEO_VARIABLES[columna])
+                if valores is not None:
+                    cubo[:, i, j] = np.array(valores, dtype=np.float32) # Los null de JSON llegan como None -> NaN
+        return tiempos, cubo
+
+    except requests.exceptions.RequestException as req_err:
+        logger.error(f"Error de requests al contactar Open-Meteo (multi-ubicación): {req_err}")
+    except (ValueError, KeyError, IndexError, TypeError) as datos_err:
+        logger.error(f"Respuesta multi-ubicación de Open-Meteo inesperada: {datos_err}")
+    return None
+
 if __name__ == '__main__':
     # Ejemplo de uso (para pruebas directas del script)
     logging.basicConfig(level=logging.INFO)
@@ -122,6 +187,8 @@ if __name__ == '__main__':
         print(f"\nForma del DataFrame: {datos_df.shape}")
         print(f"\nColumnas: {datos_df.columns.tolist()}")
         print(f"\nTipos de datos:\n{datos_df.dtypes}")
+        datos_df = transformar_features(datos_df)
+        print(f"\nDatos en unidades del modelo:\n{datos_df.head()}")
 
         manana_inicio = (datetime.now() + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
         manana_madrugada_fin = manana_inicio.replace(hour=6)
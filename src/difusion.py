@@ -0,0 +1,171 @@
+# coding: utf-8
+"""
+Difusión en proceso de nuevas predicciones a los navegadores mediante Server-Sent Events (SSE).
+
+Un único DifusorPredicciones reparte cada predicción guardada a todas las conexiones suscritas a su
+estación (o a todas las estaciones). El evento se serializa una sola vez y se copia a colas acotadas
+por conexión: un cliente lento pierde los eventos más antiguos en lugar de frenar a los demás.
+Las conexiones inactivas solo reciben un comentario de latido cada pocos segundos, que mantiene
+abiertos los proxies y permite detectar clientes desconectados.
+
+Cada conexión abierta ocupa su hilo del servidor WSGI mientras dura. Con un trabajador asíncrono
+(gunicorn -k gevent o eventlet, que parchean los sockets) cada conexión es una corrutina liviana y se
+admiten hasta MAX_CONEXIONES. Con hilos (gunicorn --threads N, servidor de desarrollo) el límite es
+una fracción de los hilos del trabajador, para que los flujos no dejen sin hilos a las demás rutas, y
+cada flujo se cierra tras DURACION_MAXIMA_FLUJO_SEGUNDOS (el navegador se reconecta solo).
+"""
+import itertools
+import queue
+import threading
+import time
+
+try:
+    from src.cache_respuestas import a_json_bytes
+except ImportError:  # Ejecución directa desde src/
+    from cache_respuestas import a_json_bytes
+
+TODAS_LAS_ESTACIONES = '*'
+TAMANO_COLA_CONEXION = 16
+INTERVALO_LATIDO_SEGUNDOS = 15
+REINTENTO_CLIENTE_MS = 5000
+MAX_CONEXIONES = 1000               # Con trabajador asíncrono (gevent/eventlet)
+FRACCION_HILOS_EVENTOS = 0.5        # Con hilos: fracción de los hilos del trabajador que pueden ocupar los flujos
+DURACION_MAXIMA_FLUJO_SEGUNDOS = 300 # Con hilos: el flujo se cierra y el cliente se reconecta tras REINTENTO_CLIENTE_MS
+
+
+def trabajador_asincrono():
+    """True si el proceso corre con los sockets parcheados por gevent o eventlet (una corrutina por conexión)."""
+    try:
+        import gevent.monkey
+        if gevent.monkey.is_module_patched('socket'):
+            return True
+    except ImportError:
+        pass
+    try:
+        import eventlet.patcher
+        if eventlet.patcher.is_monkey_patched('socket'):
+            return True
+    except ImportError:
+        pass
+    return False
+
+
+def limite_conexiones(hilos_trabajador, fraccion=FRACCION_HILOS_EVENTOS):
+    """Máximo de conexiones de eventos por proceso según el tipo de trabajador (0 desactiva el canal)."""
+    if trabajador_asincrono():
+        return MAX_CONEXIONES
+    return int(hilos_trabajador * fraccion)
+
+
+class LimiteConexionesAlcanzado(Exception):
+    pass
+
+
+class DifusorPredicciones:
+    """Difusor publicador/suscriptor de predicciones por estación, seguro entre hilos."""
+
+    def __init__(self, tamano_cola=TAMANO_COLA_CONEXION, intervalo_latido=INTERVALO_LATIDO_SEGUNDOS, max_conexiones=MAX_CONEXIONES,
+                 duracion_maxima=None):
+        self.tamano_cola = tamano_cola
+        self.intervalo_latido = intervalo_latido
+        self.max_conexiones = max_conexiones
+        self.duracion_maxima = duracion_maxima # Segundos de vida de cada flujo; None = sin límite
+        self._suscriptores = {} # estacion -> set de colas
+        self._ultimo_evento = {} # estacion -> último evento serializado, para enviarlo al conectar
+        self._ids = itertools.count(1)
+        self._candado = threading.Lock()
+
+    @property
+    def conexiones(self):
+        with self._candado:
+            return sum(len(colas) for colas in self._suscriptores.values())
+
+    def suscribir(self, estacion=TODAS_LAS_ESTACIONES):
+        with self._candado:
+            if sum(len(colas) for colas in self._suscriptores.values()) >= self.max_conexiones:
+                raise LimiteConexionesAlcanzado(f"Se alcanzó el máximo de {self.max_conexiones} conexiones de eventos.")
+            cola = queue.Queue(maxsize=self.tamano_cola)
+            self._suscriptores.setdefault(estacion, set()).add(cola)
+            return cola
+
+    def cancelar(self, estacion, cola):
+        with self._candado:
+            colas = self._suscriptores.get(estacion)
+            if colas is not None:
+                colas.discard(cola)
+                if not colas:
+                    del self._suscriptores[estacion]
+
+    def publicar(self, estacion, datos, tipo_evento='prediccion'):
+        """Serializa el evento una vez y lo entrega a los suscriptores de la estación y a los globales."""
+        evento_id = next(self._ids)
+        mensaje = f"id: {evento_id}\nevent: {tipo_evento}\ndata: {a_json_bytes(datos).decode('utf-8')}\n\n"
+        with self._candado:
+            self._ultimo_evento[estacion] = mensaje
+            destinatarios = list(self._suscriptores.get(estacion, ())) + list(self._suscriptores.get(TODAS_LAS_ESTACIONES, ()))
+        for cola in destinatarios:
+            while True:
+                try:
+                    cola.put_nowait(mensaje)
+                    break
+                except queue.Full:
+                    try:
+                        cola.get_nowait() # Cliente lento: se descarta el evento más antiguo
+                    except queue.Empty:
+                        pass
+        return len(destinatarios)
+
+    def flujo(self, estacion=TODAS_LAS_ESTACIONES, cola=None):
+        """
+        Iterable de texto SSE para una conexión. Usa la cola ya suscrita o, si no se pasa, suscribe de
+        inmediato (puede lanzar LimiteConexionesAlcanzado). La suscripción se cancela al cerrarse el
+        iterable (también si el servidor lo cierra antes de enviar el primer fragmento), al
+        desconectarse el cliente o, si hay duracion_maxima, cuando esta se cumple.
+        """
+        if cola is None:
+            cola = self.suscribir(estacion)
+        fin = time.monotonic() + self.duracion_maxima if self.duracion_maxima else None
+
+        def generar():
+            try:
+                yield f"retry: {REINTENTO_CLIENTE_MS}\n\n"
+                with self._candado:
+                    if estacion == TODAS_LAS_ESTACIONES:
+                        iniciales = list(self._ultimo_evento.values())
+                    else:
+                        iniciales = [self._ultimo_evento[estacion]] if estacion in self._ultimo_evento else []
+                for mensaje in iniciales:
+                    yield mensaje
+                while fin is None or time.monotonic() < fin:
+                    espera = self.intervalo_latido if fin is None else max(0.0, min(self.intervalo_latido, fin - time.monotonic()))
+                    try:
+                        yield cola.get(timeout=espera)
+                    except queue.Empty:
+                        yield ": latido\n\n"
+            finally: # GeneratorExit al cerrar el cliente la conexión
+                self.cancelar(estacion, cola)
+
+        return _FlujoEventos(generar(), lambda: self.cancelar(estacion, cola))
+
+
+class _FlujoEventos:
+    """
+    Envoltorio del generador SSE cuyo close() libera la suscripción aunque el generador no haya
+    empezado: cerrar un generador sin iniciar no ejecuta su bloque finally.
+    """
+
+    def __init__(self, generador, liberar):
+        self._generador = generador
+        self._liberar = liberar
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._generador)
+
+    def close(self):
+        try:
+            self._generador.close()
+        finally:
+            self._liberar() # cancelar es idempotente
@@ -1,12 +1,23 @@
 # coding: utf-8
+import argparse
+import time
 import pandas as pd
 import joblib
-from sklearn.tree import DecisionTreeClassifier, plot_tree
+from joblib import Parallel, delayed
+from sklearn.tree import DecisionTreeClassifier
+from sklearn.ensemble import RandomForestClassifier, HistGradientBoostingClassifier
+from sklearn.calibration import CalibratedClassifierCV
 from sklearn.model_selection import train_test_split
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
-import matplotlib.pyplot as plt
+from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, brier_score_loss
 import os
 
+try:
+    from src.especificacion_features import (COLUMNAS_MODELO, FUENTE_MODELO, transformar_features,
+                                             calcular_estadisticas_entrenamiento, guardar_estadisticas, ruta_estadisticas_version)
+except ImportError:  # Ejecución directa desde src/
+    from especificacion_features import (COLUMNAS_MODELO, FUENTE_MODELO, transformar_features,
+                                         calcular_estadisticas_entrenamiento, guardar_estadisticas, ruta_estadisticas_version)
+
 # --- Configuración de Rutas ---
 RUTA_BASE = "../"  # Ajustar si es necesario para que las rutas relativas funcionen desde src/
 RUTA_DATOS_PROCESADOS = os.path.join(RUTA_BASE, "datos/procesados/")
@@ -21,19 +32,107 @@ os.makedirs(RUTA_GRAFICAS, exist_ok=True)
 
 # --- Constantes del Modelo ---
 NOMBRE_ARCHIVO_DATOS = "datos_completos.csv"
-NOMBRE_MODELO_PKL = "modelo_arbol_decision.pkl"
+# Tipos de modelo entrenables y su archivo; el nombre sin '.pkl' es la 'version_modelo' del registro de estaciones.
+NOMBRES_MODELO_PKL = {
+    'arbol': "modelo_arbol_decision.pkl",
+    'bosque': "modelo_bosque_aleatorio.pkl",
+    'gradiente': "modelo_gradiente_histograma.pkl",
+}
+NOMBRE_MODELO_PKL = NOMBRES_MODELO_PKL['arbol']
 NOMBRE_METRICAS_CSV = "metricas_entrenamiento.csv"
-NOMBRE_GRAFICA_ARBOL = "arbol_decision.png"
+NOMBRE_GRAFICA_ARBOL = "arbol_decision" # Se añade .png (árbol pequeño) o .txt/.dot (árbol grande)
 
-COLUMNAS_FEATURES = ['Temperatura', 'HumedadRelativa', 'PresionAtmosferica', 'HumedadSuelo']
+COLUMNAS_FEATURES = COLUMNAS_MODELO # Definidas (con unidades y rangos) en especificacion_features.py
 COLUMNA_TARGET = 'HeladaSuelo'
 TEST_SIZE = 0.2
 RANDOM_STATE = 42
 
-def entrenar_y_evaluar_modelo(visualizar_arbol=True):
+# --- Ensambles ---
+# El árbol sin podar da probabilidades casi siempre 0 o 1, con lo que los umbrales 0.60/0.80 de
+# determinar_estado_helada apenas distinguen casos. Los ensambles se calibran con validación cruzada.
+METODOS_CALIBRACION = ('isotonic', 'sigmoid', 'ninguna')
+METODO_CALIBRACION = 'isotonic'
+PLIEGUES_CALIBRACION = 5
+N_ARBOLES_BOSQUE = 300
+MIN_MUESTRAS_HOJA_BOSQUE = 5
+ITERACIONES_GRADIENTE = 200
+TASA_APRENDIZAJE_GRADIENTE = 0.05
+MAX_HOJAS_GRADIENTE = 15
+N_TRABAJOS_PARALELOS = -1 # -1 usa todos los núcleos disponibles
+
+def generar_reportes_entrenamiento(modelo, nombres_variables, ruta_modelo_pkl, ruta_csv_datos):
     """
-    Carga los datos, entrena un modelo de árbol de decisión, lo evalúa,
-    guarda el modelo y las métricas, y opcionalmente visualiza el árbol.
+    Etapa opcional de reportes del entrenamiento. Importa matplotlib de forma diferida (backend Agg)
+    y no vuelve a dibujar si el modelo y los datos de entrada no cambiaron.
+    """
+    try:
+        from src.reportes_graficos import calcular_huella, generar_reporte_arbol
+    except ImportError:  # Ejecución directa desde src/
+        from reportes_graficos import calcular_huella, generar_reporte_arbol
+
+    print("Generando reporte del árbol de decisión...")
+    huella = calcular_huella([ruta_modelo_pkl, ruta_csv_datos], parametros=list(nombres_variables))
+    try:
+        rutas = generar_reporte_arbol(
+            modelo, nombres_variables,
+            os.path.join(RUTA_GRAFICAS, NOMBRE_GRAFICA_ARBOL), huella,
+            titulo=f"Árbol de Decisión - Predicción de {COLUMNA_TARGET}"
+        )
+        print(f"Reporte del árbol disponible en: {', '.join(rutas)}")
+    except Exception as e:
+        print(f"Error al generar el reporte del árbol: {e}")
+
+
+def crear_modelo(tipo, calibracion=METODO_CALIBRACION, n_jobs=N_TRABAJOS_PARALELOS):
+    """
+    Estimador sin entrenar para 'arbol', 'bosque' o 'gradiente'. Los ensambles se envuelven en
+    CalibratedClassifierCV salvo con calibracion='ninguna'; el árbol se deja igual que siempre
+    (lo usan el explicador de predicciones y la evaluación de la hipótesis H02).
+    """
+    if tipo == 'arbol':
+        # Se puede ajustar hiperparámetros como max_depth o min_samples_split según necesidades
+        return DecisionTreeClassifier(random_state=RANDOM_STATE, max_depth=None)
+    if tipo == 'bosque':
+        modelo = RandomForestClassifier(n_estimators=N_ARBOLES_BOSQUE, min_samples_leaf=MIN_MUESTRAS_HOJA_BOSQUE,
+                                        n_jobs=n_jobs, random_state=RANDOM_STATE)
+    elif tipo == 'gradiente':
+        modelo = HistGradientBoostingClassifier(max_iter=ITERACIONES_GRADIENTE, learning_rate=TASA_APRENDIZAJE_GRADIENTE,
+                                                max_leaf_nodes=MAX_HOJAS_GRADIENTE, random_state=RANDOM_STATE)
+    else:
+        raise ValueError(f"Tipo de modelo desconocido: {tipo}. Opciones: {list(NOMBRES_MODELO_PKL)}")
+    if calibracion == 'ninguna':
+        return modelo
+    # Primer argumento posicional: 'base_estimator' hasta sklearn 1.1, 'estimator' desde 1.2.
+    return CalibratedClassifierCV(modelo, method=calibracion, cv=PLIEGUES_CALIBRACION, n_jobs=n_jobs)
+
+
+def _entrenar_modelo(tipo, X_entrenamiento, y_entrenamiento, calibracion, n_jobs):
+    """Entrena un modelo (se ejecuta en un proceso aparte cuando se entrenan varios a la vez)."""
+    modelo = crear_modelo(tipo, calibracion=calibracion, n_jobs=n_jobs)
+    inicio = time.perf_counter()
+    modelo.fit(X_entrenamiento, y_entrenamiento)
+    return tipo, modelo, time.perf_counter() - inicio
+
+
+def calcular_metricas(modelo, X_prueba, y_prueba):
+    """Métricas de clasificación y Brier (calidad de las probabilidades) sobre el conjunto de prueba."""
+    y_prediccion = modelo.predict(X_prueba)
+    clases = list(modelo.classes_)
+    probabilidad = modelo.predict_proba(X_prueba)[:, clases.index(1) if 1 in clases else len(clases) - 1]
+    return {
+        'Exactitud': accuracy_score(y_prueba, y_prediccion),
+        'Precision': precision_score(y_prueba, y_prediccion, zero_division=0),
+        'Sensibilidad (Recall)': recall_score(y_prueba, y_prediccion, zero_division=0),
+        'F1-score': f1_score(y_prueba, y_prediccion, zero_division=0),
+        'Brier': brier_score_loss(y_prueba, probabilidad),
+        'Probabilidades distintas': len(set(probabilidad.round(3))), # ~2 en el árbol sin podar
+    }
+
+
+def entrenar_y_evaluar_modelo(visualizar_arbol=True, tipos_modelo=('arbol',), calibracion=METODO_CALIBRACION):
+    """
+    Carga los datos, entrena en paralelo los modelos indicados ('arbol', 'bosque', 'gradiente'),
+    los evalúa, guarda cada modelo y las métricas, y opcionalmente genera el reporte del árbol.
     """
     print("--- Iniciando Proceso de Entrenamiento y Evaluación del Modelo ---")
 
@@ -46,7 +145,13 @@ def entrenar_y_evaluar_modelo(visualizar_arbol=True):
         print(f"Error: No se encontró el archivo de datos en {ruta_csv_datos}")
         return
 
-    # 2. Definir características (X) y variable objetivo (y)
+    # 2. Aplicar la especificación de variables (rangos válidos e imputación, igual que en servicio)
+    # y definir características (X) y variable objetivo (y)
+    df = transformar_features(df, fuente=FUENTE_MODELO, limite_interpolacion=0)
+    filas_antes = len(df)
+    df = df.dropna(subset=COLUMNAS_FEATURES + [COLUMNA_TARGET])
+    if len(df) < filas_antes:
+        print(f"Advertencia: Se descartaron {filas_antes - len(df)} filas sin valores válidos tras aplicar la especificación.")
     X = df[COLUMNAS_FEATURES]
     y = df[COLUMNA_TARGET]
     print(f"Características seleccionadas: {COLUMNAS_FEATURES}")
@@ -58,57 +163,48 @@ def entrenar_y_evaluar_modelo(visualizar_arbol=True):
     )
     print(f"Datos divididos: {100*(1-TEST_SIZE):.0f}% entrenamiento, {100*TEST_SIZE:.0f}% prueba.")
 
-    # 4. Crear y entrenar el modelo de árbol de decisión
-    # Se puede ajustar hiperparámetros como max_depth o min_samples_split según necesidades
-    modelo = DecisionTreeClassifier(random_state=RANDOM_STATE, max_depth=None)
-    print("Entrenando el modelo de árbol de decisión...")
-    modelo.fit(X_entrenamiento, y_entrenamiento)
-    print("Modelo entrenado.")
-
-    # 5. Guardar el modelo entrenado
-    ruta_modelo_pkl = os.path.join(RUTA_MODELOS_ENTRENADOS, NOMBRE_MODELO_PKL)
-    joblib.dump(modelo, ruta_modelo_pkl)
-    print(f"Modelo guardado en: {ruta_modelo_pkl}")
-
-    # 6. Visualizar el árbol de decisión (opcional)
-    if visualizar_arbol:
-        print("Generando visualización del árbol de decisión...")
-        plt.figure(figsize=(25, 15))
-        plot_tree(
-            modelo,
-            feature_names=X.columns,
-            class_names=[str(c) for c in modelo.classes_], # 'No Helada', 'Helada' si son 0 y 1
-            filled=True,
-            rounded=True,
-            fontsize=10
-        )
-        plt.title(f"Árbol de Decisión - Predicción de {COLUMNA_TARGET}", fontsize=16)
-        ruta_guardado_arbol = os.path.join(RUTA_GRAFICAS, NOMBRE_GRAFICA_ARBOL)
-        try:
-            plt.savefig(ruta_guardado_arbol)
-            print(f"Visualización del árbol guardada en: {ruta_guardado_arbol}")
-        except Exception as e:
-            print(f"Error al guardar la visualización del árbol: {e}")
-        plt.close() # Cerrar la figura para liberar memoria
-
-    # 7. Realizar predicciones sobre el conjunto de prueba
-    y_prediccion = modelo.predict(X_prueba)
-
-    # 8. Evaluar el rendimiento del modelo
-    exactitud = accuracy_score(y_prueba, y_prediccion)
-    precision = precision_score(y_prueba, y_prediccion, zero_division=0)
-    sensibilidad = recall_score(y_prueba, y_prediccion, zero_division=0) # Recall
-    f1 = f1_score(y_prueba, y_prediccion, zero_division=0)
-
-    metricas = {
-        'Metrica': ['Exactitud', 'Precision', 'Sensibilidad (Recall)', 'F1-score'],
-        'Valor': [exactitud, precision, sensibilidad, f1]
-    }
-    df_metricas = pd.DataFrame(metricas)
+    # 4. Crear y entrenar los modelos, uno por proceso. Con varios modelos a la vez cada uno usa un
+    # solo núcleo internamente para no sobresuscribir la CPU.
+    tipos_modelo = list(dict.fromkeys(tipos_modelo))
+    n_jobs_interno = 1 if len(tipos_modelo) > 1 else N_TRABAJOS_PARALELOS
+    print(f"Entrenando {tipos_modelo} (calibración de ensambles: {calibracion})...")
+    entrenados = Parallel(n_jobs=len(tipos_modelo))(
+        delayed(_entrenar_modelo)(tipo, X_entrenamiento, y_entrenamiento, calibracion, n_jobs_interno)
+        for tipo in tipos_modelo
+    )
+    for tipo, _, segundos in entrenados:
+        print(f"Modelo '{tipo}' entrenado en {segundos:.1f} s.")
+
+    # 5. Guardar los modelos entrenados (estimadores de sklearn tal cual; el servicio los compila al cargarlos)
+    rutas_modelos = {}
+    for tipo, modelo, _ in entrenados:
+        rutas_modelos[tipo] = os.path.join(RUTA_MODELOS_ENTRENADOS, NOMBRES_MODELO_PKL[tipo])
+        joblib.dump(modelo, rutas_modelos[tipo])
+        print(f"Modelo guardado en: {rutas_modelos[tipo]}")
+
+    # 5.1 Guardar histogramas de entrenamiento por variable junto a cada versión (deriva y calidad en servicio)
+    estadisticas = calcular_estadisticas_entrenamiento(X_entrenamiento)
+    for tipo in rutas_modelos:
+        ruta_estadisticas_json = ruta_estadisticas_version(RUTA_MODELOS_ENTRENADOS, NOMBRES_MODELO_PKL[tipo])
+        guardar_estadisticas(estadisticas, ruta_estadisticas_json)
+        print(f"Estadísticas de entrenamiento guardadas en: {ruta_estadisticas_json}")
+
+    # 6. Reporte del árbol de decisión (opcional, omitido en CI con --sin-graficas)
+    modelos = {tipo: modelo for tipo, modelo, _ in entrenados}
+    if visualizar_arbol and 'arbol' in modelos:
+        generar_reportes_entrenamiento(modelos['arbol'], X.columns, rutas_modelos['arbol'], ruta_csv_datos)
+
+    # 7-8. Predecir sobre el conjunto de prueba y evaluar cada modelo (formato largo: Modelo, Metrica, Valor)
+    filas_metricas = []
+    for tipo, modelo, segundos in entrenados:
+        metricas = calcular_metricas(modelo, X_prueba, y_prueba)
+        metricas['Segundos de entrenamiento'] = segundos
+        filas_metricas += [{'Modelo': tipo, 'Metrica': m, 'Valor': v} for m, v in metricas.items()]
+    df_metricas = pd.DataFrame(filas_metricas)
 
     # 9. Imprimir y guardar métricas
     print("\n--- Resultados de Evaluación del Modelo (sobre conjunto de prueba) ---")
-    print(df_metricas.to_string(index=False, float_format='{:,.3f}'.format))
+    print(df_metricas.pivot(index='Metrica', columns='Modelo', values='Valor').to_string(float_format='{:,.3f}'.format))
 
     ruta_metricas_csv = os.path.join(RUTA_RESULTADOS_EVALUACION, NOMBRE_METRICAS_CSV)
     df_metricas.to_csv(ruta_metricas_csv, index=False)
@@ -116,6 +212,18 @@ def entrenar_y_evaluar_modelo(visualizar_arbol=True):
     print("--- Proceso de Entrenamiento y Evaluación Finalizado ---")
 
 if __name__ == '__main__':
-    # Ejecutar el entrenamiento y la evaluación, con visualización del árbol.
-    # Cambiar a False si no se desea la visualización.
-    entrenar_y_evaluar_modelo(visualizar_arbol=True)
+    # Ejecutar el entrenamiento y la evaluación. El reporte del árbol se genera por defecto;
+    # en CI o servidores sin pantalla usar --sin-graficas (o GENERAR_GRAFICAS=false) para que solo se entrene.
+    parser = argparse.ArgumentParser(description="Entrenamiento del modelo de predicción de heladas.")
+    parser.add_argument('--sin-graficas', action='store_true', help="No generar el reporte gráfico del árbol.")
+    parser.add_argument('--modelos', default=','.join(NOMBRES_MODELO_PKL),
+                        help=f"Modelos a entrenar en paralelo, separados por comas (opciones: {','.join(NOMBRES_MODELO_PKL)}).")
+    parser.add_argument('--calibracion', choices=METODOS_CALIBRACION, default=METODO_CALIBRACION,
+                        help="Calibración de probabilidades de los ensambles.")
+    args = parser.parse_args()
+    tipos = [t.strip() for t in args.modelos.split(',') if t.strip()]
+    desconocidos = [t for t in tipos if t not in NOMBRES_MODELO_PKL]
+    if desconocidos:
+        parser.error(f"Modelos desconocidos: {desconocidos}")
+    generar_graficas = os.environ.get('GENERAR_GRAFICAS', 'true').lower() == 'true' and not args.sin_graficas
+    entrenar_y_evaluar_modelo(visualizar_arbol=generar_graficas, tipos_modelo=tipos, calibracion=args.calibracion)
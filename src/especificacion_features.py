@@ -0,0 +1,340 @@
+# coding: utf-8
+"""
+Especificación declarativa de las variables del modelo, compartida por entrenamiento,
+evaluación y servicio (main.py / data_fetcher.py).
+
+Cada variable define:
+- la variable de Open-Meteo de la que proviene y su unidad de origen,
+- la unidad en la que se entrenó el modelo y la conversión lineal (factor, desplazamiento) por fuente,
+- el rango físicamente válido en unidades del modelo,
+- la estrategia de imputación.
+
+`transformar_features` aplica todo como una única transformación vectorizada sobre el DataFrame,
+y `calcular_deriva` compara datos servidos contra los histogramas precalculados del entrenamiento.
+`MonitorDeriva` acumula los valores servidos en una ventana móvil y solo calcula el PSI con una muestra
+suficiente: un único pronóstico de 48 horas de una estación no representa la distribución de entrenamiento.
+
+Las estadísticas (modelos_entrenados/estadisticas_features.json) las escribe el entrenamiento; para
+regenerarlas sin reentrenar: python src/especificacion_features.py --generar-estadisticas
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+FUENTE_MODELO = 'modelo'         # Datos ya en unidades del modelo (CSV de entrenamiento/evaluación)
+FUENTE_OPENMETEO = 'openmeteo'   # Respuesta horaria de la API de Open-Meteo
+
+# Número máximo de horas consecutivas faltantes que se rellenan por interpolación.
+LIMITE_INTERPOLACION_HORAS = 3
+
+ESPECIFICACION_FEATURES = {
+    'Temperatura': {
+        'variable_openmeteo': 'temperature_2m',
+        'unidad': '°C',
+        'conversiones': {FUENTE_OPENMETEO: (1.0, 0.0)},  # °C -> °C
+        'rango_valido': (-40.0, 50.0),
+        'max_cambio_horario': 10.0,  # °C/h; saltos mayores no son físicos fuera de frentes muy bruscos
+        'imputacion': 'interpolar',
+    },
+    'HumedadRelativa': {
+        'variable_openmeteo': 'relativehumidity_2m',
+        'unidad': '%',
+        'conversiones': {FUENTE_OPENMETEO: (1.0, 0.0)},  # % -> %
+        'rango_valido': (0.0, 100.0),
+        'max_cambio_horario': 40.0,  # %/h
+        'imputacion': 'interpolar',
+    },
+    'PresionAtmosferica': {
+        # El CSV de entrenamiento está en hPa reducidos al nivel del mar (~950-1050). La presión en
+        # superficie ('surface_pressure') en la zona andina ronda los 650-700 hPa y queda fuera de esa
+        # distribución, por eso se usa la presión a nivel del mar de Open-Meteo (ya en hPa).
+        'variable_openmeteo': 'pressure_msl',
+        'unidad': 'hPa',
+        'conversiones': {FUENTE_OPENMETEO: (1.0, 0.0)},  # hPa -> hPa
+        'rango_valido': (870.0, 1085.0),
+        'max_cambio_horario': 6.0,  # hPa/h
+        'imputacion': 'interpolar',
+    },
+    'HumedadSuelo': {
+        # El modelo se entrenó con contenido volumétrico en porcentaje (0-100);
+        # Open-Meteo entrega m³/m³ (0-1).
+        'variable_openmeteo': 'soil_moisture_3_to_9cm',
+        'unidad': '%',
+        'conversiones': {FUENTE_OPENMETEO: (100.0, 0.0)},  # m³/m³ -> %
+        'rango_valido': (0.0, 100.0),
+        'max_cambio_horario': 20.0,  # %/h
+        'imputacion': 'estimar_humedad_suelo',
+    },
+}
+
+# Variables que no entran al modelo pero se usan para imputar (p. ej. la humedad del suelo).
+ESPECIFICACION_AUXILIARES = {
+    'PrecipitacionMM': {
+        # 'precipitation_sum' es una variable diaria de Open-Meteo; la horaria es 'precipitation'.
+        'variable_openmeteo': 'precipitation',
+        'unidad': 'mm',
+        'conversiones': {FUENTE_OPENMETEO: (1.0, 0.0)},
+        'rango_valido': (0.0, 300.0),
+        'imputacion': 'cero',
+    },
+}
+
+COLUMNAS_MODELO = list(ESPECIFICACION_FEATURES.keys())
+ESPECIFICACION_COMPLETA = {**ESPECIFICACION_FEATURES, **ESPECIFICACION_AUXILIARES}
+VARIABLES_OPENMETEO = {nombre: spec['variable_openmeteo'] for nombre, spec in ESPECIFICACION_COMPLETA.items()}
+
+# --- Estadísticas de entrenamiento para la detección de deriva ---
+NOMBRE_ESTADISTICAS_JSON = "estadisticas_features.json"  # Compartido: respaldo para versiones sin archivo propio
+SUFIJO_ESTADISTICAS_JSON = ".estadisticas.json"  # Por versión: <version>.estadisticas.json junto a <version>.pkl
+N_INTERVALOS_HISTOGRAMA = 10
+UMBRAL_DERIVA_PSI = 0.25  # PSI > 0.25 suele considerarse un cambio de distribución importante
+EPSILON_PSI = 1e-4
+MIN_MUESTRAS_DERIVA = 500     # Valores por variable necesarios para que el PSI sea informativo
+TAMANO_VENTANA_DERIVA = 5000  # Últimos valores servidos que conserva el monitor, por variable
+
+
+def estimar_humedad_suelo(humedad_relativa, precipitacion_mm):
+    """
+    Estimación heurística vectorizada de la humedad volumétrica del suelo, en % (unidades del modelo),
+    a partir de la humedad relativa (%) y la precipitación (mm). Acotada a 5-55 %.
+    Devuelve NaN donde falte alguna de las entradas.
+    """
+    puntaje = np.asarray(humedad_relativa, dtype=np.float64) * 0.6 + np.asarray(precipitacion_mm, dtype=np.float64) * 1.2
+    # puntaje / 200 está en m³/m³; se acota a [0.05, 0.55] y se pasa a %.
+    return np.clip(puntaje / 200.0, 0.05, 0.55) * 100.0
+
+
+def transformar_cubo(cubo, nombres_variables, fuente=FUENTE_OPENMETEO, limite_interpolacion=LIMITE_INTERPOLACION_HORAS):
+    """
+    Aplica la especificación sobre un arreglo (horas x series x variables) en una sola pasada vectorizada:
+    conversión de unidades, descarte de valores fuera de rango e imputación. Cada serie (estación o
+    celda de una grilla) se interpola solo a lo largo de su propio eje de horas.
+
+    Args:
+        cubo (np.ndarray): Arreglo float de forma (horas, series, variables), en unidades de `fuente`.
+        nombres_variables (list): Nombre de cada variable del último eje. Las variables de la
+                                  especificación que no estén presentes se añaden como NaN.
+        fuente (str): FUENTE_OPENMETEO o FUENTE_MODELO (sin conversión de unidades).
+        limite_interpolacion (int): Máximo de valores consecutivos a interpolar. 0 desactiva la
+                                    interpolación (filas sin orden temporal, como los CSV de entrenamiento).
+
+    Returns:
+        tuple: (cubo_transformado, nombres) con las variables de ESPECIFICACION_COMPLETA en unidades del modelo.
+    """
+    cubo = np.asarray(cubo, dtype=np.float64)
+    n_horas, n_series = cubo.shape[:2]
+    indice = {nombre: i for i, nombre in enumerate(nombres_variables)}
+    nombres = list(ESPECIFICACION_COMPLETA.keys())
+    salida = np.full((n_horas, n_series, len(nombres)), np.nan)
+
+    fuera_de_rango = {}
+    for j, nombre in enumerate(nombres):
+        spec = ESPECIFICACION_COMPLETA[nombre]
+        if nombre not in indice:
+            continue
+        factor, desplazamiento = spec['conversiones'].get(fuente, (1.0, 0.0))
+        valores = cubo[:, :, indice[nombre]] * factor + desplazamiento
+        minimo, maximo = spec['rango_valido']
+        invalidos = (valores < minimo) | (valores > maximo)
+        if invalidos.any():
+            fuera_de_rango[nombre] = int(invalidos.sum())
+            valores[invalidos] = np.nan
+        salida[:, :, j] = valores
+
+    if fuera_de_rango:
+        logger.warning(f"Valores fuera de rango descartados (se intentará imputar): {fuera_de_rango}")
+
+    # La imputación se hace después de convertir todas las variables, porque algunas dependen de otras.
+    for j, nombre in enumerate(nombres):
+        spec = ESPECIFICACION_COMPLETA[nombre]
+        valores = salida[:, :, j]
+        if not np.isnan(valores).any():
+            continue
+        if spec['imputacion'] == 'interpolar' and limite_interpolacion:
+            # Un DataFrame horas x series interpola todas las series a la vez, cada una en su columna.
+            salida[:, :, j] = pd.DataFrame(valores).interpolate(limit=limite_interpolacion, limit_direction='both').to_numpy()
+        elif spec['imputacion'] == 'cero':
+            salida[:, :, j] = np.nan_to_num(valores, nan=0.0)
+
+    for j, nombre in enumerate(nombres):
+        if ESPECIFICACION_COMPLETA[nombre]['imputacion'] == 'estimar_humedad_suelo':
+            faltantes = np.isnan(salida[:, :, j])
+            if faltantes.any():
+                estimada = estimar_humedad_suelo(salida[:, :, nombres.index('HumedadRelativa')], salida[:, :, nombres.index('PrecipitacionMM')])
+                salida[:, :, j][faltantes] = estimada[faltantes]
+                logger.info(f"'{nombre}' estimada para {int(faltantes.sum())} valores a partir de HumedadRelativa y PrecipitacionMM.")
+
+    return salida, nombres
+
+
+def transformar_features(df, fuente=FUENTE_OPENMETEO, limite_interpolacion=LIMITE_INTERPOLACION_HORAS):
+    """
+    Aplica la especificación completa sobre un DataFrame (una serie horaria en orden temporal)
+    mediante transformar_cubo.
+
+    Args:
+        df (pandas.DataFrame): Datos con las columnas ya nombradas como en la especificación.
+        fuente (str): FUENTE_OPENMETEO o FUENTE_MODELO (sin conversión de unidades).
+        limite_interpolacion (int): Máximo de valores consecutivos a interpolar (0 la desactiva).
+
+    Returns:
+        pandas.DataFrame: Copia de df con las columnas de la especificación en unidades del modelo.
+                          Las columnas ausentes se añaden (imputadas o NaN).
+    """
+    df = df.copy()
+    presentes = [nombre for nombre in ESPECIFICACION_COMPLETA if nombre in df.columns]
+    cubo = df[presentes].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)[:, None, :]
+    cubo_transformado, nombres = transformar_cubo(cubo, presentes, fuente=fuente, limite_interpolacion=limite_interpolacion)
+    for j, nombre in enumerate(nombres):
+        df[nombre] = cubo_transformado[:, 0, j]
+    return df
+
+
+def calcular_estadisticas_entrenamiento(X, n_intervalos=N_INTERVALOS_HISTOGRAMA):
+    """
+    Precalcula, por variable del modelo, los bordes de un histograma por cuantiles y la proporción
+    de datos de entrenamiento en cada intervalo, además de estadísticas descriptivas.
+    """
+    estadisticas = {}
+    for nombre in COLUMNAS_MODELO:
+        valores = pd.to_numeric(X[nombre], errors='coerce').dropna().to_numpy(dtype=np.float64)
+        bordes = np.unique(np.quantile(valores, np.linspace(0, 1, n_intervalos + 1)[1:-1]))
+        conteos = np.bincount(np.searchsorted(bordes, valores, side='right'), minlength=len(bordes) + 1)
+        estadisticas[nombre] = {
+            'unidad': ESPECIFICACION_FEATURES[nombre]['unidad'],
+            'bordes': bordes.tolist(),
+            'proporciones': (conteos / max(len(valores), 1)).tolist(),
+            'media': float(valores.mean()),
+            'desviacion': float(valores.std()),
+            'minimo': float(valores.min()),
+            'maximo': float(valores.max()),
+        }
+    return estadisticas
+
+
+def ruta_estadisticas_version(ruta_modelos, nombre_modelo):
+    """Ruta de las estadísticas propias de una versión del modelo ('modelo_x.pkl' -> 'modelo_x.estadisticas.json')."""
+    version = os.path.splitext(os.path.basename(nombre_modelo))[0]
+    return os.path.join(ruta_modelos, version + SUFIJO_ESTADISTICAS_JSON)
+
+
+def guardar_estadisticas(estadisticas, ruta_json):
+    with open(ruta_json, 'w', encoding='utf-8') as f:
+        json.dump(estadisticas, f, ensure_ascii=False, indent=2)
+
+
+def cargar_estadisticas(ruta_json):
+    """Carga las estadísticas de entrenamiento; devuelve None si el archivo no existe."""
+    if not os.path.exists(ruta_json):
+        return None
+    with open(ruta_json, 'r', encoding='utf-8') as f:
+        estadisticas = json.load(f)
+    for stats in estadisticas.values():
+        stats['bordes'] = np.asarray(stats['bordes'], dtype=np.float64)
+        stats['proporciones'] = np.asarray(stats['proporciones'], dtype=np.float64)
+    return estadisticas
+
+
+def calcular_deriva(df, estadisticas, min_muestras=1):
+    """
+    Índice de estabilidad poblacional (PSI) de cada variable del lote frente al entrenamiento,
+    usando los bordes de histograma precalculados (un searchsorted + bincount por variable).
+
+    Returns:
+        dict: {variable: psi}. Variables con menos de min_muestras datos válidos en el lote se omiten.
+    """
+    deriva = {}
+    for nombre, stats in estadisticas.items():
+        if nombre not in df.columns:
+            continue
+        valores = pd.to_numeric(df[nombre], errors='coerce').to_numpy(dtype=np.float64)
+        valores = valores[~np.isnan(valores)]
+        if len(valores) < max(min_muestras, 1):
+            continue
+        conteos = np.bincount(np.searchsorted(stats['bordes'], valores, side='right'), minlength=len(stats['proporciones']))
+        p_lote = np.maximum(conteos / len(valores), EPSILON_PSI)
+        p_entrenamiento = np.maximum(stats['proporciones'], EPSILON_PSI)
+        deriva[nombre] = float(np.sum((p_lote - p_entrenamiento) * np.log(p_lote / p_entrenamiento)))
+    return deriva
+
+
+def registrar_deriva(df, estadisticas, umbral=UMBRAL_DERIVA_PSI, min_muestras=MIN_MUESTRAS_DERIVA):
+    """Calcula la deriva y registra una advertencia por cada variable que supere el umbral."""
+    if not estadisticas:
+        return {}
+    deriva = calcular_deriva(df, estadisticas, min_muestras)
+    con_deriva = {k: round(v, 3) for k, v in deriva.items() if v > umbral}
+    if con_deriva:
+        logger.warning(f"Deriva detectada respecto al entrenamiento (PSI > {umbral}): {con_deriva}")
+    return deriva
+
+
+class MonitorDeriva:
+    """
+    Ventana móvil de los últimos valores servidos por variable del modelo. Cada lote agregado se suma a
+    la ventana y la deriva se calcula sobre toda ella, solo para las variables con al menos min_muestras.
+    """
+
+    def __init__(self, estadisticas, tamano_ventana=TAMANO_VENTANA_DERIVA, min_muestras=MIN_MUESTRAS_DERIVA, umbral=UMBRAL_DERIVA_PSI):
+        self.estadisticas = estadisticas
+        self.tamano_ventana = tamano_ventana
+        self.min_muestras = min_muestras
+        self.umbral = umbral
+        self._candado = threading.Lock()
+        self._ventanas = {nombre: np.full(tamano_ventana, np.nan) for nombre in estadisticas}
+        self._posiciones = dict.fromkeys(estadisticas, 0) # Próxima posición a escribir (búfer circular)
+
+    def agregar(self, df):
+        """Suma los valores válidos del lote a la ventana y registra la deriva de la ventana. Retorna {variable: psi}."""
+        with self._candado:
+            for nombre, ventana in self._ventanas.items():
+                if nombre not in df.columns:
+                    continue
+                valores = pd.to_numeric(df[nombre], errors='coerce').to_numpy(dtype=np.float64)
+                valores = valores[~np.isnan(valores)][-self.tamano_ventana:]
+                posiciones = (self._posiciones[nombre] + np.arange(len(valores))) % self.tamano_ventana
+                ventana[posiciones] = valores
+                self._posiciones[nombre] = (self._posiciones[nombre] + len(valores)) % self.tamano_ventana
+            ventana_df = pd.DataFrame({nombre: ventana.copy() for nombre, ventana in self._ventanas.items()})
+        return registrar_deriva(ventana_df, self.estadisticas, self.umbral, self.min_muestras)
+
+
+def generar_estadisticas_desde_csv(ruta_csv, ruta_json, fuente=FUENTE_MODELO):
+    """
+    Calcula y guarda las estadísticas de deriva desde un CSV con las variables del modelo, aplicando la
+    especificación como en el entrenamiento (sin interpolar y descartando filas incompletas).
+    """
+    df = transformar_features(pd.read_csv(ruta_csv), fuente=fuente, limite_interpolacion=0).dropna(subset=COLUMNAS_MODELO)
+    estadisticas = calcular_estadisticas_entrenamiento(df[COLUMNAS_MODELO])
+    guardar_estadisticas(estadisticas, ruta_json)
+    return estadisticas
+
+
+if __name__ == '__main__':
+    RAIZ_PROYECTO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description="Utilidades de la especificación de variables del modelo.")
+    parser.add_argument('--generar-estadisticas', action='store_true',
+                        help="Genera las estadísticas de entrenamiento (deriva y rangos de calidad) desde un CSV.")
+    parser.add_argument('--csv', default=os.path.join(RAIZ_PROYECTO, "datos", "procesados", "datos_completos.csv"),
+                        help="CSV en unidades del modelo.")
+    parser.add_argument('--salida', default=None,
+                        help="Ruta del JSON de estadísticas (por defecto, el de --modelo o el compartido).")
+    parser.add_argument('--modelo', default=None,
+                        help="Versión del modelo (p. ej. modelo_arbol_decision.pkl) cuyas estadísticas se generan.")
+    args = parser.parse_args()
+    if args.generar_estadisticas:
+        ruta_modelos = os.path.join(RAIZ_PROYECTO, "modelos_entrenados")
+        if args.salida is None:
+            args.salida = (ruta_estadisticas_version(ruta_modelos, args.modelo) if args.modelo
+                           else os.path.join(ruta_modelos, NOMBRE_ESTADISTICAS_JSON))
+        generar_estadisticas_desde_csv(args.csv, args.salida)
+        print(f"Estadísticas guardadas en: {args.salida}")
+    else:
+        parser.print_help()
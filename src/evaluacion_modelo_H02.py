@@ -1,9 +1,15 @@
 # coding: utf-8
+import numpy as np
 import pandas as pd
 import joblib
 from sklearn.metrics import precision_score, recall_score, f1_score
 import os
 
+try:
+    from src.especificacion_features import COLUMNAS_MODELO, FUENTE_MODELO, transformar_features
+except ImportError:  # Ejecución directa desde src/
+    from especificacion_features import COLUMNAS_MODELO, FUENTE_MODELO, transformar_features
+
 # --- Configuración de Rutas ---
 RUTA_BASE = "../" # Ajustar si es necesario para que las rutas relativas funcionen desde src/
 RUTA_DATOS_PROCESADOS = os.path.join(RUTA_BASE, "datos/procesados/")
@@ -24,11 +30,105 @@ os.makedirs(RUTA_RESULTADOS_EVALUACION, exist_ok=True)
 NOMBRE_MODELO_PKL = "modelo_arbol_decision_hipotesis.pkl"
 # El archivo original era 'test2.csv', ahora renombrado a 'datos_prueba_evaluacion.csv'
 NOMBRE_DATOS_PRUEBA = "datos_prueba_evaluacion.csv"
-COLUMNAS_FEATURES = ['Temperatura', 'HumedadRelativa', 'PresionAtmosferica', 'HumedadSuelo']
+COLUMNAS_FEATURES = COLUMNAS_MODELO # Definidas (con unidades y rangos) en especificacion_features.py
 COLUMNA_TARGET = 'HeladaSuelo'
 # Nombre descriptivo para el archivo de salida de métricas de esta evaluación específica
 NOMBRE_METRICAS_H02_CSV = "metricas_evaluacion_H02.csv"
 
+# --- Constantes del Bootstrap ---
+# Modelo contra el que se compara el modelo de H02 en la prueba pareada (mismas filas remuestreadas).
+NOMBRE_MODELO_COMPARACION_PKL = "modelo_arbol_decision.pkl"
+N_REMUESTREOS_BOOTSTRAP = 10000
+NIVEL_CONFIANZA = 0.95
+SEMILLA_BOOTSTRAP = 42
+NOMBRE_INTERVALOS_H02_CSV = "metricas_evaluacion_H02_intervalos.csv"
+NOMBRE_COMPARACION_H02_CSV = "comparacion_modelos_H02.csv"
+
+
+def _metricas_desde_conteos(vp, fp, fn):
+    """
+    Calcula precisión, recall y F1 a partir de arreglos de conteos (verdaderos positivos,
+    falsos positivos y falsos negativos). Opera elemento a elemento sobre todos los remuestreos,
+    devolviendo 0 cuando el denominador es 0 (equivalente a zero_division=0 de sklearn).
+    """
+    vp, fp, fn = (np.asarray(c, dtype=np.float64) for c in (vp, fp, fn))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.where(vp + fp > 0, vp / (vp + fp), 0.0)
+        recall = np.where(vp + fn > 0, vp / (vp + fn), 0.0)
+        f1 = np.where(2 * vp + fp + fn > 0, 2 * vp / (2 * vp + fp + fn), 0.0)
+    return {'Precision': precision, 'Recall (Sensibilidad)': recall, 'F1-score': f1}
+
+
+def bootstrap_metricas_pareado(y_real, predicciones_por_modelo, n_remuestreos=N_REMUESTREOS_BOOTSTRAP, semilla=SEMILLA_BOOTSTRAP):
+    """
+    Remuestreo bootstrap vectorizado de precisión, recall y F1 sobre predicciones ya calculadas.
+
+    Cada fila del conjunto de prueba pertenece a una de 2^(k+1) categorías conjuntas
+    (valor real y predicción de cada uno de los k modelos). Remuestrear n filas con reemplazo y contar
+    cuántas caen en cada categoría equivale exactamente a una extracción multinomial con las
+    frecuencias observadas de esas categorías. Así se generan todos los remuestreos de una vez
+    (matriz n_remuestreos x categorías), sin volver a predecir, sin bucles por remuestreo y con un costo
+    que no crece con el tamaño del conjunto de prueba. Como todos los modelos comparten la misma
+    extracción, las distribuciones resultantes están pareadas.
+
+    Args:
+        y_real (array-like): Valores reales (0/1).
+        predicciones_por_modelo (dict): {nombre_modelo: predicciones 0/1} en el mismo orden que y_real.
+        n_remuestreos (int): Número de remuestreos bootstrap.
+        semilla (int): Semilla del generador aleatorio.
+
+    Returns:
+        dict: {nombre_modelo: {metrica: np.ndarray de forma (n_remuestreos,)}}.
+    """
+    y_real = np.asarray(y_real).astype(bool)
+    nombres = list(predicciones_por_modelo.keys())
+    predicciones = [np.asarray(predicciones_por_modelo[n]).astype(bool) for n in nombres]
+
+    # Código de categoría conjunta: bit 0 = valor real, bit i+1 = predicción del modelo i.
+    codigos = y_real.astype(np.int64)
+    for i, pred in enumerate(predicciones):
+        codigos |= pred.astype(np.int64) << (i + 1)
+    n_categorias = 1 << (len(nombres) + 1)
+    frecuencias = np.bincount(codigos, minlength=n_categorias) / len(codigos)
+
+    rng = np.random.default_rng(semilla)
+    conteos = rng.multinomial(len(codigos), frecuencias, size=n_remuestreos)  # (n_remuestreos, n_categorias)
+
+    categorias = np.arange(n_categorias)
+    es_real_positivo = (categorias & 1).astype(bool)
+    resultados = {}
+    for i, nombre in enumerate(nombres):
+        es_pred_positivo = ((categorias >> (i + 1)) & 1).astype(bool)
+        vp = conteos[:, es_real_positivo & es_pred_positivo].sum(axis=1)
+        fp = conteos[:, ~es_real_positivo & es_pred_positivo].sum(axis=1)
+        fn = conteos[:, es_real_positivo & ~es_pred_positivo].sum(axis=1)
+        resultados[nombre] = _metricas_desde_conteos(vp, fp, fn)
+    return resultados
+
+
+def _conteos_confusion(y_real, y_pred):
+    """Devuelve (verdaderos positivos, falsos positivos, falsos negativos) de un par real/predicción."""
+    y_real = np.asarray(y_real).astype(bool)
+    y_pred = np.asarray(y_pred).astype(bool)
+    return np.sum(y_real & y_pred), np.sum(~y_real & y_pred), np.sum(y_real & ~y_pred)
+
+
+def intervalo_percentil(distribucion, nivel_confianza=NIVEL_CONFIANZA):
+    """Intervalo de confianza por percentiles de una distribución bootstrap."""
+    alfa = 1.0 - nivel_confianza
+    inferior, superior = np.quantile(distribucion, [alfa / 2, 1 - alfa / 2])
+    return float(inferior), float(superior)
+
+
+def p_valor_bootstrap_pareado(diferencias):
+    """
+    p-valor bilateral de H0: diferencia = 0, a partir de la distribución bootstrap pareada
+    de las diferencias entre dos modelos.
+    """
+    diferencias = np.asarray(diferencias)
+    p = 2.0 * min(np.mean(diferencias <= 0), np.mean(diferencias >= 0))
+    return float(min(1.0, p))
+
 def evaluar_modelo_H02():
     """
     Evalúa el desempeño (precisión, recall, F1) de un modelo de árbol de decisión ya entrenado,
@@ -63,8 +163,9 @@ def evaluar_modelo_H02():
         print(f"Error al cargar los datos de prueba: {e}")
         return
 
-    # 3. Definir X_prueba y y_prueba (conjunto de prueba)
+    # 3. Definir X_prueba y y_prueba (conjunto de prueba), con la misma especificación que en entrenamiento
     try:
+        df_prueba = transformar_features(df_prueba, fuente=FUENTE_MODELO, limite_interpolacion=0).dropna(subset=COLUMNAS_FEATURES + [COLUMNA_TARGET])
         X_prueba = df_prueba[COLUMNAS_FEATURES]
         y_prueba = df_prueba[COLUMNA_TARGET]
     except KeyError as e:
@@ -104,6 +205,64 @@ def evaluar_modelo_H02():
     except Exception as e:
         print(f"Error al exportar las métricas H02 a CSV: {e}")
 
+    # 8. Intervalos de confianza bootstrap y prueba pareada contra el modelo de comparación
+    predicciones_por_modelo = {NOMBRE_MODELO_PKL: y_prediccion}
+    ruta_modelo_comparacion_pkl = os.path.join(RUTA_MODELOS_ENTRENADOS, NOMBRE_MODELO_COMPARACION_PKL)
+    if NOMBRE_MODELO_COMPARACION_PKL != NOMBRE_MODELO_PKL:
+        try:
+            modelo_comparacion = joblib.load(ruta_modelo_comparacion_pkl)
+            predicciones_por_modelo[NOMBRE_MODELO_COMPARACION_PKL] = modelo_comparacion.predict(X_prueba)
+            print(f"Modelo de comparación cargado desde: {ruta_modelo_comparacion_pkl}")
+        except FileNotFoundError:
+            print(f"Advertencia: No se encontró el modelo de comparación en {ruta_modelo_comparacion_pkl}. Se omite la prueba pareada.")
+        except Exception as e:
+            print(f"Advertencia: Error al cargar el modelo de comparación: {e}. Se omite la prueba pareada.")
+
+    print(f"\nCalculando {N_REMUESTREOS_BOOTSTRAP} remuestreos bootstrap (IC {NIVEL_CONFIANZA:.0%})...")
+    distribuciones = bootstrap_metricas_pareado(y_prueba, predicciones_por_modelo)
+    valores_puntuales = {'Precision': precision, 'Recall (Sensibilidad)': sensibilidad, 'F1-score': f1}
+
+    filas_intervalos = []
+    for metrica, valor in valores_puntuales.items():
+        ic_inferior, ic_superior = intervalo_percentil(distribuciones[NOMBRE_MODELO_PKL][metrica])
+        filas_intervalos.append({'Metrica': metrica, 'Valor': valor, 'IC_inferior': ic_inferior, 'IC_superior': ic_superior})
+        print(f"{metrica}: {valor:.3f} [{ic_inferior:.3f}, {ic_superior:.3f}]")
+    df_intervalos_H02 = pd.DataFrame(filas_intervalos)
+    df_intervalos_H02['Nivel_confianza'] = NIVEL_CONFIANZA
+    df_intervalos_H02['N_remuestreos'] = N_REMUESTREOS_BOOTSTRAP
+
+    ruta_intervalos_H02_csv = os.path.join(RUTA_RESULTADOS_EVALUACION, NOMBRE_INTERVALOS_H02_CSV)
+    try:
+        df_intervalos_H02.to_csv(ruta_intervalos_H02_csv, index=False, float_format='%.3f')
+        print(f"Intervalos de confianza H₀₂ exportados a: {ruta_intervalos_H02_csv}")
+    except Exception as e:
+        print(f"Error al exportar los intervalos de confianza H02 a CSV: {e}")
+
+    if NOMBRE_MODELO_COMPARACION_PKL in distribuciones and NOMBRE_MODELO_COMPARACION_PKL != NOMBRE_MODELO_PKL:
+        metricas_comparacion = _metricas_desde_conteos(
+            *_conteos_confusion(y_prueba, predicciones_por_modelo[NOMBRE_MODELO_COMPARACION_PKL])
+        )
+        filas_comparacion = []
+        print(f"\n--- Prueba pareada: {NOMBRE_MODELO_PKL} - {NOMBRE_MODELO_COMPARACION_PKL} ---")
+        for metrica, valor in valores_puntuales.items():
+            valor_comparacion = float(metricas_comparacion[metrica])
+            diferencias = distribuciones[NOMBRE_MODELO_PKL][metrica] - distribuciones[NOMBRE_MODELO_COMPARACION_PKL][metrica]
+            ic_inferior, ic_superior = intervalo_percentil(diferencias)
+            p_valor = p_valor_bootstrap_pareado(diferencias)
+            filas_comparacion.append({
+                'Metrica': metrica, 'Valor_H02': valor, 'Valor_comparacion': valor_comparacion,
+                'Diferencia': valor - valor_comparacion, 'IC_inferior': ic_inferior,
+                'IC_superior': ic_superior, 'p_valor': p_valor
+            })
+            print(f"{metrica}: diferencia {valor - valor_comparacion:+.3f} [{ic_inferior:+.3f}, {ic_superior:+.3f}], p={p_valor:.4f}")
+
+        ruta_comparacion_H02_csv = os.path.join(RUTA_RESULTADOS_EVALUACION, NOMBRE_COMPARACION_H02_CSV)
+        try:
+            pd.DataFrame(filas_comparacion).to_csv(ruta_comparacion_H02_csv, index=False, float_format='%.4f')
+            print(f"Prueba pareada H₀₂ exportada a: {ruta_comparacion_H02_csv}")
+        except Exception as e:
+            print(f"Error al exportar la prueba pareada H02 a CSV: {e}")
+
     print("--- Evaluación H₀₂ Finalizada ---")
 
 if __name__ == '__main__':
@@ -0,0 +1,225 @@
+# coding: utf-8
+"""
+Contribuciones exactas por camino del árbol (descomposición de Saabas) para modelos de árbol
+de decisión y bosques de sklearn, calibrados o no.
+
+Para cada nodo se precalcula cuánto cambia la probabilidad de helada al pasar desde su padre,
+y ese cambio se atribuye a la variable con la que se dividió el padre. La contribución de una
+fila es la suma de esa tabla sobre los nodos de su camino, por lo que:
+
+    probabilidad(fila) = valor_base + sum(contribuciones(fila))
+
+Con la tabla (nodos x variables) precalculada, todas las filas se explican con un único
+producto matriz dispersa (decision_path) por matriz densa.
+"""
+import numpy as np
+
+CLASE_POSITIVA = 1
+
+
+def _indice_clase_positiva(modelo, clase_positiva=CLASE_POSITIVA):
+    clases = list(getattr(modelo, 'classes_', [0, 1]))
+    return clases.index(clase_positiva) if clase_positiva in clases else len(clases) - 1
+
+
+def _arboles_del_modelo(modelo):
+    """Devuelve la lista de árboles (objetos con `tree_`) que componen el modelo."""
+    if hasattr(modelo, 'tree_'):
+        return [modelo]
+    if hasattr(modelo, 'estimators_') and all(hasattr(e, 'tree_') for e in modelo.estimators_):
+        return list(modelo.estimators_)
+    raise TypeError(f"El modelo {type(modelo).__name__} no es un árbol de decisión ni un bosque de árboles.")
+
+
+def _tabla_un_arbol(arbol, n_variables, indice_clase):
+    """Valor base y tabla (nodos x variables) de contribuciones de un único árbol."""
+    tree = arbol.tree_
+    valores = tree.value[:, 0, :].astype(np.float64)
+    # Según la versión de sklearn, `value` guarda conteos o fracciones; normalizar cubre ambos casos.
+    probabilidad_nodo = valores[:, indice_clase] / valores.sum(axis=1)
+
+    n_nodos = tree.node_count
+    padre = np.full(n_nodos, -1, dtype=np.int64)
+    internos = np.flatnonzero(tree.children_left != -1)
+    padre[tree.children_left[internos]] = internos
+    padre[tree.children_right[internos]] = internos
+
+    tabla = np.zeros((n_nodos, n_variables), dtype=np.float64)
+    hijos = np.flatnonzero(padre >= 0)
+    tabla[hijos, tree.feature[padre[hijos]]] = probabilidad_nodo[hijos] - probabilidad_nodo[padre[hijos]]
+    return float(probabilidad_nodo[0]), tabla
+
+
+def construir_tabla_contribuciones(modelo):
+    """
+    Precalcula la tabla de contribuciones por nodo del modelo.
+
+    Args:
+        modelo: DecisionTreeClassifier o bosque de árboles de sklearn ya entrenado.
+
+    Returns:
+        tuple: (valor_base, tabla) donde valor_base es la probabilidad de helada en la raíz
+               (promediada entre árboles) y tabla es un np.ndarray (nodos totales x variables)
+               alineado con las columnas de `modelo.decision_path`.
+    """
+    arboles = _arboles_del_modelo(modelo)
+    n_variables = modelo.n_features_in_
+    indice_clase = _indice_clase_positiva(modelo)
+    bases, tablas = zip(*(_tabla_un_arbol(a, n_variables, indice_clase) for a in arboles))
+    # En un bosque la probabilidad es el promedio de los árboles; lo mismo ocurre con las contribuciones.
+    return float(np.mean(bases)), np.vstack(tablas) / len(arboles)
+
+
+def calcular_contribuciones(modelo, X, tabla=None):
+    """
+    Contribuciones por fila y variable para todas las filas de X en una sola pasada vectorizada.
+
+    Args:
+        modelo: Modelo de árbol o bosque ya entrenado.
+        X (pandas.DataFrame | np.ndarray): Datos con las mismas columnas usadas en el entrenamiento.
+        tabla (tuple, opcional): Resultado de construir_tabla_contribuciones, para reutilizarlo.
+
+    Returns:
+        tuple: (valor_base, contribuciones) con contribuciones de forma (filas x variables).
+    """
+    valor_base, tabla_nodos = tabla if tabla is not None else construir_tabla_contribuciones(modelo)
+    indicador = modelo.decision_path(X)
+    if isinstance(indicador, tuple):  # Los bosques devuelven (indicador, punteros_por_arbol)
+        indicador = indicador[0]
+    return valor_base, np.asarray(indicador @ tabla_nodos)
+
+
+def _arboles_ponderados(modelo):
+    """
+    Árboles del modelo con su peso en la probabilidad y el índice de la clase positiva: un árbol pesa 1,
+    los de un bosque 1/n, y en un CalibratedClassifierCV ese peso se reparte además entre sus pliegues.
+    """
+    if hasattr(modelo, 'calibrated_classifiers_'):
+        calibrados = modelo.calibrated_classifiers_
+        ponderados = []
+        for calibrado in calibrados:
+            # 'estimator' desde sklearn 1.2; 'base_estimator' en versiones anteriores.
+            estimador = calibrado.estimator if hasattr(calibrado, 'estimator') else calibrado.base_estimator
+            ponderados += [(a, p / len(calibrados), i) for a, p, i in _arboles_ponderados(estimador)]
+        return ponderados
+    arboles = _arboles_del_modelo(modelo)
+    indice_clase = _indice_clase_positiva(modelo)
+    return [(arbol, 1 / len(arboles), indice_clase) for arbol in arboles]
+
+
+class ExplicadorArbol:
+    """
+    Explicador de una sola fila para un árbol de decisión, un bosque de árboles o un
+    CalibratedClassifierCV sobre cualquiera de ellos.
+
+    Guarda la estructura de los árboles como listas de Python (nodos numerados de forma consecutiva
+    entre árboles) y la tabla de contribuciones precalculada y ponderada, de modo que explicar una
+    predicción es recorrer un camino por árbol y sumar unas pocas filas de la tabla: el costo es de
+    microsegundos y no requiere llamar a sklearn.
+
+    En un modelo calibrado, valor_base + sum(contribuciones) es la probabilidad promedio de los
+    estimadores base, antes de aplicar la calibración.
+    """
+
+    def __init__(self, modelo, columnas):
+        ponderados = _arboles_ponderados(modelo)  # TypeError si el modelo no está hecho de árboles
+        n_variables = modelo.n_features_in_
+        self.columnas = list(columnas)
+        self.calibrado = hasattr(modelo, 'calibrated_classifiers_')
+        self.raices = []
+        self.hijo_izquierdo, self.hijo_derecho, self.variable, self.umbral = [], [], [], []
+        self.valor_base = 0.0
+        tablas = []
+        for arbol, peso, indice_clase in ponderados:
+            tree = arbol.tree_
+            desplazamiento = len(self.variable)
+            self.raices.append(desplazamiento)
+            self.hijo_izquierdo += np.where(tree.children_left != -1, tree.children_left + desplazamiento, -1).tolist()
+            self.hijo_derecho += np.where(tree.children_right != -1, tree.children_right + desplazamiento, -1).tolist()
+            self.variable += tree.feature.tolist()
+            self.umbral += tree.threshold.tolist()
+            valor_base, tabla = _tabla_un_arbol(arbol, n_variables, indice_clase)
+            self.valor_base += peso * valor_base
+            tablas.append(tabla * peso)
+        self.tabla = np.vstack(tablas)
+
+    @property
+    def n_arboles(self):
+        return len(self.raices)
+
+    def camino(self, valores):
+        """
+        Nodos visitados desde la raíz hasta la hoja de cada árbol, uno tras otro, para una fila
+        (valores en orden de columnas).
+        """
+        # sklearn compara en float32 con los umbrales; sin el redondeo, un valor justo en el umbral puede irse por otra rama.
+        valores = np.asarray(valores, dtype=np.float32).tolist()
+        nodos = []
+        for nodo in self.raices:
+            nodos.append(nodo)
+            while self.hijo_izquierdo[nodo] != -1:
+                if valores[self.variable[nodo]] <= self.umbral[nodo]:
+                    nodo = self.hijo_izquierdo[nodo]
+                else:
+                    nodo = self.hijo_derecho[nodo]
+                nodos.append(nodo)
+        return nodos
+
+    def explicar(self, valores, nodos=None):
+        """
+        Explicación de una fila: camino de decisión con las comparaciones de umbral y
+        contribución de cada variable a la probabilidad de helada. En los ensambles el camino
+        de cada árbol no se detalla (serían cientos de comparaciones); se devuelven sus hojas.
+
+        Args:
+            valores (sequence): Valores de la fila en el orden de `columnas`.
+            nodos (list, opcional): Camino ya calculado con `camino`.
+
+        Returns:
+            dict: {'valor_base', 'camino_decision', 'contribuciones', 'nodo_hoja', 'n_arboles', 'calibrado'};
+                  en los ensambles 'camino_decision' está vacío y 'nodo_hoja' es la lista de hojas.
+        """
+        nodos = nodos if nodos is not None else self.camino(valores)
+        contribuciones = self.tabla[nodos].sum(axis=0)
+        explicacion = {
+            'valor_base': round(self.valor_base, 4),
+            'camino_decision': [],
+            'contribuciones': {c: round(float(v), 4) for c, v in zip(self.columnas, contribuciones)},
+            'nodo_hoja': [n for n in nodos if self.hijo_izquierdo[n] == -1],
+            'n_arboles': self.n_arboles,
+            'calibrado': self.calibrado,
+        }
+        if self.n_arboles > 1:
+            return explicacion
+        for nodo, siguiente in zip(nodos[:-1], nodos[1:]):
+            indice_variable = self.variable[nodo]
+            explicacion['camino_decision'].append({
+                'variable': self.columnas[indice_variable],
+                'valor': float(valores[indice_variable]),
+                'condicion': '<=' if siguiente == self.hijo_izquierdo[nodo] else '>',
+                'umbral': round(self.umbral[nodo], 4),
+            })
+        explicacion['nodo_hoja'] = nodos[-1]
+        return explicacion
+
+    def explicacion_compacta(self, explicacion):
+        """
+        Representación compacta para almacenar junto a la predicción: nodos del camino
+        (suficientes para reconstruir las comparaciones con el mismo modelo; en los ensambles,
+        las hojas de cada árbol), valor base y contribuciones en el orden de `columnas`.
+        """
+        if self.n_arboles > 1:
+            return {
+                'n': explicacion['nodo_hoja'],
+                'b': explicacion['valor_base'],
+                'c': [explicacion['contribuciones'][c] for c in self.columnas],
+            }
+        nodos = [0]
+        for paso in explicacion['camino_decision']:
+            nodo = nodos[-1]
+            nodos.append(self.hijo_izquierdo[nodo] if paso['condicion'] == '<=' else self.hijo_derecho[nodo])
+        return {
+            'n': nodos,
+            'b': explicacion['valor_base'],
+            'c': [explicacion['contribuciones'][c] for c in self.columnas],
+        }
@@ -0,0 +1,152 @@
+# coding: utf-8
+"""
+Grabación y reproducción de respuestas de Open-Meteo como adaptadores de transporte de requests.
+
+- AdaptadorGrabacion: hace la petición real y guarda la respuesta en una grabación comprimida.
+- AdaptadorReproduccion: responde desde las grabaciones, sin red. Entre varias grabaciones de la misma
+  petición elige la más reciente que no sea posterior al reloj, de modo que al fijar el reloj en el
+  instante de una grabación se reproduce exactamente lo que la API devolvió entonces. Si todas las
+  grabaciones de la petición son posteriores al reloj, cuenta como fallo (GrabacionNoEncontrada).
+
+Cada grabación es un archivo '<instante>_<clave>.json.gz' con la URL, los parámetros, el estado HTTP y el
+cuerpo. La clave resume el método, la URL y los parámetros ordenados, así que no depende del orden de
+la query string. Ambos adaptadores se montan con data_fetcher.configurar_transporte().
+"""
+import datetime
+import glob
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+from urllib.parse import parse_qsl, urlsplit
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+FORMATO_INSTANTE = "%Y%m%dT%H%M%S"
+EXTENSION_GRABACION = ".json.gz"
+
+
+def clave_peticion(metodo, url):
+    """Clave estable de una petición: método, URL sin query y parámetros ordenados."""
+    partes = urlsplit(url)
+    parametros = sorted(parse_qsl(partes.query, keep_blank_values=True))
+    base = f"{metodo.upper()} {partes.scheme}://{partes.netloc}{partes.path}?{json.dumps(parametros)}"
+    return hashlib.sha1(base.encode('utf-8')).hexdigest()[:20]
+
+
+def leer_grabacion(ruta):
+    with gzip.open(ruta, 'rt', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _instante_de_ruta(ruta):
+    nombre = os.path.basename(ruta)
+    return datetime.datetime.strptime(nombre.split('_', 1)[0], FORMATO_INSTANTE)
+
+
+def _clave_de_ruta(ruta):
+    return os.path.basename(ruta)[:-len(EXTENSION_GRABACION)].split('_', 1)[1]
+
+
+class AdaptadorGrabacion(HTTPAdapter):
+    """Transporte real que además guarda cada respuesta exitosa como grabación."""
+
+    def __init__(self, directorio, reloj, **kwargs):
+        super().__init__(**kwargs)
+        self.directorio = directorio
+        self.reloj = reloj # Instante de la grabación (el de la aplicación, para que la reproducción lo reproduzca)
+        os.makedirs(directorio, exist_ok=True)
+
+    def send(self, request, **kwargs):
+        respuesta = super().send(request, **kwargs)
+        if respuesta.ok:
+            try:
+                self._guardar(request, respuesta)
+            except OSError as e:
+                logger.error(f"No se pudo guardar la grabación de {request.url}: {e}")
+        return respuesta
+
+    def _guardar(self, request, respuesta):
+        instante = self.reloj.utcnow()
+        clave = clave_peticion(request.method, request.url)
+        ruta = os.path.join(self.directorio, f"{instante.strftime(FORMATO_INSTANTE)}_{clave}{EXTENSION_GRABACION}")
+        partes = urlsplit(request.url)
+        grabacion = {
+            "instante": instante.isoformat(),
+            "metodo": request.method,
+            "url": f"{partes.scheme}://{partes.netloc}{partes.path}",
+            "parametros": dict(parse_qsl(partes.query, keep_blank_values=True)),
+            "estado": respuesta.status_code,
+            "tipo_contenido": respuesta.headers.get('Content-Type', 'application/json'),
+            "cuerpo": respuesta.content.decode(respuesta.encoding or 'utf-8'),
+        }
+        ruta_temporal = f"{ruta}.tmp"
+        with gzip.open(ruta_temporal, 'wt', encoding='utf-8') as f:
+            json.dump(grabacion, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(ruta_temporal, ruta) # Una grabación a medio escribir nunca queda con el nombre final
+        logger.debug(f"Respuesta de Open-Meteo grabada en {ruta}")
+
+
+class GrabacionNoEncontrada(requests.exceptions.ConnectionError):
+    """No hay grabación para la petición; data_fetcher la trata como un fallo de conexión."""
+
+
+class AdaptadorReproduccion(BaseAdapter):
+    """Transporte sin red que responde desde las grabaciones de un directorio."""
+
+    def __init__(self, directorio, reloj):
+        super().__init__()
+        self.directorio = directorio
+        self.reloj = reloj
+        self.aciertos = 0
+        self.fallos = 0
+        self._candado = threading.Lock()
+        # clave -> [(instante, ruta)] ordenado; se indexa por nombre de archivo, sin abrir las grabaciones
+        self._indice = {}
+        for ruta in glob.glob(os.path.join(directorio, f"*{EXTENSION_GRABACION}")):
+            self._indice.setdefault(_clave_de_ruta(ruta), []).append((_instante_de_ruta(ruta), ruta))
+        for grabaciones in self._indice.values():
+            grabaciones.sort()
+
+    def grabaciones(self):
+        """Todas las grabaciones como (instante, ruta), en orden cronológico."""
+        return sorted(g for grabaciones in self._indice.values() for g in grabaciones)
+
+    def _elegir(self, clave):
+        """Grabación más reciente no posterior al reloj, o None (fallo): servir una futura filtraría datos aún no emitidos."""
+        grabaciones = self._indice.get(clave)
+        if not grabaciones:
+            return None
+        limite = self.reloj.utcnow().replace(microsecond=0)
+        anteriores = [ruta for instante, ruta in grabaciones if instante <= limite]
+        return anteriores[-1] if anteriores else None
+
+    def send(self, request, **kwargs):
+        ruta = self._elegir(clave_peticion(request.method, request.url))
+        with self._candado:
+            if ruta is None:
+                self.fallos += 1
+            else:
+                self.aciertos += 1
+        if ruta is None:
+            raise GrabacionNoEncontrada(f"Sin grabación para {request.method} {request.url}", request=request)
+
+        grabacion = leer_grabacion(ruta)
+        respuesta = requests.Response()
+        respuesta.status_code = grabacion["estado"]
+        respuesta.reason = "OK" if grabacion["estado"] < 400 else "Error"
+        respuesta.headers = CaseInsensitiveDict({"Content-Type": grabacion["tipo_contenido"]})
+        respuesta._content = grabacion["cuerpo"].encode('utf-8')
+        respuesta.encoding = 'utf-8'
+        respuesta.url = request.url
+        respuesta.request = request
+        return respuesta
+
+    def close(self):
+        pass
@@ -0,0 +1,266 @@
+# coding: utf-8
+"""
+Predictor aplanado para los modelos de árboles de scikit-learn, compilado al cargar el modelo.
+
+Los .pkl siguen guardando los estimadores de sklearn tal cual (sin clases propias), y el servicio los
+compila al cargarlos. Todos los árboles del modelo (un árbol, un bosque aleatorio o las iteraciones de
+un HistGradientBoosting, con o sin CalibratedClassifierCV) se concatenan en arreglos planos de nodos.
+Todas las filas avanzan por todos los árboles a la vez, un nivel por paso, con operaciones NumPy.
+Así se evita el costo fijo por llamada de sklearn (validación de entrada y un hilo por árbol en los
+bosques), que domina la latencia cuando se predice una sola fila o un lote pequeño.
+
+compilar_predictor() verifica el resultado contra el predict_proba original y, si no coincide o si el
+modelo no es compatible, retorna None y el servicio sigue usando el modelo de sklearn.
+"""
+import logging
+
+import numpy as np
+
+try:
+    from src.especificacion_features import COLUMNAS_MODELO, ESPECIFICACION_FEATURES
+except ImportError:  # Ejecución directa desde src/
+    from especificacion_features import COLUMNAS_MODELO, ESPECIFICACION_FEATURES
+
+logger = logging.getLogger(__name__)
+
+TOLERANCIA_VERIFICACION = 1e-6
+N_FILAS_VERIFICACION = 512
+
+
+class BosqueAplanado:
+    """Nodos de varios árboles concatenados; cada árbol comienza en 'raices[i]'. En las hojas izquierda == -1."""
+
+    def __init__(self, variable, umbral, izquierda, derecha, nan_a_izquierda, valor, raices, profundidad_maxima, dtype_entrada):
+        self.variable = variable
+        self.umbral = umbral
+        self.izquierda = izquierda
+        self.derecha = derecha
+        self.nan_a_izquierda = nan_a_izquierda
+        self.valor = valor
+        self.raices = raices
+        self.profundidad_maxima = profundidad_maxima
+        self.dtype_entrada = dtype_entrada # sklearn compara en float32 en sus árboles y en float64 en HistGradientBoosting
+
+    @classmethod
+    def concatenar(cls, arboles, dtype_entrada):
+        """arboles: lista de dicts con arreglos por nodo (índices locales) y 'profundidad'."""
+        desplazamientos = np.cumsum([0] + [len(a['valor']) for a in arboles[:-1]])
+
+        def _global(hijos, desplazamiento):
+            return np.where(hijos >= 0, hijos + desplazamiento, -1)
+
+        return cls(
+            variable=np.concatenate([a['variable'] for a in arboles]),
+            umbral=np.concatenate([a['umbral'] for a in arboles]),
+            izquierda=np.concatenate([_global(a['izquierda'], d) for a, d in zip(arboles, desplazamientos)]),
+            derecha=np.concatenate([_global(a['derecha'], d) for a, d in zip(arboles, desplazamientos)]),
+            nan_a_izquierda=np.concatenate([a['nan_a_izquierda'] for a in arboles]),
+            valor=np.concatenate([a['valor'] for a in arboles]),
+            raices=desplazamientos.astype(np.int64),
+            profundidad_maxima=max(a['profundidad'] for a in arboles),
+            dtype_entrada=dtype_entrada,
+        )
+
+    def valores_hoja(self, X):
+        """(filas, árboles) con el valor de la hoja a la que llega cada fila en cada árbol."""
+        X = X.astype(self.dtype_entrada, copy=False)
+        filas = np.arange(len(X))[:, None]
+        nodos = np.broadcast_to(self.raices, (len(X), len(self.raices))).copy()
+        for _ in range(self.profundidad_maxima):
+            hoja = self.izquierda[nodos] < 0
+            if hoja.all():
+                break
+            x = X[filas, self.variable[nodos]]
+            a_izquierda = np.where(np.isnan(x), self.nan_a_izquierda[nodos], x <= self.umbral[nodos])
+            siguiente = np.where(a_izquierda, self.izquierda[nodos], self.derecha[nodos])
+            nodos = np.where(hoja, nodos, siguiente)
+        return self.valor[nodos]
+
+
+def _arbol_sklearn(estimador, indice_clase):
+    """Arreglos planos de un DecisionTreeClassifier (valor de hoja = probabilidad de la clase positiva)."""
+    tree = estimador.tree_
+    valores = tree.value[:, 0, :].astype(np.float64)
+    izquierda = tree.children_left.astype(np.int64)
+    derecha = tree.children_right.astype(np.int64)
+    # Desde sklearn 1.3 los árboles pueden aprender hacia dónde enviar los faltantes; antes NaN iba a la derecha.
+    nan_a_izquierda = getattr(tree, 'missing_go_to_left', np.zeros(tree.node_count, dtype=np.uint8)).astype(bool)
+    return {
+        'variable': np.maximum(tree.feature, 0).astype(np.int64), # Las hojas tienen variable -2
+        'umbral': tree.threshold.astype(np.float64),
+        'izquierda': izquierda,
+        'derecha': derecha,
+        'nan_a_izquierda': nan_a_izquierda,
+        'valor': valores[:, indice_clase] / valores.sum(axis=1),
+        'profundidad': int(tree.max_depth),
+    }
+
+
+def _arbol_histograma(predictor):
+    """Arreglos planos de un TreePredictor de HistGradientBoosting (valor de hoja = aporte al logit)."""
+    nodos = predictor.nodes
+    if 'is_categorical' in nodos.dtype.names and nodos['is_categorical'].any():
+        raise TypeError("Las divisiones categóricas de HistGradientBoosting no están soportadas.")
+    es_hoja = nodos['is_leaf'].astype(bool)
+    # 'left'/'right' son uint32: se pasan a int64 antes de marcar las hojas con -1 (con NumPy 2 el -1 daría la vuelta).
+    izquierda = np.where(es_hoja, -1, nodos['left'].astype(np.int64))
+    derecha = np.where(es_hoja, -1, nodos['right'].astype(np.int64))
+    return {
+        'variable': nodos['feature_idx'].astype(np.int64),
+        'umbral': nodos['num_threshold'].astype(np.float64),
+        'izquierda': izquierda,
+        'derecha': derecha,
+        'nan_a_izquierda': nodos['missing_go_to_left'].astype(bool),
+        'valor': nodos['value'].astype(np.float64),
+        'profundidad': int(nodos['depth'].max()),
+    }
+
+
+def _indice_positiva(modelo):
+    clases = list(modelo.classes_)
+    return clases.index(1) if 1 in clases else len(clases) - 1
+
+
+def _sigmoide(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+class _Componente:
+    """
+    Un modelo base aplanado con su calibrador opcional; calcula la probabilidad de la clase positiva.
+
+    modo 'promedio': probabilidad = media de las hojas (árbol o bosque; señal para calibrar = probabilidad).
+    modo 'logit': logit = base + suma de las hojas (HistGradientBoosting; señal para calibrar = logit).
+    """
+
+    def __init__(self, bosque, modo, base=0.0, calibrador=None):
+        self.bosque = bosque
+        self.modo = modo
+        self.base = base
+        self.calibrador = calibrador
+
+    def probabilidad(self, X):
+        hojas = self.bosque.valores_hoja(X)
+        senal = hojas.mean(axis=1) if self.modo == 'promedio' else self.base + hojas.sum(axis=1)
+        if self.calibrador is not None:
+            return self.calibrador(senal)
+        return senal if self.modo == 'promedio' else _sigmoide(senal)
+
+
+def _componente_base(estimador):
+    """_Componente sin calibrar para un árbol, un bosque de árboles o un HistGradientBoostingClassifier."""
+    if len(estimador.classes_) != 2:
+        raise TypeError("Solo se compilan clasificadores binarios.")
+    if hasattr(estimador, 'tree_'):
+        arboles = [_arbol_sklearn(estimador, _indice_positiva(estimador))]
+        return _Componente(BosqueAplanado.concatenar(arboles, np.float32), 'promedio')
+    if hasattr(estimador, 'estimators_') and all(hasattr(e, 'tree_') for e in estimador.estimators_):
+        # Los árboles de un bosque usan los índices de clase del bosque (classes_ de cada árbol son 0..n-1).
+        arboles = [_arbol_sklearn(e, _indice_positiva(estimador)) for e in estimador.estimators_]
+        return _Componente(BosqueAplanado.concatenar(arboles, np.float32), 'promedio')
+    if hasattr(estimador, '_predictors') and hasattr(estimador, '_baseline_prediction'):
+        if getattr(estimador, 'n_trees_per_iteration_', 1) != 1:
+            raise TypeError("HistGradientBoosting multiclase no está soportado.")
+        if _indice_positiva(estimador) != 1:
+            raise TypeError("El logit de HistGradientBoosting corresponde a classes_[1], que no es la clase positiva.")
+        arboles = [_arbol_histograma(iteracion[0]) for iteracion in estimador._predictors]
+        base = float(np.ravel(estimador._baseline_prediction)[0])
+        return _Componente(BosqueAplanado.concatenar(arboles, np.float64), 'logit', base=base)
+    raise TypeError(f"El modelo {type(estimador).__name__} no es un árbol, un bosque ni un HistGradientBoosting.")
+
+
+def _calibrador(calibrador_sklearn):
+    """Función vectorizada equivalente a un IsotonicRegression o _SigmoidCalibration ajustado."""
+    if hasattr(calibrador_sklearn, 'X_thresholds_'):
+        x_umbrales = np.asarray(calibrador_sklearn.X_thresholds_, dtype=np.float64)
+        y_umbrales = np.asarray(calibrador_sklearn.y_thresholds_, dtype=np.float64)
+        return lambda senal: np.interp(np.clip(senal, x_umbrales[0], x_umbrales[-1]), x_umbrales, y_umbrales)
+    if hasattr(calibrador_sklearn, 'a_') and hasattr(calibrador_sklearn, 'b_'):
+        a, b = float(calibrador_sklearn.a_), float(calibrador_sklearn.b_)
+        return lambda senal: _sigmoide(-(a * senal + b))
+    raise TypeError(f"Calibrador no soportado: {type(calibrador_sklearn).__name__}")
+
+
+def _componentes(modelo):
+    if hasattr(modelo, 'calibrated_classifiers_'):
+        componentes = []
+        for calibrado in modelo.calibrated_classifiers_:
+            # 'estimator' desde sklearn 1.2; 'base_estimator' y 'calibrators_' en versiones anteriores.
+            estimador = calibrado.estimator if hasattr(calibrado, 'estimator') else calibrado.base_estimator
+            calibradores = calibrado.calibrators if hasattr(calibrado, 'calibrators') else calibrado.calibrators_
+            componente = _componente_base(estimador)
+            # La señal calibrada es decision_function si el estimador la tiene (logit en HistGradientBoosting).
+            if componente.modo == 'promedio' and hasattr(estimador, 'decision_function'):
+                raise TypeError(f"Calibración sobre decision_function de {type(estimador).__name__} no soportada.")
+            componente.calibrador = _calibrador(calibradores[0])
+            componentes.append(componente)
+        return componentes
+    return [_componente_base(modelo)]
+
+
+class PredictorCompilado:
+    """Sustituto de predict_proba/predict del modelo original para clasificadores binarios."""
+
+    def __init__(self, componentes, classes_, n_features_in_, nombre_modelo):
+        self.componentes = componentes
+        self.classes_ = classes_
+        self.n_features_in_ = n_features_in_
+        self.nombre_modelo = nombre_modelo
+        self._indice_positiva = _indice_positiva(self)
+
+    def predict_proba(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        positiva = np.mean([c.probabilidad(X) for c in self.componentes], axis=0)
+        positiva = np.clip(positiva, 0.0, 1.0)
+        probabilidades = np.empty((len(X), 2), dtype=np.float64)
+        probabilidades[:, self._indice_positiva] = positiva
+        probabilidades[:, 1 - self._indice_positiva] = 1.0 - positiva
+        return probabilidades
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+    def __repr__(self):
+        return f"<PredictorCompilado({self.nombre_modelo}, componentes={len(self.componentes)})>"
+
+
+def generar_filas_sinteticas(n_filas=N_FILAS_VERIFICACION, semilla=0):
+    """Filas uniformes dentro del rango válido de cada variable del modelo (columnas COLUMNAS_MODELO)."""
+    generador = np.random.default_rng(semilla)
+    columnas = [generador.uniform(*ESPECIFICACION_FEATURES[c]['rango_valido'], size=n_filas) for c in COLUMNAS_MODELO]
+    return np.column_stack(columnas)
+
+
+def compilar_predictor(modelo, X_verificacion=None, tolerancia=TOLERANCIA_VERIFICACION):
+    """
+    Compila el modelo y verifica que predict_proba coincida con el original.
+
+    Returns:
+        PredictorCompilado, o None si el modelo no es compatible o la verificación falla.
+    """
+    try:
+        predictor = PredictorCompilado(_componentes(modelo), np.asarray(modelo.classes_),
+                                       modelo.n_features_in_, type(modelo).__name__)
+    except (TypeError, AttributeError, KeyError, IndexError, ValueError) as e:
+        logger.info(f"El modelo {type(modelo).__name__} no se compila; se usará predict_proba de sklearn: {e}")
+        return None
+
+    if X_verificacion is None:
+        X_verificacion = generar_filas_sinteticas()
+    try:
+        import pandas as pd
+        columnas = list(getattr(modelo, 'feature_names_in_', COLUMNAS_MODELO))
+        esperado = modelo.predict_proba(pd.DataFrame(np.asarray(X_verificacion), columns=columnas))
+        diferencia = float(np.max(np.abs(predictor.predict_proba(X_verificacion) - esperado)))
+    except Exception as e:
+        # Cualquier fallo del compilado (no solo una diferencia) deja al servicio con el modelo de sklearn.
+        logger.warning(f"No se pudo verificar el predictor compilado; se usará predict_proba de sklearn: {e}")
+        return None
+    if diferencia > tolerancia:
+        logger.warning(f"El predictor compilado difiere del modelo original (máx. {diferencia:.2e}); se descarta.")
+        return None
+    logger.info(f"Predictor compilado para {type(modelo).__name__}: {len(predictor.componentes)} componentes, "
+                f"{sum(len(c.bosque.raices) for c in predictor.componentes)} árboles (dif. máx. {diferencia:.1e}).")
+    return predictor
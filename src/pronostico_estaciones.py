@@ -0,0 +1,188 @@
+# coding: utf-8
+"""
+Pronóstico de la madrugada siguiente para varias estaciones del registro a la vez.
+
+1. Las estaciones se agrupan por zona horaria y cada grupo se pide a Open-Meteo con peticiones
+   multi-ubicación (hasta MAX_COORDENADAS_POR_PETICION puntos, con la altitud de cada estación).
+2. Cada cubo (horas x estaciones x variables) pasa por la especificación de variables en una sola pasada.
+3. El control de calidad (src/calidad_datos.py) calcula en la misma pasada una máscara de bits por
+   hora y estación: rangos físicos y de entrenamiento, saltos entre horas e imputaciones. Los rangos de
+   entrenamiento y el monitor de deriva son los del modelo de cada estación (su ServicioModelo).
+   Para cada estación se toma la primera hora de la madrugada con todas las variables del modelo,
+   prefiriendo las horas sin bits de rechazo; la máscara de esa hora se guarda con la predicción.
+4. Las estaciones se agrupan por versión de modelo y cada grupo se puntúa con una única llamada a
+   predict_proba, de modo que estaciones de altura y de valle pueden usar árboles distintos en el
+   mismo proceso.
+"""
+import datetime
+import logging
+from dataclasses import dataclass, field
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pandas as pd
+
+try:
+    from src.data_fetcher import COLUMNAS_A_SOLICITAR_API, MAX_COORDENADAS_POR_PETICION, obtener_cubo_meteorologico_openmeteo
+    from src.especificacion_features import COLUMNAS_MODELO, transformar_cubo
+    from src.calidad_datos import BITS_RECHAZO, evaluar_calidad, resumir_calidad
+    from src.pronostico_grilla import HORA_FIN_MADRUGADA, HORA_INICIO_MADRUGADA
+    from src.registro_estaciones import agrupar_por_modelo
+except ImportError:  # Ejecución directa desde src/
+    from data_fetcher import COLUMNAS_A_SOLICITAR_API, MAX_COORDENADAS_POR_PETICION, obtener_cubo_meteorologico_openmeteo
+    from especificacion_features import COLUMNAS_MODELO, transformar_cubo
+    from calidad_datos import BITS_RECHAZO, evaluar_calidad, resumir_calidad
+    from pronostico_grilla import HORA_FIN_MADRUGADA, HORA_INICIO_MADRUGADA
+    from registro_estaciones import agrupar_por_modelo
+
+logger = logging.getLogger(__name__)
+
+DIAS_PREDICCION_ESTACIONES = 2 # Cubre siempre la madrugada siguiente
+
+
+@dataclass
+class PronosticoEstacion:
+    """Resultado del pronóstico de una estación. Si 'error' no es None, los demás campos pueden faltar."""
+    estacion: object
+    dia_siguiente: datetime.date = None
+    fecha_prediccion: datetime.datetime = None # Hora local de la estación, sin zona
+    features: dict = field(default_factory=dict) # Variables del modelo y auxiliares, en unidades del modelo
+    prediccion: int = None
+    probabilidad: float = None
+    calidad: int = None # Máscara de bits de calidad de la hora elegida (ver src/calidad_datos.py)
+    serie_cruda: pd.DataFrame = None # Todas las horas descargadas, en unidades de origen (para el almacén)
+    error: str = None
+
+    @property
+    def version_modelo(self):
+        return self.estacion.version_modelo
+
+
+def _descargar_grupo(estaciones, zona_horaria, dias_prediccion):
+    """Cubo crudo (horas x estaciones x variables) de un grupo de estaciones que comparten zona horaria."""
+    tiempos, bloques = None, []
+    for inicio in range(0, len(estaciones), MAX_COORDENADAS_POR_PETICION):
+        bloque = estaciones[inicio:inicio + MAX_COORDENADAS_POR_PETICION]
+        resultado = obtener_cubo_meteorologico_openmeteo(
+            [e.latitud for e in bloque], [e.longitud for e in bloque], dias_prediccion,
+            elevaciones=[e.altitud_m for e in bloque], zona_horaria=zona_horaria)
+        if resultado is None:
+            return None
+        tiempos_bloque, cubo_bloque = resultado
+        if tiempos is None:
+            tiempos = tiempos_bloque
+        elif not tiempos.equals(tiempos_bloque):
+            logger.error(f"Los bloques de estaciones de la zona {zona_horaria} devolvieron horas distintas.")
+            return None
+        bloques.append(cubo_bloque)
+    return tiempos, np.concatenate(bloques, axis=1)
+
+
+def _seleccionar_madrugada(estaciones, tiempos, cubo, zona_horaria, ahora, servicio_de_version):
+    """Resultados (sin puntuar) de un grupo de estaciones de la misma zona horaria."""
+    cubo_modelo, nombres = transformar_cubo(cubo, COLUMNAS_A_SOLICITAR_API)
+    posiciones = {} # version_modelo -> columnas del cubo de sus estaciones
+    for i, estacion in enumerate(estaciones):
+        posiciones.setdefault(estacion.version_modelo, []).append(i)
+    calidad = np.zeros(cubo_modelo.shape[:2], dtype=np.int32) # (horas x estaciones)
+    for version, columnas in posiciones.items():
+        servicio = servicio_de_version(version)
+        limites_calidad = servicio.limites_calidad if servicio is not None else None
+        calidad[:, columnas] = evaluar_calidad(cubo[:, columnas], COLUMNAS_A_SOLICITAR_API, cubo_modelo[:, columnas], nombres, limites_calidad)
+        if servicio is not None and servicio.monitor_deriva is not None:
+            servicio.monitor_deriva.agregar(pd.DataFrame(cubo_modelo[:, columnas].reshape(-1, len(nombres)), columns=nombres))
+    resumen_calidad = resumir_calidad(calidad)
+    if resumen_calidad:
+        logger.info(f"Control de calidad de la zona {zona_horaria} (horas x estaciones afectadas): {resumen_calidad}")
+
+    # Open-Meteo devuelve horas locales de la zona pedida: la madrugada se busca en esa hora local.
+    ahora_local = (ahora or datetime.datetime.now(datetime.timezone.utc)).astimezone(ZoneInfo(zona_horaria))
+    dia_siguiente = ahora_local.date() + datetime.timedelta(days=1)
+    madrugada_inicio = datetime.datetime.combine(dia_siguiente, datetime.time(HORA_INICIO_MADRUGADA))
+    madrugada_fin = datetime.datetime.combine(dia_siguiente, datetime.time(HORA_FIN_MADRUGADA))
+    en_madrugada = np.flatnonzero(np.asarray((tiempos >= madrugada_inicio) & (tiempos <= madrugada_fin)))
+
+    # (horas de madrugada x estaciones): hora con todas las variables del modelo disponibles
+    indices_modelo = [nombres.index(c) for c in COLUMNAS_MODELO]
+    completas = ~np.isnan(cubo_modelo[en_madrugada][:, :, indices_modelo]).any(axis=2)
+    if len(en_madrugada) == 0:
+        logger.warning(f"Sin horas de madrugada ({madrugada_inicio} a {madrugada_fin}) en los datos de la zona {zona_horaria}.")
+        completas = np.zeros((1, len(estaciones)), dtype=bool)
+    aceptables = completas & ((calidad[en_madrugada] & BITS_RECHAZO) == 0) if len(en_madrugada) else completas
+    # Primera hora aceptable; si ninguna lo es, la primera completa (la máscara guardada deja constancia).
+    primera_completa = np.where(aceptables.any(axis=0), aceptables.argmax(axis=0), completas.argmax(axis=0))
+    tiene_datos = completas.any(axis=0)
+
+    resultados = []
+    for i, estacion in enumerate(estaciones):
+        serie = pd.DataFrame(cubo[:, i, :], columns=COLUMNAS_A_SOLICITAR_API)
+        serie.insert(0, 'time', tiempos)
+        resultado = PronosticoEstacion(estacion=estacion, dia_siguiente=dia_siguiente, serie_cruda=serie)
+        if not tiene_datos[i]:
+            resultado.error = (f"No se encontraron datos horarios completos para las variables {COLUMNAS_MODELO} en el rango "
+                               f"de la madrugada del {dia_siguiente:%Y-%m-%d} ({HORA_INICIO_MADRUGADA:02d}:00-{HORA_FIN_MADRUGADA:02d}:00).")
+        else:
+            hora = en_madrugada[primera_completa[i]]
+            resultado.fecha_prediccion = tiempos[hora].to_pydatetime()
+            resultado.features = {n: float(v) for n, v in zip(nombres, cubo_modelo[hora, i, :]) if not np.isnan(v)}
+            resultado.calidad = int(calidad[hora, i])
+        resultados.append(resultado)
+    return resultados
+
+
+def pronosticar_estaciones(estaciones, obtener_modelo, dias_prediccion=DIAS_PREDICCION_ESTACIONES, ahora=None, obtener_servicio=None):
+    """
+    Pronostica la madrugada siguiente de cada estación.
+
+    Args:
+        estaciones (list): EstacionRegistrada del registro.
+        obtener_modelo (callable): version_modelo -> modelo con predict_proba (o None si no está disponible).
+        dias_prediccion (int): Días de pronóstico a descargar.
+        ahora (datetime, opcional): Instante de referencia con zona horaria (por defecto, el actual).
+        obtener_servicio (callable, opcional): version_modelo -> ServicioModelo, del que se toman los límites de
+            calidad y el monitor de deriva de esa versión. Sin él se usan los límites de la especificación.
+
+    Returns:
+        list: Un PronosticoEstacion por estación, en el mismo orden de entrada.
+    """
+    modelos = {}
+
+    def servicio_de_version(version):
+        # Se espera la carga del modelo antes de leer su servicio: límites y monitor se crean al cargarlo.
+        if version not in modelos:
+            modelos[version] = obtener_modelo(version)
+        return obtener_servicio(version) if obtener_servicio is not None else None
+
+    por_codigo = {}
+    zonas = {}
+    for estacion in estaciones:
+        zonas.setdefault(estacion.zona_horaria, []).append(estacion)
+    for zona_horaria, grupo in zonas.items():
+        descarga = _descargar_grupo(grupo, zona_horaria, dias_prediccion)
+        if descarga is None:
+            for estacion in grupo:
+                por_codigo[estacion.codigo] = PronosticoEstacion(estacion=estacion, error="No se pudieron obtener datos meteorológicos externos.")
+            continue
+        tiempos, cubo = descarga
+        for resultado in _seleccionar_madrugada(grupo, tiempos, cubo, zona_horaria, ahora, servicio_de_version):
+            por_codigo[resultado.estacion.codigo] = resultado
+
+    # Una llamada a predict_proba por versión de modelo con todas sus estaciones
+    listos = [por_codigo[e.codigo] for e in estaciones if por_codigo[e.codigo].error is None]
+    for version, grupo in agrupar_por_modelo([r.estacion for r in listos]).items():
+        resultados = [por_codigo[e.codigo] for e in grupo]
+        modelo = modelos[version] if version in modelos else obtener_modelo(version)
+        if modelo is None:
+            for resultado in resultados:
+                resultado.error = f"Modelo '{version}' no disponible."
+            continue
+        X = pd.DataFrame([[r.features[c] for c in COLUMNAS_MODELO] for r in resultados], columns=COLUMNAS_MODELO)
+        clases = list(modelo.classes_)
+        indice_positiva = clases.index(1) if 1 in clases else len(clases) - 1
+        probabilidades = modelo.predict_proba(X)
+        for resultado, fila in zip(resultados, probabilidades):
+            resultado.probabilidad = float(fila[indice_positiva])
+            resultado.prediccion = int(clases[int(np.argmax(fila))])
+        logger.info(f"Modelo '{version}': {len(resultados)} estaciones puntuadas en un solo lote.")
+
+    return [por_codigo[e.codigo] for e in estaciones]
@@ -0,0 +1,291 @@
+# coding: utf-8
+"""
+Pronóstico de riesgo de helada sobre una grilla regular (p. ej. un valle completo).
+
+Flujo:
+1. Se generan los centros de celda del recuadro (lat_min, lat_max, lon_min, lon_max) a la resolución pedida.
+2. Las celdas se agrupan en bloques de MAX_COORDENADAS_POR_PETICION y cada bloque se pide a Open-Meteo
+   en una sola petición multi-ubicación. Cada bloque se guarda en caché en disco (.npz) por hora de emisión;
+   al escribir un bloque se eliminan los de horas anteriores y, si el directorio supera su tamaño máximo,
+   los más antiguos (limpiar_directorio).
+3. Se ensambla un arreglo (horas x celdas x variables), se aplica la especificación de variables y se
+   puntúa todo con una única llamada a predict_proba.
+4. El ráster de riesgo es la probabilidad máxima de helada en la madrugada siguiente por celda.
+
+Las horas se piden en una zona horaria explícita (ZONA_HORARIA_GRILLA por defecto) y "la madrugada
+siguiente" se calcula convirtiendo el instante actual a esa zona, no con la hora local del servidor.
+"""
+import datetime
+import hashlib
+import io
+import logging
+import math
+import os
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pandas as pd
+
+try:
+    from src.data_fetcher import COLUMNAS_A_SOLICITAR_API, MAX_COORDENADAS_POR_PETICION, obtener_cubo_meteorologico_openmeteo
+    from src.especificacion_features import COLUMNAS_MODELO, transformar_cubo
+except ImportError:  # Ejecución directa desde src/
+    from data_fetcher import COLUMNAS_A_SOLICITAR_API, MAX_COORDENADAS_POR_PETICION, obtener_cubo_meteorologico_openmeteo
+    from especificacion_features import COLUMNAS_MODELO, transformar_cubo
+
+logger = logging.getLogger(__name__)
+
+HORA_INICIO_MADRUGADA = 1
+HORA_FIN_MADRUGADA = 5
+DIAS_PREDICCION_GRILLA = 2
+MAX_CELDAS_GRILLA = 10000     # Límite de celdas por solicitud de grilla
+CELDAS_POR_LADO_TESELA = 16   # Cada tesela XYZ se puntúa como una grilla de 16 x 16 celdas
+ZOOM_MAXIMO_TESELA = 12       # ~10 km por tesela: con más zoom las celdas son más finas que los datos de Open-Meteo
+ZONA_HORARIA_GRILLA = "America/Lima" # Zona de las horas pedidas a Open-Meteo para la grilla (la de las estaciones)
+# Los bloques en caché solo sirven durante su hora de emisión; se conserva una hora más por margen.
+SEGUNDOS_VIDA_CACHE_GRILLA = 2 * 3600
+MAX_BYTES_CACHE_GRILLA = 500 * 1024 * 1024
+# Rásteres guardados a pedido (guardar=true en /grilla/riesgo)
+SEGUNDOS_VIDA_RASTERS = 7 * 24 * 3600
+MAX_BYTES_RASTERS = 1024 * 1024 * 1024
+
+
+def generar_grilla(lat_min, lat_max, lon_min, lon_max, resolucion_lat, resolucion_lon=None):
+    """
+    Centros de celda de una grilla regular dentro del recuadro.
+
+    Returns:
+        tuple: (latitudes, longitudes) como arreglos 1D. La grilla tiene forma (len(latitudes), len(longitudes)),
+               con las latitudes de norte a sur (orden de filas de un ráster).
+    """
+    resolucion_lon = resolucion_lon or resolucion_lat
+    if lat_min >= lat_max or lon_min >= lon_max or resolucion_lat <= 0 or resolucion_lon <= 0:
+        raise ValueError("Recuadro o resolución inválidos.")
+    n_filas = max(1, int(math.ceil((lat_max - lat_min) / resolucion_lat)))
+    n_columnas = max(1, int(math.ceil((lon_max - lon_min) / resolucion_lon)))
+    if n_filas * n_columnas > MAX_CELDAS_GRILLA:
+        raise ValueError(f"La grilla tendría {n_filas * n_columnas} celdas; el máximo es {MAX_CELDAS_GRILLA}.")
+    latitudes = lat_max - (np.arange(n_filas) + 0.5) * (lat_max - lat_min) / n_filas
+    longitudes = lon_min + (np.arange(n_columnas) + 0.5) * (lon_max - lon_min) / n_columnas
+    return latitudes, longitudes
+
+
+def recuadro_tesela(z, x, y):
+    """Recuadro geográfico (lat_min, lat_max, lon_min, lon_max) de una tesela XYZ (Web Mercator)."""
+    if not 0 <= z <= ZOOM_MAXIMO_TESELA:
+        raise ValueError(f"Zoom de tesela fuera de rango: {z} (máximo {ZOOM_MAXIMO_TESELA}).")
+    n = 2 ** z
+    if not (0 <= x < n and 0 <= y < n):
+        raise ValueError(f"Tesela fuera de rango para zoom {z}: x={x}, y={y}.")
+    lon_min = x / n * 360.0 - 180.0
+    lon_max = (x + 1) / n * 360.0 - 180.0
+    lat_max = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    lat_min = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return lat_min, lat_max, lon_min, lon_max
+
+
+def limpiar_directorio(directorio, segundos_vida, max_bytes, patron='.npz'):
+    """
+    Elimina del directorio los archivos '*<patron>' más antiguos que segundos_vida y, si los restantes
+    superan max_bytes, los más antiguos hasta quedar por debajo. Retorna cuántos archivos eliminó.
+    """
+    try:
+        entradas = [e for e in os.scandir(directorio) if e.is_file() and e.name.endswith(patron)]
+    except FileNotFoundError:
+        return 0
+    limite = datetime.datetime.now().timestamp() - segundos_vida
+    archivos = []
+    for entrada in entradas:
+        try:
+            estado = entrada.stat()
+        except FileNotFoundError: # Otro proceso lo eliminó mientras se recorría
+            continue
+        archivos.append((estado.st_mtime, estado.st_size, entrada.path))
+    archivos.sort()
+
+    eliminados = 0
+    total = sum(tamano for _, tamano, _ in archivos)
+    for modificado, tamano, ruta in archivos:
+        if modificado >= limite and total <= max_bytes:
+            break
+        try:
+            os.remove(ruta)
+            eliminados += 1
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"No se pudo eliminar {ruta}: {e}")
+            continue
+        total -= tamano
+    if eliminados:
+        logger.info(f"Limpieza de {directorio}: {eliminados} archivos eliminados.")
+    return eliminados
+
+
+def _clave_cache(latitudes, longitudes, dias_prediccion, hora_emision, zona_horaria):
+    sha = hashlib.sha1()
+    sha.update(np.round(np.asarray(latitudes), 5).tobytes())
+    sha.update(np.round(np.asarray(longitudes), 5).tobytes())
+    sha.update(f"{dias_prediccion}|{','.join(COLUMNAS_A_SOLICITAR_API)}|{hora_emision}|{zona_horaria}".encode('utf-8'))
+    return sha.hexdigest()
+
+
+def _obtener_bloque(latitudes, longitudes, dias_prediccion, ruta_cache, zona_horaria, ahora):
+    """Obtiene un bloque de coordenadas desde la caché en disco o desde Open-Meteo."""
+    hora_emision = ahora.astimezone(datetime.timezone.utc).strftime('%Y%m%d%H') # La caché se renueva cada hora
+    ruta_archivo = None
+    if ruta_cache:
+        clave = _clave_cache(latitudes, longitudes, dias_prediccion, hora_emision, zona_horaria)
+        ruta_archivo = os.path.join(ruta_cache, f"bloque_{clave}.npz")
+        if os.path.exists(ruta_archivo):
+            with np.load(ruta_archivo) as datos:
+                return pd.to_datetime(datos['tiempos']), datos['cubo']
+
+    resultado = obtener_cubo_meteorologico_openmeteo(latitudes, longitudes, dias_prediccion, zona_horaria=zona_horaria)
+    if resultado is not None and ruta_archivo:
+        tiempos, cubo = resultado
+        os.makedirs(ruta_cache, exist_ok=True)
+        np.savez_compressed(ruta_archivo, tiempos=tiempos.values.astype('datetime64[s]'), cubo=cubo)
+        limpiar_directorio(ruta_cache, SEGUNDOS_VIDA_CACHE_GRILLA, MAX_BYTES_CACHE_GRILLA)
+    return resultado
+
+
+def obtener_cubo_grilla(latitudes, longitudes, dias_prediccion=DIAS_PREDICCION_GRILLA, ruta_cache=None,
+                        zona_horaria=ZONA_HORARIA_GRILLA, ahora=None):
+    """
+    Descarga (o lee de caché) los datos de todas las celdas de la grilla, por bloques.
+
+    Args:
+        zona_horaria (str): Zona IANA en la que Open-Meteo devuelve las horas (igual para todas las celdas).
+        ahora (datetime, opcional): Instante con zona que fija la hora de emisión de la caché; por defecto, el actual.
+
+    Returns:
+        tuple: (tiempos, cubo) con cubo de forma (horas, celdas, variables) en unidades de origen,
+               con las celdas en orden de filas (latitud) y luego columnas (longitud).
+               Retorna None si algún bloque falla.
+    """
+    ahora = ahora or datetime.datetime.now(datetime.timezone.utc)
+    mallas_lat, mallas_lon = np.meshgrid(latitudes, longitudes, indexing='ij')
+    lat_celdas, lon_celdas = mallas_lat.ravel(), mallas_lon.ravel()
+
+    tiempos, bloques = None, []
+    for inicio in range(0, len(lat_celdas), MAX_COORDENADAS_POR_PETICION):
+        fin = inicio + MAX_COORDENADAS_POR_PETICION
+        resultado = _obtener_bloque(lat_celdas[inicio:fin], lon_celdas[inicio:fin], dias_prediccion, ruta_cache, zona_horaria, ahora)
+        if resultado is None:
+            return None
+        tiempos_bloque, cubo_bloque = resultado
+        if tiempos is None:
+            tiempos = tiempos_bloque
+        elif not tiempos.equals(tiempos_bloque):
+            logger.error("Los bloques de la grilla devolvieron horas distintas; no se pueden combinar.")
+            return None
+        bloques.append(cubo_bloque)
+    return tiempos, np.concatenate(bloques, axis=1)
+
+
+def puntuar_cubo(modelo, cubo_modelo, nombres_variables):
+    """
+    Probabilidad de helada para cada (hora, celda) con una sola llamada vectorizada al modelo.
+
+    Args:
+        modelo: Clasificador con predict_proba.
+        cubo_modelo (np.ndarray): (horas, celdas, variables) en unidades del modelo.
+        nombres_variables (list): Nombre de cada variable del último eje.
+
+    Returns:
+        np.ndarray: (horas, celdas) con NaN donde faltan variables.
+    """
+    n_horas, n_celdas = cubo_modelo.shape[:2]
+    indices = [nombres_variables.index(c) for c in COLUMNAS_MODELO]
+    X = cubo_modelo[:, :, indices].reshape(-1, len(indices))
+    validas = ~np.isnan(X).any(axis=1)
+    probabilidades = np.full(len(X), np.nan, dtype=np.float32)
+    if validas.any():
+        clases = list(modelo.classes_)
+        indice_positiva = clases.index(1) if 1 in clases else len(clases) - 1
+        X_validas = pd.DataFrame(X[validas], columns=COLUMNAS_MODELO)
+        probabilidades[validas] = modelo.predict_proba(X_validas)[:, indice_positiva]
+    return probabilidades.reshape(n_horas, n_celdas)
+
+
+def calcular_raster_riesgo(modelo, lat_min, lat_max, lon_min, lon_max, resolucion_lat, resolucion_lon=None, ruta_cache=None,
+                           ahora=None, zona_horaria=ZONA_HORARIA_GRILLA):
+    """
+    Calcula el ráster de riesgo de helada (probabilidad máxima en la madrugada siguiente) de un recuadro.
+
+    Args:
+        ahora (datetime, opcional): Instante con zona (p. ej. el del reloj de la aplicación); por defecto, el actual.
+        zona_horaria (str): Zona IANA de las horas de la grilla; la madrugada siguiente se calcula en ella.
+
+    Returns:
+        dict: {'riesgo': np.ndarray float32 (filas, columnas), 'latitudes', 'longitudes',
+               'madrugada_inicio', 'madrugada_fin'} o None si no se pudieron obtener datos.
+    """
+    zona = ZoneInfo(zona_horaria) # Una zona desconocida falla antes de descargar nada
+    ahora = ahora or datetime.datetime.now(datetime.timezone.utc)
+    latitudes, longitudes = generar_grilla(lat_min, lat_max, lon_min, lon_max, resolucion_lat, resolucion_lon)
+    resultado = obtener_cubo_grilla(latitudes, longitudes, ruta_cache=ruta_cache, zona_horaria=zona_horaria, ahora=ahora)
+    if resultado is None:
+        return None
+    tiempos, cubo = resultado
+
+    cubo_modelo, nombres = transformar_cubo(cubo, COLUMNAS_A_SOLICITAR_API)
+
+    # Open-Meteo devuelve horas locales de la zona pedida: la madrugada se busca en esa hora local.
+    dia_siguiente = ahora.astimezone(zona).date() + datetime.timedelta(days=1)
+    madrugada_inicio = datetime.datetime.combine(dia_siguiente, datetime.time(HORA_INICIO_MADRUGADA))
+    madrugada_fin = datetime.datetime.combine(dia_siguiente, datetime.time(HORA_FIN_MADRUGADA))
+    en_madrugada = np.asarray((tiempos >= madrugada_inicio) & (tiempos <= madrugada_fin))
+    if not en_madrugada.any():
+        logger.warning(f"Sin horas de madrugada ({madrugada_inicio} a {madrugada_fin}) en los datos de la grilla.")
+        return None
+
+    probabilidades = puntuar_cubo(modelo, cubo_modelo[en_madrugada], nombres)
+    # Máximo por celda ignorando horas sin datos; las celdas sin ninguna hora válida quedan en NaN.
+    riesgo = np.nan_to_num(probabilidades, nan=-1.0).max(axis=0)
+    riesgo[riesgo < 0] = np.nan
+    return {
+        'riesgo': riesgo.astype(np.float32).reshape(len(latitudes), len(longitudes)),
+        'latitudes': latitudes,
+        'longitudes': longitudes,
+        'madrugada_inicio': madrugada_inicio,
+        'madrugada_fin': madrugada_fin,
+    }
+
+
+def guardar_raster(ruta_archivo, raster):
+    """
+    Guarda el ráster en formato .npz comprimido (riesgo en float16 y coordenadas de las celdas) y limpia
+    los rásteres antiguos del mismo directorio.
+    """
+    os.makedirs(os.path.dirname(ruta_archivo) or '.', exist_ok=True)
+    np.savez_compressed(
+        ruta_archivo,
+        riesgo=raster['riesgo'].astype(np.float16),
+        latitudes=raster['latitudes'],
+        longitudes=raster['longitudes'],
+        madrugada_inicio=np.datetime64(raster['madrugada_inicio'], 's'),
+        madrugada_fin=np.datetime64(raster['madrugada_fin'], 's'),
+    )
+    limpiar_directorio(os.path.dirname(ruta_archivo) or '.', SEGUNDOS_VIDA_RASTERS, MAX_BYTES_RASTERS)
+    return ruta_archivo
+
+
+def raster_a_npy(raster):
+    """Serializa la matriz de riesgo como bytes .npy (float16), para respuestas binarias compactas."""
+    buffer = io.BytesIO()
+    np.save(buffer, raster['riesgo'].astype(np.float16))
+    return buffer.getvalue()
+
+
+def raster_a_dict(raster, decimales=3):
+    """Representación JSON del ráster (NaN -> None)."""
+    riesgo = np.round(raster['riesgo'].astype(np.float64), decimales)
+    return {
+        'latitudes': np.round(raster['latitudes'], 5).tolist(),
+        'longitudes': np.round(raster['longitudes'], 5).tolist(),
+        'madrugada_inicio': raster['madrugada_inicio'].isoformat(),
+        'madrugada_fin': raster['madrugada_fin'].isoformat(),
+        'riesgo': [[None if np.isnan(v) else float(v) for v in fila] for fila in riesgo],
+    }
@@ -0,0 +1,139 @@
+# coding: utf-8
+"""
+Registro de estaciones (tabla 'estaciones') con caché en memoria.
+
+Cada estación tiene coordenadas, altitud, zona horaria y la versión de modelo que le corresponde
+(p. ej. un árbol entrenado para estaciones de altura). El pronóstico lee el registro desde la caché,
+que se recarga tras SEGUNDOS_VIGENCIA_REGISTRO o al invalidarse cuando se crea o modifica una estación.
+Las entradas de la caché son instantáneas inmutables (EstacionRegistrada), no objetos ORM, para poder
+compartirlas entre hilos y peticiones sin una sesión abierta.
+"""
+import logging
+import re
+import threading
+import time
+from dataclasses import asdict, dataclass
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from database.models import Estacion
+
+logger = logging.getLogger(__name__)
+
+SEGUNDOS_VIGENCIA_REGISTRO = 300
+PATRON_CODIGO = re.compile(r'^[a-z0-9_\-]{1,64}$')
+
+# Estación con la que se sembró el registro (antes estaba fija en el pronóstico automático)
+ESTACION_PREDETERMINADA = {
+    'codigo': 'patala_pucara',
+    'nombre': "Patala, Pucará (Open-Meteo)",
+    'latitud': -12.20892,
+    'longitud': -75.07791,
+    'altitud_m': None,
+    'zona_horaria': "America/Lima",
+    'version_modelo': "modelo_arbol_decision",
+}
+
+
+@dataclass(frozen=True)
+class EstacionRegistrada:
+    id: int
+    codigo: str
+    nombre: str
+    latitud: float
+    longitud: float
+    altitud_m: float
+    zona_horaria: str
+    version_modelo: str
+
+    @classmethod
+    def desde_modelo(cls, estacion):
+        return cls(estacion.id, estacion.codigo, estacion.nombre, estacion.latitud, estacion.longitud,
+                   estacion.altitud_m, estacion.zona_horaria, estacion.version_modelo)
+
+    @property
+    def zona(self):
+        return ZoneInfo(self.zona_horaria)
+
+    def a_dict(self):
+        return asdict(self)
+
+
+def validar_datos_estacion(datos):
+    """Valida los campos de una estación nueva. Retorna la lista de errores (vacía si es válida)."""
+    errores = []
+    if not PATRON_CODIGO.match(str(datos.get('codigo', ''))):
+        errores.append("'codigo' debe tener solo minúsculas, dígitos, '_' o '-' (máx. 64).")
+    if not datos.get('nombre'):
+        errores.append("Falta 'nombre'.")
+    try:
+        if not -90 <= float(datos.get('latitud')) <= 90 or not -180 <= float(datos.get('longitud')) <= 180:
+            errores.append("Coordenadas fuera de rango.")
+    except (TypeError, ValueError):
+        errores.append("'latitud' y 'longitud' deben ser numéricas.")
+    if datos.get('altitud_m') is not None:
+        try:
+            float(datos['altitud_m'])
+        except (TypeError, ValueError):
+            errores.append("'altitud_m' debe ser numérica.")
+    try:
+        ZoneInfo(datos.get('zona_horaria') or ESTACION_PREDETERMINADA['zona_horaria'])
+    except (ZoneInfoNotFoundError, ValueError):
+        errores.append(f"Zona horaria desconocida: {datos.get('zona_horaria')!r}.")
+    return errores
+
+
+def sembrar_estaciones(db_session):
+    """Crea la estación predeterminada si el registro está vacío. Retorna True si la creó."""
+    if db_session.query(Estacion.id).first() is not None:
+        return False
+    db_session.add(Estacion(**ESTACION_PREDETERMINADA))
+    db_session.commit()
+    logger.info(f"Registro de estaciones sembrado con '{ESTACION_PREDETERMINADA['codigo']}'.")
+    return True
+
+
+class RegistroEstaciones:
+    """Caché en memoria de las estaciones activas, segura entre hilos."""
+
+    def __init__(self, abrir_sesion, segundos_vigencia=SEGUNDOS_VIGENCIA_REGISTRO):
+        self.abrir_sesion = abrir_sesion # Callable que devuelve una sesión de SQLAlchemy nueva
+        self.segundos_vigencia = segundos_vigencia
+        self._estaciones = None # codigo -> EstacionRegistrada
+        self._cargado_en = 0.0
+        self._candado = threading.Lock()
+
+    def invalidar(self):
+        with self._candado:
+            self._estaciones = None
+
+    def _vigentes(self):
+        with self._candado:
+            if self._estaciones is not None and time.monotonic() - self._cargado_en <= self.segundos_vigencia:
+                return self._estaciones
+        db_session = self.abrir_sesion()
+        try:
+            filas = db_session.query(Estacion).filter(Estacion.activa.is_(True)).order_by(Estacion.codigo).all()
+            estaciones = {e.codigo: EstacionRegistrada.desde_modelo(e) for e in filas}
+        finally:
+            db_session.close()
+        with self._candado:
+            self._estaciones = estaciones
+            self._cargado_en = time.monotonic()
+        return estaciones
+
+    def activas(self):
+        return list(self._vigentes().values())
+
+    def obtener(self, codigo):
+        return self._vigentes().get(codigo)
+
+    def versiones_modelo(self):
+        return sorted({e.version_modelo for e in self.activas()})
+
+
+def agrupar_por_modelo(estaciones):
+    """{version_modelo: [estaciones]} conservando el orden de entrada dentro de cada grupo."""
+    grupos = {}
+    for estacion in estaciones:
+        grupos.setdefault(estacion.version_modelo, []).append(estacion)
+    return grupos
@@ -0,0 +1,52 @@
+# coding: utf-8
+"""
+Reloj inyectable de la aplicación.
+
+Las rutas leen la hora desde app.config['RELOJ'] en lugar de llamar a datetime.now() directamente, de
+modo que la reproducción de pronósticos grabados (src/replay_pronosticos.py) puede fijar el instante de
+cada grabación y obtener resultados deterministas ("mañana", la madrugada elegida, la reutilización de
+pronósticos recientes y la fecha de registro dependen de él).
+"""
+import datetime
+
+
+class RelojSistema:
+    """Hora real del sistema."""
+
+    def ahora(self, zona=None):
+        """Como datetime.datetime.now(zona): con zona, un datetime con zona; sin ella, hora local sin zona."""
+        return datetime.datetime.now(zona)
+
+    def utcnow(self):
+        """Hora UTC sin zona, igual que las columnas DateTime de la base de datos."""
+        return datetime.datetime.utcnow()
+
+    def hoy(self):
+        return datetime.date.today()
+
+
+class RelojFijo(RelojSistema):
+    """Reloj detenido en un instante que se ajusta o avanza a mano."""
+
+    def __init__(self, instante):
+        self.ajustar(instante)
+
+    def ajustar(self, instante):
+        """Fija el instante; uno sin zona se interpreta como UTC."""
+        if instante.tzinfo is None:
+            instante = instante.replace(tzinfo=datetime.timezone.utc)
+        self.instante = instante.astimezone(datetime.timezone.utc)
+
+    def avanzar(self, intervalo):
+        self.instante += intervalo
+
+    def ahora(self, zona=None):
+        if zona is None:
+            return self.instante.astimezone().replace(tzinfo=None)
+        return self.instante.astimezone(zona)
+
+    def utcnow(self):
+        return self.instante.replace(tzinfo=None)
+
+    def hoy(self):
+        return self.ahora().date()
@@ -0,0 +1,240 @@
+# coding: utf-8
+"""
+Reproducción sin red de pronósticos grabados de Open-Meteo, para medir rendimiento y detectar cambios
+de resultados entre versiones del código.
+
+Grabar:
+- En servicio, con la variable de entorno GRABAR_OPENMETEO=<directorio> cada respuesta de Open-Meteo
+  queda grabada con el instante del reloj de la aplicación (src/grabacion_openmeteo.py). Con el tiempo
+  se acumulan cientos o miles de días reales.
+- A mano: 'grabar' descarga una vez los datos de todas las estaciones activas y los graba.
+
+Reproducir:
+'reproducir' crea la aplicación con una base SQLite temporal, un RelojFijo y el transporte de
+reproducción. Registra una estación por cada ubicación grabada y recorre las grabaciones en orden
+cronológico. Para cada una fija el reloj en su instante y llama a la ruta real de pronóstico
+(descarga -> variables -> control de calidad -> predicción -> base de datos). Al final informa el
+rendimiento y escribe un JSONL de resultados. Con --comparar se contrasta con el JSONL de otra versión.
+
+Uso (desde la raíz del proyecto):
+    python src/replay_pronosticos.py grabar --grabaciones datos/grabaciones_openmeteo
+    python src/replay_pronosticos.py reproducir --grabaciones datos/grabaciones_openmeteo \\
+        --salida resultados_replay.jsonl [--comparar resultados_anteriores.jsonl] [--limite 5000]
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+RAIZ_PROYECTO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIRECTORIO_GRABACIONES = os.path.join(RAIZ_PROYECTO, "datos", "grabaciones_openmeteo")
+TOLERANCIA_PROBABILIDAD = 1e-9
+CAMPOS_COMPARADOS = ("fecha_prediccion_para", "resultado", "intensidad", "calidad_datos", "error")
+MAX_DIFERENCIAS_MOSTRADAS = 10
+SEGUNDOS_ESPERA_MODELO = 120
+
+
+def _importar_aplicacion():
+    """main.py y los módulos de src/ se importan desde la raíz (los modelos usan rutas relativas a ella)."""
+    if RAIZ_PROYECTO not in sys.path:
+        sys.path.insert(0, RAIZ_PROYECTO)
+    os.chdir(RAIZ_PROYECTO)
+    import main
+    return main
+
+
+def estaciones_de_grabacion(grabacion, dias_prediccion):
+    """
+    Estaciones (dicts con los campos de Estacion) de una grabación del pronóstico por estaciones, en el
+    orden de la petición. Retorna [] si la grabación no viene de ese flujo (p. ej. la grilla).
+    """
+    parametros = grabacion["parametros"]
+    if (grabacion["url"].rstrip('/').split('/')[-1] != 'forecast' or parametros.get("timezone", "auto") == "auto"
+            or str(parametros.get("forecast_days")) != str(dias_prediccion)):
+        return []
+    latitudes = [float(v) for v in parametros["latitude"].split(',')]
+    longitudes = [float(v) for v in parametros["longitude"].split(',')]
+    elevaciones = [float(v) for v in parametros["elevation"].split(',')] if "elevation" in parametros else [None] * len(latitudes)
+    estaciones = []
+    for latitud, longitud, altitud in zip(latitudes, longitudes, elevaciones):
+        huella = f"{latitud:.5f}|{longitud:.5f}|{altitud}|{parametros['timezone']}"
+        codigo = f"rep_{hashlib.sha1(huella.encode('utf-8')).hexdigest()[:10]}" # Estable entre corridas y versiones
+        estaciones.append({
+            "codigo": codigo, "nombre": f"Replay {latitud:.5f},{longitud:.5f}",
+            "latitud": latitud, "longitud": longitud, "altitud_m": altitud, "zona_horaria": parametros["timezone"],
+        })
+    return estaciones
+
+
+def _normalizar(instante, codigo, cuerpo):
+    return {
+        "instante": instante.isoformat(),
+        "estacion": codigo,
+        "fecha_prediccion_para": cuerpo.get("fecha_prediccion_para"),
+        "probabilidad_helada": cuerpo.get("probabilidad_helada"),
+        "resultado": cuerpo.get("resultado"),
+        "intensidad": cuerpo.get("intensidad"),
+        "calidad_datos": cuerpo.get("calidad_datos"),
+        "error": cuerpo.get("error"),
+    }
+
+
+def _percentil(valores, q):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(q / 100 * (len(ordenados) - 1))))] if ordenados else None
+
+
+def grabar(directorio):
+    """Descarga y graba una vez los datos de todas las estaciones activas (sin predecir ni guardar)."""
+    main = _importar_aplicacion()
+    app = main.create_app({'DIRECTORIO_GRABACION_OPENMETEO': directorio, 'PRECARGA_MODELO': False})
+    from src.pronostico_estaciones import pronosticar_estaciones
+    antes = len(os.listdir(directorio))
+    with app.app_context():
+        estaciones = main.registro_estaciones.activas()
+        pronosticar_estaciones(estaciones, lambda version: None, ahora=app.config['RELOJ'].ahora(datetime.timezone.utc))
+    print(f"{len(os.listdir(directorio)) - antes} grabaciones nuevas de {len(estaciones)} estaciones en {directorio}")
+
+
+def reproducir(directorio, ruta_salida=None, limite=None):
+    """Reproduce las grabaciones por la ruta real de pronóstico. Retorna (registros, métricas)."""
+    main = _importar_aplicacion()
+    from database.database import get_db
+    from database.models import Estacion
+    from src import data_fetcher
+    from src.grabacion_openmeteo import AdaptadorReproduccion, leer_grabacion
+    from src.pronostico_estaciones import DIAS_PREDICCION_ESTACIONES
+    from src.reloj import RelojFijo
+
+    reloj = RelojFijo(datetime.datetime.utcnow())
+    adaptador = AdaptadorReproduccion(directorio, reloj)
+    plan, omitidas = [], 0
+    for instante, ruta in adaptador.grabaciones()[:limite]:
+        estaciones = estaciones_de_grabacion(leer_grabacion(ruta), DIAS_PREDICCION_ESTACIONES)
+        if estaciones:
+            plan.append((instante, estaciones))
+        else:
+            omitidas += 1
+    if not plan:
+        raise SystemExit(f"No hay grabaciones del pronóstico por estaciones en {directorio}.")
+
+    with tempfile.TemporaryDirectory() as temporal:
+        app = main.create_app({
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(temporal, 'replay.db')}",
+            'RUTA_SERIES_HORARIAS': os.path.join(temporal, 'series_horarias'),
+            'RELOJ': reloj, 'PRECARGA_MODELO': True, 'DIRECTORIO_GRABACION_OPENMETEO': None,
+        })
+        data_fetcher.configurar_transporte(adaptador)
+
+        db_session = next(get_db())
+        try:
+            unicas = {e["codigo"]: e for _, estaciones in plan for e in estaciones}
+            for datos in unicas.values():
+                db_session.add(Estacion(version_modelo=main.VERSION_MODELO_PREDETERMINADA, **datos))
+            db_session.commit()
+        finally:
+            db_session.close()
+        main.registro_estaciones.invalidar()
+        if main.catalogo_modelos.obtener(timeout=SEGUNDOS_ESPERA_MODELO) is None:
+            raise SystemExit(f"El modelo no está disponible: {main.catalogo_modelos.servicio().error}")
+
+        cliente = app.test_client()
+        registros, latencias = [], []
+        inicio = time.perf_counter()
+        for instante, estaciones in plan:
+            reloj.ajustar(instante)
+            codigos = [e["codigo"] for e in estaciones]
+            t0 = time.perf_counter()
+            if len(codigos) == 1:
+                cuerpos = [cliente.get(f"/pronostico_automatico?estacion={codigos[0]}&forzar=true").get_json()]
+            else:
+                respuesta = cliente.post(f"/pronostico_estaciones?estaciones={','.join(codigos)}").get_json()
+                cuerpos = respuesta.get("resultados") or [respuesta] * len(codigos)
+            latencias.append(time.perf_counter() - t0)
+            registros += [_normalizar(instante, c, cuerpo or {}) for c, cuerpo in zip(codigos, cuerpos)]
+        segundos = time.perf_counter() - inicio
+
+    metricas = {
+        "grabaciones": len(plan), "omitidas": omitidas, "pronosticos": len(registros),
+        "errores": sum(1 for r in registros if r["error"]), "segundos": segundos,
+        "pronosticos_por_segundo": len(registros) / segundos if segundos else None,
+        "latencia_p50_ms": _percentil(latencias, 50) * 1000, "latencia_p99_ms": _percentil(latencias, 99) * 1000,
+        "transporte_aciertos": adaptador.aciertos, "transporte_fallos": adaptador.fallos,
+    }
+    if ruta_salida:
+        with open(ruta_salida, 'w', encoding='utf-8') as f:
+            for registro in registros:
+                f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+    return registros, metricas
+
+
+def comparar_resultados(anteriores, actuales, tolerancia=TOLERANCIA_PROBABILIDAD):
+    """Diferencias por (instante, estación) entre dos corridas: faltantes en cada una y campos que cambiaron."""
+    por_clave_anterior = {(r["instante"], r["estacion"]): r for r in anteriores}
+    por_clave_actual = {(r["instante"], r["estacion"]): r for r in actuales}
+    cambios = []
+    for clave in sorted(por_clave_anterior.keys() & por_clave_actual.keys()):
+        anterior, actual = por_clave_anterior[clave], por_clave_actual[clave]
+        campos = [c for c in CAMPOS_COMPARADOS if anterior.get(c) != actual.get(c)]
+        p_anterior, p_actual = anterior.get("probabilidad_helada"), actual.get("probabilidad_helada")
+        if (p_anterior is None) != (p_actual is None) or (p_anterior is not None and abs(p_anterior - p_actual) > tolerancia):
+            campos.append("probabilidad_helada")
+        if campos:
+            cambios.append({"instante": clave[0], "estacion": clave[1],
+                            "campos": {c: [anterior.get(c), actual.get(c)] for c in campos}})
+    return {
+        "solo_en_anterior": sorted(por_clave_anterior.keys() - por_clave_actual.keys()),
+        "solo_en_actual": sorted(por_clave_actual.keys() - por_clave_anterior.keys()),
+        "cambios": cambios,
+    }
+
+
+def _leer_jsonl(ruta):
+    with open(ruta, 'r', encoding='utf-8') as f:
+        return [json.loads(linea) for linea in f if linea.strip()]
+
+
+def imprimir_informe(metricas, diferencias=None):
+    print(f"Grabaciones reproducidas: {metricas['grabaciones']} (omitidas: {metricas['omitidas']}); "
+          f"pronósticos: {metricas['pronosticos']} (con error: {metricas['errores']})")
+    print(f"Tiempo total: {metricas['segundos']:.2f} s; {metricas['pronosticos_por_segundo']:.1f} pronósticos/s; "
+          f"latencia por grabación p50 {metricas['latencia_p50_ms']:.1f} ms, p99 {metricas['latencia_p99_ms']:.1f} ms")
+    print(f"Transporte: {metricas['transporte_aciertos']} respuestas grabadas servidas, {metricas['transporte_fallos']} peticiones sin grabación")
+    if diferencias is None:
+        return
+    print(f"Comparación: {len(diferencias['cambios'])} pronósticos con cambios, "
+          f"{len(diferencias['solo_en_anterior'])} solo en la corrida anterior, {len(diferencias['solo_en_actual'])} solo en la actual")
+    for cambio in diferencias['cambios'][:MAX_DIFERENCIAS_MOSTRADAS]:
+        print(f"  {cambio['instante']} {cambio['estacion']}: {cambio['campos']}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Grabación y reproducción sin red de pronósticos de Open-Meteo.")
+    subparsers = parser.add_subparsers(dest='accion', required=True)
+    parser_grabar = subparsers.add_parser('grabar', help="Graba una descarga de todas las estaciones activas.")
+    parser_grabar.add_argument('--grabaciones', default=DIRECTORIO_GRABACIONES, help="Directorio de grabaciones.")
+    parser_reproducir = subparsers.add_parser('reproducir', help="Reproduce las grabaciones por la ruta de pronóstico.")
+    parser_reproducir.add_argument('--grabaciones', default=DIRECTORIO_GRABACIONES, help="Directorio de grabaciones.")
+    parser_reproducir.add_argument('--salida', help="JSONL donde escribir los resultados de esta corrida.")
+    parser_reproducir.add_argument('--comparar', help="JSONL de otra corrida (otra versión del código) a contrastar.")
+    parser_reproducir.add_argument('--limite', type=int, help="Reproducir solo las primeras N grabaciones.")
+    parser_reproducir.add_argument('--tolerancia', type=float, default=TOLERANCIA_PROBABILIDAD,
+                                   help="Diferencia de probabilidad a partir de la cual se informa un cambio.")
+    parser_reproducir.add_argument('--fallar-si-difiere', action='store_true', help="Código de salida 1 si hay diferencias.")
+    args = parser.parse_args()
+
+    if args.accion == 'grabar':
+        os.makedirs(args.grabaciones, exist_ok=True)
+        grabar(os.path.abspath(args.grabaciones))
+    else:
+        ruta_comparar = os.path.abspath(args.comparar) if args.comparar else None
+        registros, metricas = reproducir(os.path.abspath(args.grabaciones),
+                                         os.path.abspath(args.salida) if args.salida else None, args.limite)
+        diferencias = comparar_resultados(_leer_jsonl(ruta_comparar), registros, args.tolerancia) if ruta_comparar else None
+        imprimir_informe(metricas, diferencias)
+        hay_diferencias = diferencias is not None and any(diferencias.values())
+        sys.exit(1 if args.fallar_si_difiere and hay_diferencias else 0)
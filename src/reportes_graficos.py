@@ -0,0 +1,151 @@
+# coding: utf-8
+"""
+Etapa opcional de reportes gráficos para los scripts de entrenamiento y análisis.
+
+- matplotlib se importa solo cuando realmente se va a dibujar, forzando el backend 'Agg'
+  (sin pantalla), por lo que los scripts funcionan igual en CI y en servidores headless.
+- Cada gráfica guarda a su lado un archivo '.huella' con el hash del modelo y de los datos
+  de entrada; si la huella no cambió, no se vuelve a dibujar.
+- Los árboles grandes no se dibujan con plot_tree (muy costoso e ilegible): se exportan como
+  texto (export_text) y como Graphviz (.dot).
+"""
+import hashlib
+import os
+
+# Árboles con más nodos que este umbral se exportan como texto/Graphviz en lugar de imagen.
+UMBRAL_NODOS_GRAFICA_ARBOL = 63
+EXTENSION_HUELLA = ".huella"
+TAMANO_BLOQUE_HASH = 1 << 20
+
+
+def obtener_pyplot():
+    """Importa matplotlib.pyplot de forma diferida con el backend no interactivo 'Agg'."""
+    import matplotlib
+    matplotlib.use('Agg', force=True)
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def calcular_huella(rutas_archivos=(), parametros=None):
+    """
+    Hash SHA-256 del contenido de los archivos dados (modelo, datos) y de los parámetros del reporte.
+    Si algún archivo no existe, se incluye solo su ruta.
+    """
+    sha = hashlib.sha256()
+    for ruta in rutas_archivos:
+        sha.update(str(ruta).encode('utf-8'))
+        if os.path.exists(ruta):
+            with open(ruta, 'rb') as f:
+                for bloque in iter(lambda: f.read(TAMANO_BLOQUE_HASH), b''):
+                    sha.update(bloque)
+    if parametros is not None:
+        sha.update(repr(parametros).encode('utf-8'))
+    return sha.hexdigest()
+
+
+def reporte_vigente(ruta_salida, huella):
+    """True si la salida ya existe y fue generada con la misma huella."""
+    ruta_huella = ruta_salida + EXTENSION_HUELLA
+    if not (os.path.exists(ruta_salida) and os.path.exists(ruta_huella)):
+        return False
+    with open(ruta_huella, 'r', encoding='utf-8') as f:
+        return f.read().strip() == huella
+
+
+def registrar_huella(ruta_salida, huella):
+    with open(ruta_salida + EXTENSION_HUELLA, 'w', encoding='utf-8') as f:
+        f.write(huella)
+
+
+def generar_reporte_arbol(modelo, nombres_variables, ruta_sin_extension, huella, titulo, umbral_nodos=UMBRAL_NODOS_GRAFICA_ARBOL):
+    """
+    Genera el reporte visual de un árbol de decisión.
+
+    Árboles pequeños se dibujan con plot_tree en '<ruta>.png'. Árboles con más de `umbral_nodos`
+    nodos se exportan como '<ruta>.txt' (export_text) y '<ruta>.dot' (export_graphviz).
+    En ambos casos se omite la generación si la huella no cambió.
+
+    Returns:
+        list: Rutas de los archivos vigentes del reporte.
+    """
+    from sklearn.tree import export_graphviz, export_text
+
+    clases = [str(c) for c in modelo.classes_]
+    nombres_variables = list(nombres_variables)
+
+    if modelo.tree_.node_count > umbral_nodos:
+        ruta_texto = ruta_sin_extension + ".txt"
+        ruta_dot = ruta_sin_extension + ".dot"
+        if reporte_vigente(ruta_texto, huella) and reporte_vigente(ruta_dot, huella):
+            print(f"Reporte del árbol sin cambios (huella {huella[:12]}). Se omite la regeneración.")
+            return [ruta_texto, ruta_dot]
+        print(f"Árbol con {modelo.tree_.node_count} nodos (> {umbral_nodos}): exportando resumen de texto y Graphviz.")
+        with open(ruta_texto, 'w', encoding='utf-8') as f:
+            f.write(f"{titulo}\n\n")
+            f.write(export_text(modelo, feature_names=nombres_variables, show_weights=True))
+        export_graphviz(modelo, out_file=ruta_dot, feature_names=nombres_variables, class_names=clases, filled=True, rounded=True)
+        registrar_huella(ruta_texto, huella)
+        registrar_huella(ruta_dot, huella)
+        return [ruta_texto, ruta_dot]
+
+    ruta_png = ruta_sin_extension + ".png"
+    if reporte_vigente(ruta_png, huella):
+        print(f"Gráfica del árbol sin cambios (huella {huella[:12]}). Se omite la regeneración.")
+        return [ruta_png]
+
+    from sklearn.tree import plot_tree
+    plt = obtener_pyplot()
+    plt.figure(figsize=(25, 15))
+    plot_tree(modelo, feature_names=nombres_variables, class_names=clases, filled=True, rounded=True, fontsize=10)
+    plt.title(titulo, fontsize=16)
+    try:
+        plt.savefig(ruta_png)
+        registrar_huella(ruta_png, huella)
+    finally:
+        plt.close()
+    return [ruta_png]
+
+
+def graficar_barras_horizontales(etiquetas, valores, ruta_salida, huella, titulo, etiqueta_x, etiqueta_y, color='lightcoral'):
+    """Gráfica de barras horizontales (mayor valor arriba). Se omite si la huella no cambió."""
+    if reporte_vigente(ruta_salida, huella):
+        print(f"Gráfica sin cambios, se omite: {ruta_salida}")
+        return False
+    plt = obtener_pyplot()
+    plt.figure(figsize=(12, 8))
+    plt.barh(etiquetas, valores, color=color)
+    plt.xlabel(etiqueta_x)
+    plt.ylabel(etiqueta_y)
+    plt.title(titulo)
+    plt.gca().invert_yaxis()
+    plt.grid(True, axis='x', linestyle=':', alpha=0.7)
+    plt.tight_layout()
+    try:
+        plt.savefig(ruta_salida)
+        registrar_huella(ruta_salida, huella)
+    finally:
+        plt.close()
+    return True
+
+
+def graficar_distribuciones(distribuciones, etiquetas, ruta_salida, huella, titulo, etiqueta_x, etiqueta_y):
+    """Diagrama de cajas horizontal, una caja por etiqueta. Se omite si la huella no cambió."""
+    if reporte_vigente(ruta_salida, huella):
+        print(f"Gráfica sin cambios, se omite: {ruta_salida}")
+        return False
+    plt = obtener_pyplot()
+    plt.figure(figsize=(12, 8))
+    plt.boxplot(distribuciones, vert=False)
+    plt.yticks(range(1, len(etiquetas) + 1), etiquetas)
+    plt.axvline(0, color='gray', linestyle='--', linewidth=1)
+    plt.xlabel(etiqueta_x)
+    plt.ylabel(etiqueta_y)
+    plt.title(titulo)
+    plt.grid(True, axis='x', linestyle=':', alpha=0.7)
+    plt.tight_layout()
+    try:
+        plt.savefig(ruta_salida)
+        registrar_huella(ruta_salida, huella)
+    finally:
+        plt.close()
+    return True
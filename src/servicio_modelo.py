@@ -0,0 +1,167 @@
+# coding: utf-8
+"""
+Carga diferida del modelo de predicción y de sus artefactos (explicador y estadísticas de entrenamiento).
+
+Importar joblib/scikit-learn y deserializar el .pkl es lo más lento del arranque de la aplicación.
+ServicioModelo lo saca del import de main.py: la carga corre en un hilo en segundo plano (precarga al
+crear la app) o se dispara con la primera petición que necesita el modelo (modo diferido). Las rutas
+consultan el estado con 'listo'/'cargando' y esperan un tiempo acotado con obtener(timeout).
+"""
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ServicioModelo:
+    """Contenedor del modelo cargado en segundo plano, seguro entre hilos."""
+
+    def __init__(self, ruta_modelos, nombre_modelo):
+        self.ruta_modelos = ruta_modelos
+        self.nombre_modelo = nombre_modelo
+        self.modelo = None # Predictor compilado (src/predictor_compilado.py) o, si no se pudo compilar, el de sklearn
+        self.modelo_original = None # Estimador de sklearn tal como está en el .pkl
+        self.explicador = None # Tabla de contribuciones por nodo precalculada al cargar el modelo
+        self.estadisticas = None # Histogramas por variable del entrenamiento, para detectar deriva
+        self.monitor_deriva = None # Ventana móvil de valores servidos comparada contra esos histogramas
+        self.limites_calidad = None # Límites del control de calidad (src/calidad_datos.py), precalculados al cargar
+        self.error = None
+        self.segundos_carga = None
+        self._cargado = threading.Event()
+        self._candado = threading.Lock()
+        self._hilo = None
+
+    @property
+    def ruta_modelo(self):
+        return os.path.join(self.ruta_modelos, self.nombre_modelo)
+
+    @property
+    def listo(self):
+        return self._cargado.is_set() and self.modelo is not None
+
+    @property
+    def cargando(self):
+        return self._hilo is not None and not self._cargado.is_set()
+
+    def iniciar_carga(self):
+        """Lanza la carga en un hilo daemon (una sola vez; las llamadas siguientes no hacen nada)."""
+        with self._candado:
+            if self._hilo is not None:
+                return
+            self._hilo = threading.Thread(target=self._cargar, name="carga-modelo", daemon=True)
+            self._hilo.start()
+
+    def _cargar(self):
+        inicio = time.perf_counter()
+        try:
+            # Importaciones pesadas diferidas: solo las paga el hilo de carga.
+            import joblib
+            try:
+                from src.especificacion_features import (COLUMNAS_MODELO, NOMBRE_ESTADISTICAS_JSON, MonitorDeriva, cargar_estadisticas,
+                                                         ruta_estadisticas_version)
+                from src.explicabilidad import ExplicadorArbol
+                from src.predictor_compilado import compilar_predictor
+                from src.calidad_datos import LimitesCalidad
+            except ImportError:  # Ejecución directa desde src/
+                from especificacion_features import (COLUMNAS_MODELO, NOMBRE_ESTADISTICAS_JSON, MonitorDeriva, cargar_estadisticas,
+                                                     ruta_estadisticas_version)
+                from explicabilidad import ExplicadorArbol
+                from predictor_compilado import compilar_predictor
+                from calidad_datos import LimitesCalidad
+
+            if not os.path.exists(self.ruta_modelo):
+                self.error = f"No se encontró el modelo de predicción en la ruta especificada: {self.ruta_modelo}."
+                logger.error(f"Error crítico: {self.error}")
+                logger.warning("La funcionalidad de predicción NO estará disponible.")
+            else:
+                modelo = joblib.load(self.ruta_modelo)
+                try:
+                    self.explicador = ExplicadorArbol(modelo, COLUMNAS_MODELO)
+                    logger.info("Explicador de predicciones (camino de decisión y contribuciones) precalculado.")
+                except TypeError as e:
+                    logger.warning(f"No se pudo precalcular el explicador de predicciones: {e}")
+                # Los ensambles calibrados se aplanan una vez aquí para que la latencia por petición no crezca con ellos.
+                self.modelo_original = modelo
+                self.modelo = compilar_predictor(modelo) or modelo
+                logger.info(f"Modelo de predicción cargado exitosamente desde: {self.ruta_modelo}")
+
+            ruta_estadisticas = ruta_estadisticas_version(self.ruta_modelos, self.nombre_modelo)
+            self.estadisticas = cargar_estadisticas(ruta_estadisticas)
+            if self.estadisticas is None:
+                # Versiones entrenadas antes de guardar estadísticas por versión: se usa el archivo compartido.
+                self.estadisticas = cargar_estadisticas(os.path.join(self.ruta_modelos, NOMBRE_ESTADISTICAS_JSON))
+                if self.estadisticas is not None:
+                    logger.warning(f"No se encontró {ruta_estadisticas}; {self.nombre_modelo} usa las estadísticas "
+                                   f"compartidas ({NOMBRE_ESTADISTICAS_JSON}), que pueden no ser las de su entrenamiento.")
+            if self.estadisticas is None:
+                logger.warning("No se encontraron estadísticas de entrenamiento; la detección de deriva queda desactivada.")
+            else:
+                self.monitor_deriva = MonitorDeriva(self.estadisticas)
+            self.limites_calidad = LimitesCalidad.desde_estadisticas(self.estadisticas)
+        except Exception as e:
+            self.error = f"Error al cargar el modelo de predicción desde {self.ruta_modelo}: {e}"
+            logger.error(f"Error crítico: {self.error}", exc_info=True)
+            self.modelo = None
+        finally:
+            self.segundos_carga = time.perf_counter() - inicio
+            self._cargado.set()
+
+    def obtener(self, timeout=None):
+        """
+        Devuelve el modelo, iniciando la carga si hace falta y esperando como máximo 'timeout' segundos.
+
+        Returns:
+            El modelo, o None si sigue cargando al vencer la espera o si la carga falló (ver 'error').
+        """
+        self.iniciar_carga()
+        self._cargado.wait(timeout)
+        return self.modelo if self._cargado.is_set() else None
+
+    def estado(self):
+        return {
+            "listo": self.listo,
+            "cargando": self.cargando,
+            "error": self.error,
+            "compilado": self.modelo is not None and self.modelo is not self.modelo_original,
+            "segundos_carga": round(self.segundos_carga, 3) if self.segundos_carga is not None else None,
+        }
+
+
+class CatalogoModelos:
+    """
+    Modelos por versión (archivo <version>.pkl en la carpeta de modelos), cada uno con su ServicioModelo.
+    Las estaciones del registro indican qué versión usan; cada versión se carga una sola vez y se
+    comparte entre todas sus estaciones.
+    """
+
+    def __init__(self, ruta_modelos, version_predeterminada):
+        self.ruta_modelos = ruta_modelos
+        self.version_predeterminada = version_predeterminada
+        self._servicios = {}
+        self._candado = threading.Lock()
+
+    def existe(self, version):
+        return (bool(version) and os.path.basename(version) == version
+                and os.path.exists(os.path.join(self.ruta_modelos, f"{version}.pkl")))
+
+    def servicio(self, version=None):
+        version = version or self.version_predeterminada
+        with self._candado:
+            if version not in self._servicios:
+                self._servicios[version] = ServicioModelo(self.ruta_modelos, f"{version}.pkl")
+            return self._servicios[version]
+
+    def precargar(self, versiones=None):
+        """Inicia en segundo plano la carga de las versiones indicadas (por defecto, la predeterminada)."""
+        for version in versiones or [self.version_predeterminada]:
+            self.servicio(version).iniciar_carga()
+
+    def obtener(self, version=None, timeout=None):
+        return self.servicio(version).obtener(timeout)
+
+    def estado(self):
+        with self._candado:
+            servicios = dict(self._servicios)
+        return {version: servicio.estado() for version, servicio in servicios.items()}
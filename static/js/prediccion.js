@@ -1,5 +1,57 @@
 // Funciones para la interfaz de predicción de heladas
 
+// Pinta una predicción (de /pronostico_automatico, /obtener_prediccion_actual o del canal de eventos) en la interfaz.
+function mostrarPrediccion(prediccion) {
+  const statusBox = document.getElementById('statusBox');
+  const statusText = document.getElementById('statusText');
+
+  document.getElementById('ubicacion').textContent = prediccion.ubicacion || "N/A";
+  document.getElementById('estacion').textContent = prediccion.estacion_meteorologica || "N/A";
+
+  if (prediccion.fecha_prediccion_para) {
+    const fechaPredPara = new Date(prediccion.fecha_prediccion_para);
+    document.getElementById('fecha').textContent = fechaPredPara.toLocaleDateString('es-ES', {
+      day: 'numeric', month: 'long', year: 'numeric', hour: '2-digit', minute: '2-digit'
+    });
+  } else {
+    document.getElementById('fecha').textContent = "N/A";
+  }
+
+  document.getElementById('intensidad').textContent = prediccion.intensidad || 'N/A';
+  document.getElementById('duracion').textContent = prediccion.duracion_estimada_horas ? `${prediccion.duracion_estimada_horas} horas` : 'N/A';
+
+  statusText.textContent = prediccion.resultado ? prediccion.resultado.replace(/_/g, ' ') : 'No Determinado';
+  statusBox.className = 'flex-1 rounded-md flex flex-col items-center justify-center py-8 px-6'; // Reset clases
+
+  if (prediccion.resultado === 'Probable') {
+    statusBox.classList.add('bg-red-500');
+  } else if (prediccion.resultado === 'Poco Probable') {
+    statusBox.classList.add('bg-green-500');
+  } else {
+    statusBox.classList.add('bg-yellow-500'); // Para "No Determinada" u otros casos
+  }
+}
+
+// Canal de eventos (Server-Sent Events): las nuevas predicciones llegan solas, sin re-consultar al servidor.
+// EventSource se reconecta automáticamente si la conexión se corta.
+function suscribirPredicciones() {
+  if (!window.EventSource) {
+    console.log("El navegador no soporta EventSource; no se recibirán predicciones en vivo.");
+    return null;
+  }
+  const fuente = new EventSource('/eventos/predicciones');
+  fuente.addEventListener('prediccion', (evento) => {
+    const prediccion = JSON.parse(evento.data);
+    console.log("Nueva predicción recibida por el canal de eventos:", prediccion);
+    mostrarPrediccion(prediccion);
+    if (prediccion.mensaje) {
+      document.getElementById('resultadoGlobalPronostico').innerHTML = `<strong>${prediccion.mensaje}</strong>`;
+    }
+  });
+  fuente.onerror = () => console.log("Canal de eventos desconectado; reintentando...");
+  return fuente;
+}
+
 async function realizarPrediccionHoy() {
   console.log("Solicitando pronóstico automático con Open-Meteo...");
   const statusBox = document.getElementById('statusBox');
@@ -40,31 +92,7 @@ async function realizarPrediccionHoy() {
     resultadoGlobalDiv.innerHTML = `<strong>${prediccion.mensaje || "Predicción procesada."}</strong>`;
 
     // Actualizar los campos de la interfaz con la nueva predicción
-    document.getElementById('ubicacion').textContent = prediccion.ubicacion || "N/A";
-    document.getElementById('estacion').textContent = prediccion.estacion_meteorologica || "N/A";
-
-    if (prediccion.fecha_prediccion_para) {
-      const fechaPredPara = new Date(prediccion.fecha_prediccion_para);
-      document.getElementById('fecha').textContent = fechaPredPara.toLocaleDateString('es-ES', {
-        day: 'numeric', month: 'long', year: 'numeric', hour: '2-digit', minute: '2-digit'
-      });
-    } else {
-      document.getElementById('fecha').textContent = "N/A";
-    }
-
-    document.getElementById('intensidad').textContent = prediccion.intensidad || 'N/A';
-    document.getElementById('duracion').textContent = prediccion.duracion_estimada_horas ? `${prediccion.duracion_estimada_horas} horas` : 'N/A';
-
-    statusText.textContent = prediccion.resultado ? prediccion.resultado.replace(/_/g, ' ') : 'No Determinado';
-    statusBox.className = 'flex-1 rounded-md flex flex-col items-center justify-center py-8 px-6'; // Reset clases
-
-    if (prediccion.resultado === 'Probable') {
-      statusBox.classList.add('bg-red-500');
-    } else if (prediccion.resultado === 'Poco Probable') {
-      statusBox.classList.add('bg-green-500');
-    } else {
-      statusBox.classList.add('bg-yellow-500'); // Para "No Determinada" u otros casos
-    }
+    mostrarPrediccion(prediccion);
 
     // Limpiar la tabla de pronósticos detallados ya que solo tenemos una predicción principal ahora.
     // Si en el futuro /pronostico_automatico devolviera múltiples, esta parte se podría reintroducir.
@@ -92,7 +120,7 @@ function verRegistroPredicciones() {
   window.location.href = '/registros_ui';
 }
 
-// Opcional: Cargar una predicción inicial o estado al cargar la página
+// Cargar la predicción actual una sola vez al abrir la página; las siguientes llegan por el canal de eventos.
 window.onload = async () => {
   console.log("Página cargada. Intentando cargar predicción actual.");
   const statusBox = document.getElementById('statusBox');
@@ -110,30 +138,7 @@ window.onload = async () => {
 
     if (response.ok) {
       console.log("Predicción actual recibida:", data);
-      statusText.textContent = data.resultado ? data.resultado.replace(/_/g, ' ') : 'No Determinado';
-      ubicacionEl.textContent = data.ubicacion || 'N/A';
-      estacionEl.textContent = data.estacion_meteorologica || 'N/A';
-
-      if (data.fecha_prediccion_para) {
-        const fechaPred = new Date(data.fecha_prediccion_para);
-        fechaEl.textContent = fechaPred.toLocaleDateString('es-ES', {
-          day: 'numeric', month: 'long', year: 'numeric', hour: '2-digit', minute: '2-digit'
-        });
-      } else {
-        fechaEl.textContent = 'N/A';
-      }
-
-      intensidadEl.textContent = data.intensidad || 'N/A';
-      duracionEl.textContent = data.duracion_estimada_horas ? `${data.duracion_estimada_horas} horas` : 'N/A';
-
-      statusBox.className = 'flex-1 rounded-md flex flex-col items-center justify-center py-8 px-6'; // Reset clases
-      if (data.resultado === 'Probable') {
-        statusBox.classList.add('bg-red-500');
-      } else if (data.resultado === 'Poco Probable') {
-        statusBox.classList.add('bg-green-500');
-      } else {
-        statusBox.classList.add('bg-yellow-500'); // Neutral para "No Determinada" o si no hay resultado
-      }
+      mostrarPrediccion(data);
     } else {
       console.log("No hay predicción actual disponible o error:", data.mensaje || response.status);
       statusText.textContent = 'Listo para predicción';
@@ -154,4 +159,6 @@ window.onload = async () => {
     intensidadEl.textContent = 'Error';
     duracionEl.textContent = 'Error';
   }
+
+  suscribirPredicciones();
 };
@@ -0,0 +1,8 @@
+# coding: utf-8
+"""Configuración de pytest: las pruebas importan main.py, database/ y src/ desde la raíz del proyecto."""
+import os
+import sys
+
+RAIZ_PROYECTO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAIZ_PROYECTO not in sys.path:
+    sys.path.insert(0, RAIZ_PROYECTO)
@@ -0,0 +1,66 @@
+# coding: utf-8
+"""El almacén de series guarda emisión y horas válidas en UTC, de modo que el corte por emisión es consistente."""
+import datetime
+from zoneinfo import ZoneInfo
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pd = pytest.importorskip("pandas")
+
+from src.almacen_series import AlmacenSeriesHorarias
+
+LIMA = ZoneInfo("America/Lima") # UTC-5, sin horario de verano
+
+
+def _serie(valor):
+    return pd.DataFrame({'time': pd.date_range("2024-06-01 00:00", periods=6, freq="h"), 'temperatura': [valor] * 6})
+
+
+def test_horas_locales_se_guardan_en_utc(tmp_path):
+    almacen = AlmacenSeriesHorarias(str(tmp_path))
+    almacen.anexar("patala", _serie(1.0), datetime.datetime(2024, 5, 31, 12, 40, tzinfo=datetime.timezone.utc), zona_horaria="America/Lima")
+    df = almacen.leer_rango("patala")
+    assert df['time'].iloc[0] == pd.Timestamp("2024-06-01 05:00")
+    assert df['emision'].iloc[0] == pd.Timestamp("2024-05-31 12:00") # Truncada a la hora
+
+
+def test_emitido_hasta_compara_instantes_del_mismo_reloj(tmp_path):
+    almacen = AlmacenSeriesHorarias(str(tmp_path))
+    almacen.anexar("patala", _serie(1.0), datetime.datetime(2024, 5, 31, 10, tzinfo=datetime.timezone.utc), zona_horaria="America/Lima")
+    almacen.anexar("patala", _serie(2.0), datetime.datetime(2024, 5, 31, 12, tzinfo=datetime.timezone.utc), zona_horaria="America/Lima")
+
+    # 06:30 en Lima son las 11:30 UTC: solo la emisión de las 10:00 UTC es anterior.
+    df = almacen.leer_rango("patala", emitido_hasta=datetime.datetime(2024, 5, 31, 6, 30, tzinfo=LIMA))
+    assert set(df['temperatura']) == {1.0}
+    df = almacen.leer_rango("patala", emitido_hasta=datetime.datetime(2024, 5, 31, 12))
+    assert set(df['temperatura']) == {2.0}
+
+
+def test_mes_cerrado_se_compacta_sin_cambiar_las_lecturas(tmp_path):
+    almacen = AlmacenSeriesHorarias(str(tmp_path), dias_gracia_compactacion=7)
+    for hora in range(3):
+        almacen.anexar("patala", _serie(float(hora)), datetime.datetime(2024, 5, 31, 10 + hora))
+    antes = almacen.leer_rango("patala", solo_ultima_emision=False)
+    assert len(list((tmp_path / "patala" / "2024-06").glob("emision_*.npz"))) == 3
+
+    # Una emisión ocho días después del fin de junio cierra el mes: sus tres archivos pasan a uno solo.
+    almacen.anexar("patala", _serie(9.0).assign(time=pd.date_range("2024-07-08", periods=6, freq="h")),
+                   datetime.datetime(2024, 7, 8))
+    assert [p.name for p in (tmp_path / "patala" / "2024-06").iterdir()] == ["compactado.npz"]
+    pd.testing.assert_frame_equal(almacen.leer_rango("patala", hasta=datetime.datetime(2024, 6, 30), solo_ultima_emision=False), antes)
+    df = almacen.leer_rango("patala", hasta=datetime.datetime(2024, 6, 30), emitido_hasta=datetime.datetime(2024, 5, 31, 11))
+    assert set(df['temperatura']) == {1.0}
+
+    # Re-anexar una emisión ya compactada: prevalece la nueva
+    almacen.anexar("patala", _serie(5.0), datetime.datetime(2024, 5, 31, 12))
+    df = almacen.leer_rango("patala", hasta=datetime.datetime(2024, 6, 30))
+    assert len(df) == 6 and set(df['temperatura']) == {5.0}
+
+
+def test_la_clave_es_el_codigo_de_la_estacion(tmp_path):
+    almacen = AlmacenSeriesHorarias(str(tmp_path))
+    with pytest.raises(ValueError):
+        almacen.anexar("Patala Pucará", _serie(1.0), datetime.datetime(2024, 5, 31, 10))
+    almacen.anexar("patala_pucara", _serie(1.0), datetime.datetime(2024, 5, 31, 10))
+    assert almacen.estaciones() == ["patala_pucara"]
@@ -0,0 +1,51 @@
+# coding: utf-8
+"""La deriva se calcula sobre una ventana móvil con muestra mínima, con las estadísticas versionadas del repositorio."""
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pd = pytest.importorskip("pandas")
+
+from src.calidad_datos import LimitesCalidad
+from src.especificacion_features import (COLUMNAS_MODELO, NOMBRE_ESTADISTICAS_JSON, MonitorDeriva, cargar_estadisticas,
+                                         generar_estadisticas_desde_csv)
+
+RAIZ_PROYECTO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUTA_CSV = os.path.join(RAIZ_PROYECTO, "datos", "procesados", "datos_completos.csv")
+
+
+@pytest.fixture
+def estadisticas():
+    estadisticas = cargar_estadisticas(os.path.join(RAIZ_PROYECTO, "modelos_entrenados", NOMBRE_ESTADISTICAS_JSON))
+    assert estadisticas is not None, "modelos_entrenados/estadisticas_features.json debe estar versionado"
+    return estadisticas
+
+
+def test_estadisticas_versionadas_coinciden_con_el_csv(tmp_path, estadisticas):
+    generadas = generar_estadisticas_desde_csv(RUTA_CSV, str(tmp_path / NOMBRE_ESTADISTICAS_JSON))
+    for nombre in COLUMNAS_MODELO:
+        np.testing.assert_allclose(estadisticas[nombre]['bordes'], generadas[nombre]['bordes'], rtol=1e-9)
+        assert estadisticas[nombre]['minimo'] == pytest.approx(generadas[nombre]['minimo'])
+    # Con las estadísticas, el control de calidad usa el rango de entrenamiento y no solo el físico
+    limites = LimitesCalidad.desde_estadisticas(estadisticas)
+    assert (limites.maximo_entrenamiento < limites.maximo_fisico).any()
+
+
+def test_un_lote_pequeno_no_dispara_deriva(estadisticas):
+    monitor = MonitorDeriva(estadisticas, min_muestras=500)
+    lote = pd.DataFrame({c: np.full(48, estadisticas[c]['maximo']) for c in COLUMNAS_MODELO})
+    assert monitor.agregar(lote) == {}
+
+
+def test_ventana_detecta_cambio_de_distribucion(estadisticas):
+    datos = pd.read_csv(RUTA_CSV)[COLUMNAS_MODELO]
+    monitor = MonitorDeriva(estadisticas, tamano_ventana=1000, min_muestras=500)
+    deriva = monitor.agregar(datos)
+    assert max(deriva.values()) < 0.1
+
+    # La ventana se llena con datos desplazados: la temperatura deriva, el resto no cambia.
+    desplazados = datos.copy()
+    desplazados['Temperatura'] += 15
+    deriva = monitor.agregar(desplazados)
+    assert deriva['Temperatura'] > 0.25
@@ -0,0 +1,45 @@
+# coding: utf-8
+"""Límite de conexiones SSE según el tipo de trabajador y reciclado de flujos con trabajadores de hilos."""
+import pytest
+
+pytest.importorskip("flask") # src.difusion serializa con src.cache_respuestas
+pytest.importorskip("sqlalchemy")
+
+from src import difusion
+from src.difusion import DifusorPredicciones, LimiteConexionesAlcanzado
+
+
+def test_limite_con_hilos_es_una_fraccion_de_los_hilos(monkeypatch):
+    monkeypatch.setattr(difusion, "trabajador_asincrono", lambda: False)
+    assert difusion.limite_conexiones(8) == 4
+    assert difusion.limite_conexiones(1) == 0 # Un solo hilo: el canal queda desactivado
+
+
+def test_limite_con_trabajador_asincrono(monkeypatch):
+    monkeypatch.setattr(difusion, "trabajador_asincrono", lambda: True)
+    assert difusion.limite_conexiones(1) == difusion.MAX_CONEXIONES
+
+
+def test_suscripcion_rechazada_al_alcanzar_el_limite():
+    difusor = DifusorPredicciones(max_conexiones=1)
+    flujo = difusor.flujo()
+    with pytest.raises(LimiteConexionesAlcanzado):
+        difusor.flujo()
+    flujo.close() # Al cerrar el cliente se libera el lugar
+    difusor.flujo()
+
+
+def test_flujo_se_cierra_al_cumplir_la_duracion_maxima():
+    difusor = DifusorPredicciones(intervalo_latido=0.01, duracion_maxima=0.05)
+    mensajes = list(difusor.flujo("patala"))
+    assert mensajes[0].startswith("retry:")
+    assert difusor.conexiones == 0
+
+
+def test_cerrar_sin_iniciar_libera_la_conexion():
+    # El servidor puede cerrar la respuesta antes de pedir el primer fragmento (cliente que aborta).
+    difusor = DifusorPredicciones(max_conexiones=1)
+    cola = difusor.suscribir("patala")
+    difusor.flujo("patala", cola).close()
+    assert difusor.conexiones == 0
+    difusor.suscribir("patala")
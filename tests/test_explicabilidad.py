@@ -0,0 +1,65 @@
+# coding: utf-8
+"""El explicador reproduce la probabilidad de árboles, bosques y bosques calibrados, y sigue las ramas de sklearn."""
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("sklearn")
+
+from sklearn.calibration import CalibratedClassifierCV
+from sklearn.ensemble import HistGradientBoostingClassifier, RandomForestClassifier
+from sklearn.tree import DecisionTreeClassifier
+
+from src.explicabilidad import ExplicadorArbol
+
+COLUMNAS = ['a', 'b', 'c']
+
+
+@pytest.fixture(scope="module")
+def datos():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(300, 3))
+    y = (X[:, 0] + 0.5 * X[:, 1] + rng.normal(scale=0.5, size=300) > 0).astype(int)
+    return X, y
+
+
+def _probabilidad_base(modelo, X):
+    """Probabilidad promedio de los estimadores base (antes de calibrar, si el modelo está calibrado)."""
+    if hasattr(modelo, 'calibrated_classifiers_'):
+        return np.mean([c.estimator.predict_proba(X)[:, 1] for c in modelo.calibrated_classifiers_], axis=0)
+    return modelo.predict_proba(X)[:, 1]
+
+
+@pytest.mark.parametrize("modelo", [
+    DecisionTreeClassifier(max_depth=4, random_state=0),
+    RandomForestClassifier(n_estimators=5, max_depth=3, random_state=0),
+    CalibratedClassifierCV(RandomForestClassifier(n_estimators=4, max_depth=3, random_state=0), cv=3),
+], ids=["arbol", "bosque", "bosque_calibrado"])
+def test_contribuciones_suman_la_probabilidad(datos, modelo):
+    X, y = datos
+    modelo.fit(X, y)
+    explicador = ExplicadorArbol(modelo, COLUMNAS)
+    esperadas = _probabilidad_base(modelo, X[:20])
+    for fila, esperada in zip(X[:20], esperadas):
+        explicacion = explicador.explicar(fila)
+        assert explicacion['valor_base'] + sum(explicacion['contribuciones'].values()) == pytest.approx(esperada, abs=1e-3)
+        assert explicacion['calibrado'] == hasattr(modelo, 'calibrated_classifiers_')
+        assert len(explicador.explicacion_compacta(explicacion)['c']) == len(COLUMNAS)
+
+
+def test_camino_compara_en_float32_como_sklearn(datos):
+    X, y = datos
+    modelo = DecisionTreeClassifier(max_depth=1, random_state=0).fit(X, y)
+    variable, umbral = modelo.tree_.feature[0], modelo.tree_.threshold[0]
+    # Mayor que el umbral en float64, pero igual a él (o menor) una vez redondeado a float32
+    fila = np.zeros(3)
+    fila[variable] = np.nextafter(umbral, np.inf)
+    if np.float32(fila[variable]) > umbral:
+        pytest.skip("El umbral de este árbol no deja un valor intermedio entre float32 y float64")
+    explicador = ExplicadorArbol(modelo, COLUMNAS)
+    assert explicador.camino(fila)[-1] == modelo.apply(fila.reshape(1, -1))[0]
+
+
+def test_modelo_sin_arboles_no_se_explica(datos):
+    X, y = datos
+    with pytest.raises(TypeError):
+        ExplicadorArbol(HistGradientBoostingClassifier(max_iter=5).fit(X, y), COLUMNAS)
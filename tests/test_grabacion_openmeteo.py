@@ -0,0 +1,47 @@
+# coding: utf-8
+"""La reproducción nunca sirve una grabación posterior al reloj."""
+import datetime
+import gzip
+import json
+
+import pytest
+
+requests = pytest.importorskip("requests")
+
+from src.grabacion_openmeteo import (EXTENSION_GRABACION, FORMATO_INSTANTE, AdaptadorReproduccion, GrabacionNoEncontrada,
+                                     clave_peticion)
+from src.reloj import RelojFijo
+
+URL = "https://api.open-meteo.com/v1/forecast?latitude=-12.2&longitude=-75.1"
+
+
+def _grabar(directorio, instante, cuerpo):
+    ruta = directorio / f"{instante.strftime(FORMATO_INSTANTE)}_{clave_peticion('GET', URL)}{EXTENSION_GRABACION}"
+    with gzip.open(ruta, 'wt', encoding='utf-8') as f:
+        json.dump({"estado": 200, "tipo_contenido": "application/json", "cuerpo": json.dumps(cuerpo)}, f)
+
+
+@pytest.fixture
+def sesion_y_reloj(tmp_path):
+    _grabar(tmp_path, datetime.datetime(2024, 6, 1, 10), {"version": 1})
+    _grabar(tmp_path, datetime.datetime(2024, 6, 1, 12), {"version": 2})
+    reloj = RelojFijo(datetime.datetime(2024, 6, 1, 11))
+    sesion = requests.Session()
+    adaptador = AdaptadorReproduccion(str(tmp_path), reloj)
+    sesion.mount("https://", adaptador)
+    return sesion, reloj, adaptador
+
+
+def test_elige_la_mas_reciente_anterior_al_reloj(sesion_y_reloj):
+    sesion, reloj, _ = sesion_y_reloj
+    assert sesion.get(URL).json() == {"version": 1}
+    reloj.ajustar(datetime.datetime(2024, 6, 1, 12))
+    assert sesion.get(URL).json() == {"version": 2}
+
+
+def test_solo_grabaciones_futuras_es_un_fallo(sesion_y_reloj):
+    sesion, reloj, adaptador = sesion_y_reloj
+    reloj.ajustar(datetime.datetime(2024, 6, 1, 9))
+    with pytest.raises(GrabacionNoEncontrada):
+        sesion.get(URL)
+    assert adaptador.fallos == 1 and adaptador.aciertos == 0
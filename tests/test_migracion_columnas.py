@@ -0,0 +1,112 @@
+# coding: utf-8
+"""Una base creada con el esquema original de 'predicciones' debe seguir funcionando tras init_db()."""
+import datetime
+import sqlite3
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+import database.database as base_datos
+from database.database import COLUMNAS_AGREGADAS, get_db, init_db, setup_database_engine
+
+# Esquema de 'predicciones' tal como lo creaba la primera versión de la aplicación
+ESQUEMA_ORIGINAL = """
+CREATE TABLE predicciones (
+    id INTEGER NOT NULL PRIMARY KEY,
+    fecha_registro DATETIME NOT NULL,
+    fecha_prediccion_para DATETIME NOT NULL,
+    ubicacion VARCHAR,
+    estacion_meteorologica VARCHAR,
+    temperatura_minima_prevista FLOAT,
+    probabilidad_helada FLOAT,
+    resultado VARCHAR(14),
+    intensidad VARCHAR(9),
+    duracion_estimada_horas FLOAT,
+    parametros_entrada VARCHAR,
+    fuente_datos_entrada VARCHAR
+)
+"""
+
+
+@pytest.fixture
+def base_original(tmp_path):
+    ruta = tmp_path / "original.db"
+    conexion = sqlite3.connect(ruta)
+    conexion.execute(ESQUEMA_ORIGINAL)
+    conexion.execute(
+        "INSERT INTO predicciones (fecha_registro, fecha_prediccion_para, ubicacion, resultado, intensidad) "
+        "VALUES ('2024-06-01 10:00:00', '2024-06-02 04:00:00', 'Patala', 'probable', 'leve')")
+    conexion.commit()
+    conexion.close()
+    setup_database_engine(f"sqlite:///{ruta}")
+    yield ruta
+    base_datos.engine.dispose()
+
+
+def _columnas(ruta):
+    conexion = sqlite3.connect(ruta)
+    try:
+        return {fila[1] for fila in conexion.execute("PRAGMA table_info(predicciones)")}
+    finally:
+        conexion.close()
+
+
+def test_init_db_agrega_columnas_nuevas(base_original):
+    init_db()
+    assert set(COLUMNAS_AGREGADAS['predicciones']) <= _columnas(base_original)
+    init_db() # Idempotente: la segunda vez no intenta agregarlas de nuevo
+
+
+def test_orm_lee_y_escribe_sobre_base_original(base_original):
+    from database.models import Prediccion
+
+    init_db()
+    db_session = next(get_db())
+    try:
+        assert db_session.query(Prediccion).count() == 1
+        db_session.add(Prediccion(fecha_prediccion_para=datetime.datetime(2024, 6, 3, 4), ubicacion="Patala"))
+        db_session.commit()
+        assert db_session.query(Prediccion).order_by(Prediccion.id.desc()).first().explicacion is None
+    finally:
+        db_session.close()
+
+
+# 'estaciones' tal como la creaba la primera versión del registro (sin índice único en el nombre)
+ESQUEMA_ESTACIONES_SIN_INDICE = """
+CREATE TABLE estaciones (
+    id INTEGER NOT NULL PRIMARY KEY,
+    codigo VARCHAR NOT NULL UNIQUE,
+    nombre VARCHAR NOT NULL,
+    latitud FLOAT NOT NULL,
+    longitud FLOAT NOT NULL,
+    altitud_m FLOAT,
+    zona_horaria VARCHAR NOT NULL,
+    version_modelo VARCHAR NOT NULL,
+    activa BOOLEAN NOT NULL,
+    fecha_creacion DATETIME NOT NULL
+)
+"""
+
+
+def test_init_db_agrega_indice_unico_de_nombre_de_estacion(base_original):
+    from sqlalchemy.exc import IntegrityError
+    from database.models import Estacion
+
+    conexion = sqlite3.connect(base_original)
+    conexion.execute(ESQUEMA_ESTACIONES_SIN_INDICE)
+    conexion.commit()
+    conexion.close()
+
+    init_db()
+    init_db() # Idempotente
+    db_session = next(get_db())
+    try:
+        for codigo in ('patala', 'patala_2'):
+            db_session.add(Estacion(codigo=codigo, nombre="Patala", latitud=-12.2, longitud=-75.1,
+                                    zona_horaria="America/Lima", version_modelo="modelo_arbol_decision",
+                                    activa=True, fecha_creacion=datetime.datetime(2024, 6, 1)))
+        with pytest.raises(IntegrityError):
+            db_session.commit()
+    finally:
+        db_session.close()
@@ -0,0 +1,56 @@
+# coding: utf-8
+"""El predictor compilado debe reproducir predict_proba de los tres tipos de modelo entrenables."""
+import importlib
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pd = pytest.importorskip("pandas")
+pytest.importorskip("sklearn")
+
+
+@pytest.fixture(scope="module")
+def entrenamiento(tmp_path_factory):
+    # entrenamiento_modelo crea sus carpetas relativas ("../") al importarse: se aísla en un directorio temporal.
+    directorio = tmp_path_factory.mktemp("proyecto") / "src"
+    directorio.mkdir()
+    with pytest.MonkeyPatch.context() as parche:
+        parche.chdir(directorio)
+        yield importlib.import_module("src.entrenamiento_modelo")
+
+
+def _datos_sinteticos(n_filas=600, semilla=1):
+    from src.especificacion_features import COLUMNAS_MODELO
+    from src.predictor_compilado import generar_filas_sinteticas
+
+    X = pd.DataFrame(generar_filas_sinteticas(n_filas, semilla=semilla), columns=COLUMNAS_MODELO)
+    ruido = np.random.default_rng(semilla).normal(0, 2, n_filas)
+    y = ((X['Temperatura'] + ruido < 0) & (X['HumedadRelativa'] > 30)).astype(int)
+    return X, y
+
+
+@pytest.mark.parametrize("tipo", ["arbol", "bosque", "gradiente"])
+def test_compilado_coincide_con_sklearn(entrenamiento, tipo):
+    from src.predictor_compilado import PredictorCompilado, compilar_predictor, generar_filas_sinteticas
+
+    X, y = _datos_sinteticos()
+    modelo = entrenamiento.crear_modelo(tipo, n_jobs=1).fit(X, y)
+    predictor = compilar_predictor(modelo)
+
+    assert isinstance(predictor, PredictorCompilado)
+    X_prueba = pd.DataFrame(generar_filas_sinteticas(300, semilla=7), columns=X.columns)
+    np.testing.assert_allclose(predictor.predict_proba(X_prueba), modelo.predict_proba(X_prueba), atol=1e-6)
+    np.testing.assert_array_equal(predictor.predict(X_prueba), modelo.predict(X_prueba))
+
+
+def test_fallo_del_compilado_vuelve_a_sklearn(entrenamiento, monkeypatch):
+    from src import predictor_compilado
+
+    X, y = _datos_sinteticos()
+    modelo = entrenamiento.crear_modelo("arbol").fit(X, y)
+
+    def _falla(self, X):
+        raise IndexError("nodo fuera de rango")
+
+    monkeypatch.setattr(predictor_compilado.PredictorCompilado, "predict_proba", _falla)
+    assert predictor_compilado.compilar_predictor(modelo) is None
@@ -0,0 +1,67 @@
+# coding: utf-8
+"""Cada versión de modelo aplica sus propios límites de calidad y su propio monitor de deriva."""
+import datetime
+from types import SimpleNamespace
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pd = pytest.importorskip("pandas")
+pytest.importorskip("requests")
+
+from src import pronostico_estaciones
+from src.calidad_datos import FUERA_DE_ENTRENAMIENTO, LimitesCalidad
+from src.data_fetcher import COLUMNAS_A_SOLICITAR_API
+
+VALORES_OPENMETEO = {'Temperatura': 5.0, 'HumedadRelativa': 80.0, 'PresionAtmosferica': 1010.0,
+                     'HumedadSuelo': 0.30, 'PrecipitacionMM': 0.0}
+
+
+class ModeloConstante:
+    classes_ = np.array([0, 1])
+
+    def predict_proba(self, X):
+        return np.tile([0.9, 0.1], (len(X), 1))
+
+
+class MonitorRegistro:
+    def __init__(self):
+        self.filas = 0
+
+    def agregar(self, df):
+        self.filas += len(df)
+        return {}
+
+
+def _estacion(codigo, version):
+    return SimpleNamespace(codigo=codigo, nombre=codigo, latitud=-12.2, longitud=-75.1, altitud_m=None,
+                           zona_horaria="America/Lima", version_modelo=version)
+
+
+@pytest.fixture(autouse=True)
+def cubo_falso(monkeypatch):
+    def descargar(latitudes, longitudes, dias_prediccion, elevaciones=None, zona_horaria="auto"):
+        tiempos = pd.date_range("2024-06-01 00:00", periods=72, freq="h")
+        fila = [VALORES_OPENMETEO.get(c, 0.0) for c in COLUMNAS_A_SOLICITAR_API]
+        return tiempos, np.tile(np.array(fila, dtype=np.float32), (len(tiempos), len(latitudes), 1))
+
+    monkeypatch.setattr(pronostico_estaciones, "obtener_cubo_meteorologico_openmeteo", descargar)
+
+
+def test_limites_y_deriva_por_version():
+    # La versión 'frio' se entrenó solo con temperaturas bajo cero: 5 °C queda fuera de su rango de entrenamiento.
+    servicios = {
+        'frio': SimpleNamespace(limites_calidad=LimitesCalidad.desde_estadisticas({'Temperatura': {'minimo': -10.0, 'maximo': -1.0}}),
+                                monitor_deriva=MonitorRegistro()),
+        'valle': SimpleNamespace(limites_calidad=LimitesCalidad.desde_estadisticas(), monitor_deriva=MonitorRegistro()),
+    }
+    estaciones = [_estacion('alta', 'frio'), _estacion('baja_1', 'valle'), _estacion('baja_2', 'valle')]
+    resultados = pronostico_estaciones.pronosticar_estaciones(
+        estaciones, lambda version: ModeloConstante(), ahora=datetime.datetime(2024, 6, 1, 15, tzinfo=datetime.timezone.utc),
+        obtener_servicio=servicios.get)
+
+    calidad = {r.estacion.codigo: r.calidad for r in resultados}
+    assert calidad['alta'] & FUERA_DE_ENTRENAMIENTO
+    assert not calidad['baja_1'] & FUERA_DE_ENTRENAMIENTO
+    assert servicios['frio'].monitor_deriva.filas == 72
+    assert servicios['valle'].monitor_deriva.filas == 72 * 2
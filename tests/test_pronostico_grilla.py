@@ -0,0 +1,67 @@
+# coding: utf-8
+"""La madrugada de la grilla se elige en la zona horaria de los datos, con el reloj que se le pasa."""
+import datetime
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pd = pytest.importorskip("pandas")
+pytest.importorskip("requests")
+
+from src import pronostico_grilla
+from src.data_fetcher import COLUMNAS_A_SOLICITAR_API
+
+
+class ModeloConstante:
+    classes_ = np.array([0, 1])
+
+    def predict_proba(self, X):
+        return np.tile([0.2, 0.8], (len(X), 1))
+
+
+@pytest.fixture
+def zonas_pedidas(monkeypatch):
+    pedidas = []
+
+    def cubo_falso(latitudes, longitudes, dias_prediccion, zona_horaria="auto"):
+        pedidas.append(zona_horaria)
+        tiempos = pd.date_range("2024-06-01 00:00", periods=24 * 3, freq="h")
+        return tiempos, np.full((len(tiempos), len(latitudes), len(COLUMNAS_A_SOLICITAR_API)), np.nan, dtype=np.float32)
+
+    monkeypatch.setattr(pronostico_grilla, "obtener_cubo_meteorologico_openmeteo", cubo_falso)
+    return pedidas
+
+
+def test_madrugada_en_hora_local_de_la_zona(zonas_pedidas):
+    # 23:30 del 1 de junio en Lima es ya el 2 de junio en UTC: la madrugada siguiente es la del 2, no la del 3.
+    ahora = datetime.datetime(2024, 6, 2, 4, 30, tzinfo=datetime.timezone.utc)
+    raster = pronostico_grilla.calcular_raster_riesgo(ModeloConstante(), -13.0, -12.9, -75.1, -75.0, 0.05,
+                                                      ahora=ahora, zona_horaria="America/Lima")
+    assert raster['madrugada_inicio'] == datetime.datetime(2024, 6, 2, pronostico_grilla.HORA_INICIO_MADRUGADA)
+    assert zonas_pedidas and set(zonas_pedidas) == {"America/Lima"}
+
+
+def test_zona_desconocida_falla_sin_descargar(zonas_pedidas):
+    with pytest.raises(KeyError):
+        pronostico_grilla.calcular_raster_riesgo(ModeloConstante(), -13.0, -12.9, -75.1, -75.0, 0.05, zona_horaria="Marte/Olympus")
+    assert zonas_pedidas == []
+
+
+def test_limpiar_directorio_por_antiguedad_y_tamano(tmp_path):
+    ahora = datetime.datetime.now().timestamp()
+    for i, antiguedad in enumerate([10 * 3600, 3 * 3600, 60, 30, 0]):
+        ruta = tmp_path / f"bloque_{i}.npz"
+        ruta.write_bytes(b"x" * 100)
+        os.utime(ruta, (ahora - antiguedad, ahora - antiguedad))
+    (tmp_path / "otro.txt").write_text("no se toca")
+
+    assert pronostico_grilla.limpiar_directorio(tmp_path, 2 * 3600, 250) == 3 # 2 vencidos y el más antiguo que excede el tamaño
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["bloque_3.npz", "bloque_4.npz", "otro.txt"]
+
+
+def test_zoom_de_tesela_acotado():
+    lat_min, lat_max, _, _ = pronostico_grilla.recuadro_tesela(pronostico_grilla.ZOOM_MAXIMO_TESELA, 0, 0)
+    assert lat_min < lat_max
+    with pytest.raises(ValueError):
+        pronostico_grilla.recuadro_tesela(pronostico_grilla.ZOOM_MAXIMO_TESELA + 1, 0, 0)
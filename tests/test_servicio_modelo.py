@@ -0,0 +1,47 @@
+# coding: utf-8
+"""Cada versión del modelo carga sus propias estadísticas de entrenamiento; sin ellas usa las compartidas."""
+import logging
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pd = pytest.importorskip("pandas")
+joblib = pytest.importorskip("joblib")
+pytest.importorskip("sklearn")
+
+from sklearn.tree import DecisionTreeClassifier
+
+from src.especificacion_features import (COLUMNAS_MODELO, NOMBRE_ESTADISTICAS_JSON, calcular_estadisticas_entrenamiento,
+                                         guardar_estadisticas, ruta_estadisticas_version)
+from src.servicio_modelo import ServicioModelo
+
+
+def _datos(desplazamiento, n=200):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({c: rng.normal(10 + desplazamiento, 2, n) for c in COLUMNAS_MODELO})
+
+
+@pytest.fixture
+def ruta_modelos(tmp_path):
+    X = _datos(0)
+    modelo = DecisionTreeClassifier(max_depth=2, random_state=0).fit(X, (X[COLUMNAS_MODELO[0]] > 10).astype(int))
+    for nombre in ("v1.pkl", "v2.pkl"):
+        joblib.dump(modelo, tmp_path / nombre)
+    guardar_estadisticas(calcular_estadisticas_entrenamiento(X), str(tmp_path / NOMBRE_ESTADISTICAS_JSON))
+    guardar_estadisticas(calcular_estadisticas_entrenamiento(_datos(30)), ruta_estadisticas_version(str(tmp_path), "v1.pkl"))
+    return str(tmp_path)
+
+
+def test_cada_version_usa_sus_estadisticas(ruta_modelos, caplog):
+    v1, v2 = ServicioModelo(ruta_modelos, "v1.pkl"), ServicioModelo(ruta_modelos, "v2.pkl")
+    with caplog.at_level(logging.WARNING, logger="src.servicio_modelo"):
+        assert v1.obtener(timeout=30) is not None
+        assert v2.obtener(timeout=30) is not None
+
+    columna = COLUMNAS_MODELO[0]
+    assert v1.estadisticas[columna]['minimo'] > v2.estadisticas[columna]['maximo']
+    assert v1.limites_calidad.minimo_entrenamiento[0] > v2.limites_calidad.maximo_entrenamiento[0]
+    assert v1.monitor_deriva is not v2.monitor_deriva
+
+    avisos = [r.getMessage() for r in caplog.records if NOMBRE_ESTADISTICAS_JSON in r.getMessage()]
+    assert len(avisos) == 1 and "v2.pkl" in avisos[0]